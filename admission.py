@@ -0,0 +1,197 @@
+# --- admission.py: load-aware admission control and graceful degradation for the web servers ---
+#
+# Every request is admitted against the current load (requests in flight,
+# video jobs queued/running, recent stage latencies) and configurable SLOs.
+# Under pressure the reply degrades step by step instead of everyone waiting
+# longer: video is deferred, then skipped; replies get shorter; and past the
+# hard limit new requests are turned away at once with a 503.
+
+import os
+import threading
+import metrics
+
+# --- SLO Configuration ---
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+# p95 of a whole request (LLM + TTS) over the recent window, in seconds
+SLO_REQUEST_P95 = float(os.getenv("SLO_REQUEST_P95", "4.0"))
+# How long a new video may be expected to take (queue wait + render) before it is deferred
+SLO_VIDEO_SECONDS = float(os.getenv("SLO_VIDEO_SECONDS", "60"))
+# Deferred video is skipped outright once the estimate passes this multiple of the SLO
+# (and a deferred job that has waited this long is dropped)
+VIDEO_SKIP_FACTOR = 2.0
+# Hard cap on concurrent requests; past it, requests are shed
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "32"))
+# Requests are also shed while p95 is over this multiple of the SLO and the server is busy
+SHED_FACTOR = 2.0
+# max_new_tokens for replies while the request SLO is being missed
+SHORT_MAX_NEW_TOKENS = int(os.getenv("SHORT_MAX_NEW_TOKENS", "60"))
+# Assumed SadTalker run time until one has been observed
+DEFAULT_VIDEO_SECONDS = 20.0
+# Suggested client back-off for shed requests
+SHED_RETRY_AFTER = 2
+
+BUSY_RESPONSE = "I'm sorry, I need a brief moment. Could you say that again in a few seconds?"
+
+# Decision levels and video modes
+NORMAL = "normal"
+DEGRADED = "degraded"
+SHED = "shed"
+VIDEO_NOW = "now"
+VIDEO_DEFERRED = "deferred"
+VIDEO_SKIPPED = "skipped"
+
+class Decision:
+    """What one request is allowed to do, and why."""
+    def __init__(self, level, video, max_new_tokens, reasons):
+        self.level = level
+        self.video = video
+        self.max_new_tokens = max_new_tokens
+        self.reasons = reasons
+
+    @property
+    def shed(self):
+        return self.level == SHED
+
+    def to_dict(self):
+        return {
+            'level': self.level,
+            'video': self.video,
+            'max_new_tokens': self.max_new_tokens,
+            'reasons': self.reasons,
+        }
+
+def deferred_video_max_age(slo_video_seconds=SLO_VIDEO_SECONDS):
+    """How long the video queue should keep a deferred job before dropping it."""
+    return slo_video_seconds * VIDEO_SKIP_FACTOR
+
+class AdmissionController:
+    """
+    Tracks requests in flight and decides, per request, between full service,
+    degraded service and shedding. `video_stats()` is the video queue's stats()
+    ('queued', 'running', 'workers'); latencies come from metrics.recent.
+
+    admit() is called when a request arrives; admit_video() once its audio is
+    ready, so a burst of requests sees the video jobs queued ahead of it.
+    """
+    def __init__(self, video_stats, max_new_tokens, enabled=ADMISSION_CONTROL,
+                 slo_request_p95=SLO_REQUEST_P95, slo_video_seconds=SLO_VIDEO_SECONDS,
+                 max_in_flight=MAX_IN_FLIGHT):
+        self.video_stats = video_stats
+        self.max_new_tokens = max_new_tokens
+        self.enabled = enabled
+        self.slo_request_p95 = slo_request_p95
+        self.slo_video_seconds = slo_video_seconds
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.decisions = {NORMAL: 0, DEGRADED: 0, SHED: 0}
+        self.video_decisions = {VIDEO_NOW: 0, VIDEO_DEFERRED: 0, VIDEO_SKIPPED: 0}
+        self.shortened = 0
+        self.last = None
+        self.lock = threading.Lock()
+
+    def signals(self):
+        """The load figures the policy looks at."""
+        video = self.video_stats()
+        video_seconds = metrics.recent.percentile("video", 50) or DEFAULT_VIDEO_SECONDS
+        workers = max(1, video['workers'])
+        # Jobs ahead of a new one, then whole rounds of `workers` parallel runs
+        ahead = video['queued'] + video['running']
+        wait = (ahead // workers) * video_seconds if ahead >= workers else 0.0
+        return {
+            'in_flight': self.in_flight,
+            'video_queued': video['queued'],
+            'video_running': video['running'],
+            'video_deferred': video.get('deferred', 0),
+            'request_p95': metrics.recent.percentile("request", 95),
+            'video_p50': round(video_seconds, 2),
+            'expected_video_seconds': round(wait + video_seconds, 1),
+        }
+
+    def decide(self, signals):
+        """The policy: a Decision for a new request given `signals`."""
+        reasons = []
+        request_p95 = signals['request_p95']
+        if signals['in_flight'] >= self.max_in_flight:
+            reasons.append(f"{signals['in_flight']} requests in flight (max {self.max_in_flight})")
+            return Decision(SHED, VIDEO_SKIPPED, 0, reasons)
+        if (request_p95 is not None and request_p95 > self.slo_request_p95 * SHED_FACTOR
+                and signals['in_flight'] >= self.max_in_flight // 2):
+            reasons.append(f"request p95 {request_p95:.1f}s is over {SHED_FACTOR:g}x the "
+                           f"{self.slo_request_p95:g}s SLO with {signals['in_flight']} in flight")
+            return Decision(SHED, VIDEO_SKIPPED, 0, reasons)
+
+        max_new_tokens = self.max_new_tokens
+        if request_p95 is not None and request_p95 > self.slo_request_p95:
+            max_new_tokens = min(max_new_tokens, SHORT_MAX_NEW_TOKENS)
+            reasons.append(f"request p95 {request_p95:.1f}s > {self.slo_request_p95:g}s SLO: shorter reply")
+
+        video, reason = self.decide_video(signals)
+        if reason:
+            reasons.append(reason)
+        level = DEGRADED if reasons else NORMAL
+        return Decision(level, video, max_new_tokens, reasons)
+
+    def decide_video(self, signals):
+        """(video mode, reason or None) for a new video job given `signals`."""
+        expected = signals['expected_video_seconds']
+        if expected > self.slo_video_seconds * VIDEO_SKIP_FACTOR:
+            return VIDEO_SKIPPED, f"video expected in {expected:.0f}s: skipped"
+        if expected > self.slo_video_seconds:
+            return VIDEO_DEFERRED, f"video expected in {expected:.0f}s > {self.slo_video_seconds:g}s SLO: deferred"
+        return VIDEO_NOW, None
+
+    def admit(self):
+        """Decide for a new request; unless it is shed, the caller must release() when done."""
+        with self.lock:
+            if not self.enabled:
+                decision = Decision(NORMAL, VIDEO_NOW, self.max_new_tokens, [])
+            else:
+                decision = self.decide(self.signals())
+            self.decisions[decision.level] += 1
+            if not decision.shed:
+                self.in_flight += 1
+                if decision.max_new_tokens < self.max_new_tokens:
+                    self.shortened += 1
+            self.last = decision
+        if decision.reasons:
+            print(f"   -> 🚦 Admission: {decision.level} ({'; '.join(decision.reasons)})")
+        return decision
+
+    def admit_video(self, decision):
+        """Settle `decision.video` against the queue as it is now; returns the video mode."""
+        with self.lock:
+            if self.enabled:
+                video, reason = self.decide_video(self.signals())
+                # The guess made at admit() is replaced by this one
+                decision.reasons = [r for r in decision.reasons if not r.startswith("video ")]
+                if reason:
+                    decision.reasons.append(reason)
+                if decision.level == NORMAL and reason:
+                    self.decisions[NORMAL] -= 1
+                    self.decisions[DEGRADED] += 1
+                    decision.level = DEGRADED
+                decision.video = video
+            self.video_decisions[decision.video] += 1
+        if decision.video != VIDEO_NOW:
+            print(f"   -> 🚦 Admission: video {decision.video} ({decision.reasons[-1]})")
+        return decision.video
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'slo': {
+                    'request_p95': self.slo_request_p95,
+                    'video_seconds': self.slo_video_seconds,
+                    'max_in_flight': self.max_in_flight,
+                },
+                'signals': self.signals(),
+                'decisions': dict(self.decisions),
+                'video': dict(self.video_decisions),
+                'shortened_replies': self.shortened,
+                'last': self.last.to_dict() if self.last else None,
+            }
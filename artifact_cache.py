@@ -0,0 +1,327 @@
+# --- artifact_cache.py: content-addressed, size-bounded LRU cache for generated media ---
+
+import os
+import json
+import glob
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-flight is per process only
+    fcntl = None
+
+INDEX_FILENAME = "index.json"
+LOCK_DIRNAME = ".locks"
+# Coordinate renders across worker processes sharing a cache directory
+ARTIFACT_LOCK_FILES = os.getenv("ARTIFACT_LOCK_FILES", "0") == "1"
+# Temp files older than this are leftovers from a crashed render
+STALE_TEMP_SECONDS = 3600
+
+def digest(*parts):
+    """Stable digest of JSON-serializable parts (unlike hash(), the same in every process)."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Digest of a file's bytes."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()[:32]
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution of `fn` (threads)."""
+    def __init__(self):
+        self.calls = {}  # key -> [done event, result, error]
+        self.shared = 0
+        self.lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = [threading.Event(), None, None]
+            else:
+                self.shared += 1
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+        try:
+            call[1] = fn()
+            return call[1]
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call[0].set()
+
+class AsyncSingleFlight:
+    """asyncio flavour of SingleFlight: waiters await the leader's future."""
+    def __init__(self):
+        self.calls = {}
+        self.shared = 0
+
+    async def do(self, key, coro_fn):
+        future = self.calls.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+        future = self.calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved in case nobody else was waiting
+            raise
+        finally:
+            del self.calls[key]
+
+class FileLock:
+    """Exclusive flock on a lock file; a no-op without a path or where fcntl is unavailable."""
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def acquire(self):
+        if fcntl is None or self.path is None:
+            return
+        self.file = open(self.path, "a")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def release(self):
+        if self.file:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class ArtifactCache:
+    """
+    Keeps generated files in one directory, named by their content key, and evicts
+    the least recently used ones once the total size goes over `max_bytes`.
+
+    The index lives in memory and is mirrored to `index.json`. File mtimes are
+    bumped on every hit, so several worker processes sharing the directory agree
+    on recency after a reload.
+
+    create() renders a missing artifact once however many callers want it at
+    the same time (and, with `lock_files`, across processes), publishing it
+    with a rename so a partially written file is never visible.
+    """
+    def __init__(self, directory, extension, max_bytes, lock_files=ARTIFACT_LOCK_FILES):
+        self.directory = directory
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.lock_files = lock_files
+        self.flights = SingleFlight()
+        self.async_flights = AsyncSingleFlight()
+        self.entries = OrderedDict()  # key -> {"size": int, "last_used": float}, oldest first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def filename_for(self, key):
+        return f"{key}{self.extension}"
+
+    def path_for(self, key):
+        return os.path.join(self.directory, self.filename_for(key))
+
+    def temp_path_for(self, key):
+        """Private path a render writes to before it is published (never matches the cache glob)."""
+        return f"{self.path_for(key)}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+    def create(self, key, render):
+        """
+        Render the artifact for `key` unless another caller already is, in which
+        case wait for theirs. `render(tmp_path)` writes the file and returns True
+        on success. Returns the published path, or None if rendering failed.
+        """
+        return self.flights.do(key, lambda: self._create(key, render))
+
+    async def create_async(self, key, render):
+        """create() for a coroutine `render(tmp_path)`."""
+        return await self.async_flights.do(key, lambda: self._create_async(key, render))
+
+    def _create(self, key, render):
+        file_lock = self._file_lock(key)
+        with file_lock:
+            path = self._published(key)
+            if path:
+                return path
+            tmp_path = self.temp_path_for(key)
+            try:
+                return self._publish(key, tmp_path) if render(tmp_path) else None
+            finally:
+                self._discard(tmp_path)
+
+    async def _create_async(self, key, render):
+        file_lock = self._file_lock(key)
+        await asyncio.to_thread(file_lock.acquire)
+        try:
+            path = self._published(key)
+            if path:
+                return path
+            tmp_path = self.temp_path_for(key)
+            try:
+                return self._publish(key, tmp_path) if await render(tmp_path) else None
+            finally:
+                self._discard(tmp_path)
+        finally:
+            file_lock.release()
+
+    def _file_lock(self, key):
+        if not self.lock_files:
+            return FileLock(None)
+        lock_dir = os.path.join(self.directory, LOCK_DIRNAME)
+        os.makedirs(lock_dir, exist_ok=True)
+        return FileLock(os.path.join(lock_dir, f"{key}.lock"))
+
+    def _published(self, key):
+        """Path for `key` if another process published it while we waited for the lock."""
+        path = self.path_for(key)
+        if os.path.exists(path) and self.store(key):
+            return path
+        return None
+
+    def _publish(self, key, tmp_path):
+        if not (os.path.exists(tmp_path) and os.path.getsize(tmp_path) > 0):
+            return None
+        os.replace(tmp_path, self.path_for(key))
+        self.store(key)
+        return self.path_for(key)
+
+    @staticmethod
+    def _discard(tmp_path):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    def lookup(self, key):
+        """Return the cached file path for `key`, or None on a miss."""
+        path = self.path_for(key)
+        with self.lock:
+            if key not in self.entries and os.path.exists(path):
+                # Written by another worker process since we loaded the index
+                self._add(key, os.path.getsize(path), time.time())
+            if key in self.entries and os.path.exists(path):
+                self.hits += 1
+                self.entries[key]["last_used"] = time.time()
+                self.entries.move_to_end(key)
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                return path
+            if key in self.entries:
+                self._remove(key)  # deleted behind our back
+            self.misses += 1
+            return None
+
+    def store(self, key):
+        """Record a file that was just written to path_for(key), then evict if over budget."""
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return False
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self._add(key, os.path.getsize(path), time.time())
+            self._evict()
+            self._save_index()
+        return True
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'total_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'coalesced': self.flights.shared + self.async_flights.shared,
+            }
+
+    def _add(self, key, size, last_used):
+        self.entries[key] = {"size": size, "last_used": last_used}
+        self.entries.move_to_end(key)
+        self.total_bytes += size
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry["size"]
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key = next(iter(self.entries))
+            self._remove(key)
+            self.evictions += 1
+            # The (empty) lock file stays: another process may hold or wait on it, and
+            # unlinking it would let a newcomer lock a fresh file and render in parallel
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+    def _load_index(self):
+        """Rebuild the index from index.json, reconciled with what is actually on disk."""
+        saved = {}
+        try:
+            with open(os.path.join(self.directory, INDEX_FILENAME)) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        found = []
+        for path in glob.glob(os.path.join(self.directory, f"*{self.extension}")):
+            key = os.path.basename(path)[:-len(self.extension)]
+            try:
+                last_used = max(saved.get(key, {}).get("last_used", 0), os.path.getmtime(path))
+                found.append((last_used, key, os.path.getsize(path)))
+            except OSError:
+                continue
+        for last_used, key, size in sorted(found):
+            self._add(key, size, last_used)
+        self._evict()
+
+        for tmp_path in glob.glob(os.path.join(self.directory, f"*{self.extension}.*.tmp")):
+            try:
+                if time.time() - os.path.getmtime(tmp_path) > STALE_TEMP_SECONDS:
+                    os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _save_index(self):
+        index_path = os.path.join(self.directory, INDEX_FILENAME)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print(f"   -> ⚠️  Could not save cache index: {e}")
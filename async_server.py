@@ -0,0 +1,450 @@
+# --- async_server.py: asyncio serving mode for the web app ---
+#
+# Serves the same routes as module2_brain (/, /generate, /generate_stream,
+# /jobs/<id>, /videos/<name>, /status) on aiohttp. Every provider call is
+# awaited instead of holding a thread, and concurrency is bounded by one
+# semaphore per provider, so a process can keep hundreds of conversations open.
+
+import os
+import json
+import time
+import asyncio
+from aiohttp import web
+from dotenv import load_dotenv
+
+import module2_brain as brain   # shared prompt, caches, sessions and phrase bank
+import module3_voice
+import module4_face
+import video_jobs
+import metrics
+import growing_files
+import health
+import admission
+import resilience
+
+load_dotenv()
+
+# --- Provider Concurrency Configuration ---
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "32"))
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "16"))
+VIDEO_CONCURRENCY = int(os.getenv("VIDEO_CONCURRENCY", str(brain.VIDEO_WORKERS)))
+
+# Semaphores per provider, created on startup inside the serving loop
+limits = {}
+
+async def create_limits(app):
+    limits['llm'] = asyncio.Semaphore(LLM_CONCURRENCY)
+    limits['tts'] = asyncio.Semaphore(TTS_CONCURRENCY)
+
+async def warm_up(app):
+    """
+    Serve right away: provider checks (cached), the TTS SDK import, the
+    avatar upload and the phrase bank run in the background, before the
+    first request needs them
+    """
+    jobs = [health.checks.check, module3_voice.elevenlabs_async_client, brain.warm_up_phrase_bank]
+    if os.path.exists(brain.AVATAR_IMAGE_PATH):
+        jobs.append(module4_face.avatar_for(brain.AVATAR_IMAGE_PATH).input_value)
+    for job in jobs:
+        task = asyncio.create_task(asyncio.to_thread(job))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+# Same /static URLs as the Flask app, built by hand (no url_for outside Flask)
+STATIC_URL_PATH = brain.app.static_url_path
+
+def static_url(filename):
+    return f"{STATIC_URL_PATH}/{filename}"
+
+async def start_progressive_audio(cache_key, text):
+    """Synthesize in a background task and return once the first bytes are on disk (True) or it failed"""
+    filename = brain.audio_cache.filename_for(cache_key)
+    growing, is_new = brain.audio_in_progress.add(
+        filename, growing_files.GrowingFile(brain.audio_cache.path_for(cache_key))
+    )
+    if is_new:
+        async def render(tmp_path):
+            growing.start(tmp_path)
+            async with limits['tts']:
+                return await module3_voice.text_to_audio_file_async(text, tmp_path, on_chunk=growing.append)
+
+        async def run():
+            audio_start = time.time()
+            path = None
+            try:
+                path = await brain.audio_cache.create_async(cache_key, render)
+            finally:
+                growing.finish(path is not None)
+                brain.audio_in_progress.remove(filename)
+                metrics.record("tts", audio_start)
+
+        task = asyncio.create_task(run())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+    with metrics.span("tts_first_byte"):
+        started = await growing.wait_started_async(brain.AUDIO_FIRST_BYTE_TIMEOUT)
+    return started or os.path.exists(growing.path)
+
+# Keeps references to fire-and-forget tasks until they finish
+background_tasks = set()
+
+async def synthesize_audio(full_response):
+    """Render the reply to a cached mp3 and return (file path, public URL), or (None, None) if TTS failed"""
+    with metrics.span("cache_lookup"):
+        banked = brain.bank.match(full_response)
+    if banked:
+        print("   -> 📚 Reply matches a banked phrase, skipping TTS")
+        return brain.bank.audio_path(banked), static_url(f"phrases/{banked['audio']}")
+
+    cache_key = module3_voice.audio_cache_key(full_response)
+    audio_filepath = brain.audio_cache.path_for(cache_key)
+    audio_url = static_url(f"audio/{brain.audio_cache.filename_for(cache_key)}")
+
+    with metrics.span("cache_lookup"):
+        cached = brain.audio_cache.lookup(cache_key)
+    if cached:
+        print("   -> 🔊 Using cached audio file")
+    elif brain.PROGRESSIVE_AUDIO:
+        print("   -> 🔊 Streaming audio to disk...")
+        audio_start = time.time()
+        if not await start_progressive_audio(cache_key, full_response):
+            print("   -> 🔊 Audio generation failed, text-only response")
+            return None, None
+        print(f"   -> 🔊 First audio bytes in {time.time() - audio_start:.1f}s")
+        audio_url = f"{brain.AUDIO_URL_PREFIX}/{brain.audio_cache.filename_for(cache_key)}"
+    else:
+        print("   -> 🔊 Generating audio...")
+        audio_start = time.time()
+        async def render(tmp_path):
+            async with limits['tts']:
+                return await module3_voice.text_to_audio_file_async(full_response, tmp_path)
+
+        # Concurrent requests for the same reply share one TTS call
+        path = await brain.audio_cache.create_async(cache_key, render)
+        audio_time = metrics.record('tts', audio_start)
+        if not path:
+            print("   -> 🔊 Audio generation failed, text-only response")
+            return None, None
+        print(f"   -> 🔊 Audio generated in {audio_time:.1f}s")
+
+    return audio_filepath, audio_url
+
+async def generate_video(audio_filepath):
+    """Run lip-sync for an audio file, returning the video URL or None"""
+    if not os.path.exists(brain.AVATAR_IMAGE_PATH):
+        print(f"   -> ⚠️  Avatar image not found at {brain.AVATAR_IMAGE_PATH}")
+        return None
+
+    # SadTalker needs the complete audio file
+    growing = brain.audio_in_progress.get(os.path.basename(audio_filepath))
+    if growing:
+        await asyncio.to_thread(growing.published.wait, 120)
+
+    with metrics.span("cache_lookup"):
+        cache_key = module4_face.video_cache_key(brain.AVATAR_IMAGE_PATH, audio_filepath)
+        cached = brain.video_cache.lookup(cache_key)
+    local_url = f"{brain.VIDEO_URL_PREFIX}/{brain.video_cache.filename_for(cache_key)}"
+    if cached:
+        print("   -> 🎬 Using cached video file")
+        return local_url
+
+    print("   -> 🎬 Starting video generation...")
+    video_start = time.time()
+    remote_url = None
+
+    async def render(tmp_path):
+        nonlocal remote_url
+        with metrics.span("video"):
+            video_output = await module4_face.generate_lip_sync_video_async(brain.AVATAR_IMAGE_PATH, audio_filepath)
+        if not video_output:
+            return False
+        with metrics.span("video_download"):
+            if await module4_face.save_video_async(video_output, tmp_path):
+                return True
+        remote_url = str(video_output)
+        return False
+
+    # Jobs for the same avatar and audio share one SadTalker run
+    video_url = local_url if await brain.video_cache.create_async(cache_key, render) else remote_url
+    if not video_url:
+        print("   -> 🎬 Video generation failed, audio-only response")
+        return None
+    print(f"   -> 🎬 Video generated in {time.time() - video_start:.1f}s")
+    return video_url
+
+# The semaphore inside the queue is the SadTalker provider limit
+video_queue = video_jobs.AsyncVideoJobQueue(
+    generate_video, max_workers=VIDEO_CONCURRENCY, max_queued=brain.VIDEO_QUEUE_LIMIT,
+    deferred_max_age=admission.deferred_video_max_age(),
+)
+
+# Same policy as the Flask app, judged against this server's own video queue
+admission_control = admission.AdmissionController(video_queue.stats, brain.LLM_INPUT["max_new_tokens"])
+
+def start_video_job(audio_filepath, decision=None):
+    """Queue lip-sync for an audio file (as the admission decision allows), returning the job or None"""
+    if audio_filepath is None:
+        return None
+    if not os.path.exists(brain.AVATAR_IMAGE_PATH):
+        print(f"   -> ⚠️  Avatar image not found at {brain.AVATAR_IMAGE_PATH}")
+        return None
+    video = admission_control.admit_video(decision) if decision else admission.VIDEO_NOW
+    if video == admission.VIDEO_SKIPPED:
+        print("   -> 🚦 Server busy, skipping video (audio-only response)")
+        return None
+    return video_queue.submit(audio_filepath, defer=video == admission.VIDEO_DEFERRED)
+
+def stream_llm(prompt, decision):
+    """Async twin of module2_brain.stream_llm; call it holding a limits['llm'] slot (a hedge takes another)"""
+    brain.require_replicate_token()
+    return resilience.hedged_stream_async(resilience.replicate_stream_async(
+        brain.LLAMA3_8B_INSTRUCT, brain.llm_input(prompt, decision)
+    ), slots=limits['llm'])
+
+def shed_response(decision):
+    """Fast 503 for a request the admission controller turned away"""
+    print("   -> 🚦 Server overloaded, shedding request")
+    return web.json_response({
+        'error': 'Server busy, please try again in a moment',
+        'response': admission.BUSY_RESPONSE,
+        'admission': decision.to_dict(),
+    }, status=503, headers={'Retry-After': str(admission.SHED_RETRY_AFTER)})
+
+def job_status_url(job):
+    return f"/jobs/{job.id}"
+
+async def read_transcript(request):
+    """Parse the request body, returning (body, error response)."""
+    try:
+        body = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        body = None
+    if not body or 'transcript' not in body:
+        return None, web.json_response({'error': 'Bad Request: transcript key is missing'}, status=400)
+    if not body['transcript']:
+        return None, web.json_response({'error': 'Bad Request: transcript cannot be empty'}, status=400)
+    return body, None
+
+async def index(request):
+    return web.FileResponse(os.path.join('templates', 'index.html'))
+
+async def generate_response(request):
+    """Async twin of module2_brain.generate_response."""
+    print("🧠 Brain (async) received a request...")
+    body, error = await read_transcript(request)
+    if error:
+        return error
+
+    user_transcript = body['transcript']
+    print(f"   -> User said: \"{user_transcript}\"")
+    decision = admission_control.admit()
+    if decision.shed:
+        return shed_response(decision)
+    session = brain.sessions.get(body.get('session_id'))
+    trace = metrics.start_trace("generate")
+
+    try:
+        print("   -> 🤔 Thinking...")
+        start_time = time.time()
+
+        cached = brain.cached_reply(session, user_transcript)
+        if cached:
+            full_response = cached
+        else:
+            async with limits['llm']:
+                full_response = "".join([str(token) async for token in stream_llm(session.build_prompt(user_transcript), decision)])
+            print(f"   -> 💭 AI responded in {metrics.record('llm_complete', start_time):.1f}s: \"{full_response}\"")
+
+        if not full_response:
+            return web.json_response({'error': 'AI generated empty response'}, status=500)
+        if not cached:
+            brain.cache_reply(session, user_transcript, full_response, decision)
+        session.add_turn(user_transcript, full_response)
+
+        audio_filepath, audio_url = await synthesize_audio(full_response)
+        video_job = start_video_job(audio_filepath, decision)
+
+        total_time = metrics.record("request", start_time)
+        print(f"   -> ✅ Total processing time: {total_time:.1f}s")
+
+        return web.json_response({
+            'response': full_response,
+            'response_cached': bool(cached),
+            'session_id': session.id,
+            'trace_id': trace.id,
+            'audio_url': audio_url,
+            'video_url': None,
+            'video_job_id': video_job.id if video_job else None,
+            'video_status_url': job_status_url(video_job) if video_job else None,
+            'admission': decision.to_dict(),
+            'processing_time': round(total_time, 1)
+        })
+
+    except Exception as e:
+        print(f"   -> ❌ Error occurred: {e}")
+        return web.json_response({
+            'error': f'Processing error: {str(e)}',
+            'response': 'Sorry, I encountered an error processing your request.'
+        }, status=500)
+    finally:
+        admission_control.release()
+
+async def generate_response_stream(request):
+    """Async twin of module2_brain.generate_response_stream (NDJSON events)."""
+    print("🧠 Brain (async) received a streaming request...")
+    body, error = await read_transcript(request)
+    if error:
+        return error
+
+    user_transcript = body['transcript']
+    print(f"   -> User said: \"{user_transcript}\"")
+    decision = admission_control.admit()
+    if decision.shed:
+        return shed_response(decision)
+    try:
+        return await stream_reply(request, body, decision)
+    finally:
+        admission_control.release()
+
+async def stream_reply(request, body, decision):
+    """Body of generate_response_stream for an admitted request."""
+    user_transcript = body['transcript']
+    session = brain.sessions.get(body.get('session_id'))
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'application/x-ndjson',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    await response.prepare(request)
+
+    async def event(kind, **payload):
+        await response.write((json.dumps({'type': kind, **payload}) + "\n").encode())
+
+    trace = metrics.start_trace("generate_stream")
+    start_time = time.time()
+    try:
+        print("   -> 🤔 Thinking...")
+        parts = []
+        cached = brain.cached_reply(session, user_transcript)
+        if cached:
+            parts.append(cached)
+            await event('token', text=cached)
+        else:
+            async with limits['llm']:
+                async for token in stream_llm(session.build_prompt(user_transcript), decision):
+                    token = str(token)
+                    if not parts:
+                        print(f"   -> 💭 First token in {metrics.record('llm_first_token', start_time):.1f}s")
+                    parts.append(token)
+                    await event('token', text=token)
+
+        full_response = "".join(parts)
+        if not cached:
+            print(f"   -> 💭 AI responded in {metrics.record('llm_complete', start_time):.1f}s: \"{full_response}\"")
+        if not full_response:
+            await event('error', error='AI generated empty response')
+            return response
+        if not cached:
+            brain.cache_reply(session, user_transcript, full_response, decision)
+        session.add_turn(user_transcript, full_response)
+        await event('response', response=full_response, response_cached=bool(cached), session_id=session.id,
+                    trace_id=trace.id, admission=decision.to_dict(),
+                    elapsed=round(time.time() - start_time, 1))
+
+        audio_filepath, audio_url = await synthesize_audio(full_response)
+        await event('audio', audio_url=audio_url, elapsed=round(time.time() - start_time, 1))
+
+        video_job = start_video_job(audio_filepath, decision)
+        if video_job:
+            await event('video_job', job_id=video_job.id, status_url=job_status_url(video_job))
+
+        total_time = metrics.record("request", start_time)
+        print(f"   -> ✅ Total streaming time: {total_time:.1f}s")
+        await event('done', processing_time=round(total_time, 1), admission=decision.to_dict())
+
+    except (ConnectionResetError, asyncio.CancelledError):
+        print("   -> Client disconnected, stopping")
+        raise
+    except Exception as e:
+        print(f"   -> ❌ Error occurred: {e}")
+        await event('error', error=f'Processing error: {str(e)}',
+                    response='Sorry, I encountered an error processing your request.')
+    return response
+
+async def job_status(request):
+    """Report the state of a queued video job"""
+    job = video_queue.get(request.match_info['job_id'])
+    if job is None:
+        return web.json_response({'error': 'Unknown job id'}, status=404)
+    return web.json_response(job.to_dict())
+
+async def cached_video(request):
+    """Serve a cached video; FileResponse answers Range requests for seeking"""
+    filename = os.path.basename(request.match_info['filename'])
+    path = os.path.join(brain.VIDEO_CACHE_DIR, filename)
+    if not os.path.exists(path):
+        raise web.HTTPNotFound()
+    return web.FileResponse(path, headers={'Content-Type': 'video/mp4'})
+
+async def streamed_audio(request):
+    """Serve reply audio; a file still being synthesized is streamed as it grows (chunked), a finished one supports Range"""
+    filename = os.path.basename(request.match_info['filename'])
+    growing = brain.audio_in_progress.get(filename)
+    if growing:
+        response = web.StreamResponse(headers={'Content-Type': 'audio/mpeg', 'Cache-Control': 'no-cache'})
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        async for data in growing.aiter_bytes():
+            await response.write(data)
+        await response.write_eof()
+        return response
+    path = os.path.join(brain.AUDIO_CACHE_DIR, filename)
+    if not os.path.exists(path):
+        raise web.HTTPNotFound()
+    return web.FileResponse(path, headers={'Content-Type': 'audio/mpeg'})
+
+async def status(request):
+    """Health check endpoint"""
+    return web.json_response({
+        'status': 'healthy',
+        'server': 'asyncio',
+        'avatar_available': os.path.exists(brain.AVATAR_IMAGE_PATH),
+        'avatar': module4_face.avatar_for(brain.AVATAR_IMAGE_PATH).stats(),
+        'video_jobs': video_queue.stats(),
+        'admission': admission_control.stats(),
+        'sessions': brain.sessions.stats(),
+        'audio_cache': brain.audio_cache.stats(),
+        'audio_in_progress': len(brain.audio_in_progress),
+        'video_cache': brain.video_cache.stats(),
+        'limits': {'llm': LLM_CONCURRENCY, 'tts': TTS_CONCURRENCY, 'video': VIDEO_CONCURRENCY},
+        'stages': metrics.stage_seconds.summary(),
+        'providers': health.checks.snapshot(),
+        'resilience': resilience.stats(),
+        'response_cache': brain.reply_cache.stats(),
+    })
+
+async def prometheus_metrics(request):
+    """Per-stage latency histograms in the Prometheus text format"""
+    return web.Response(text=metrics.render_prometheus(), content_type='text/plain')
+
+def create_app():
+    app = web.Application()
+    app.on_startup.append(create_limits)
+    app.on_startup.append(warm_up)
+    app.router.add_get('/', index)
+    app.router.add_post('/generate', generate_response)
+    app.router.add_post('/generate_stream', generate_response_stream)
+    app.router.add_get('/jobs/{job_id}', job_status)
+    app.router.add_get(f'{brain.VIDEO_URL_PREFIX}/{{filename}}', cached_video)
+    app.router.add_get(f'{brain.AUDIO_URL_PREFIX}/{{filename}}', streamed_audio)
+    app.router.add_get('/status', status)
+    app.router.add_get('/metrics', prometheus_metrics)
+    app.router.add_static(STATIC_URL_PATH, 'static')
+    return app
+
+if __name__ == '__main__':
+    print("🤖 AI Avatar (asyncio server) is running at http://127.0.0.1:5000")
+    print(f"   -> Provider limits: LLM {LLM_CONCURRENCY}, TTS {TTS_CONCURRENCY}, video {VIDEO_CONCURRENCY}")
+    web.run_app(create_app(), port=5000)
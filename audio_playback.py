@@ -0,0 +1,223 @@
+# --- audio_playback.py: in-process PCM playback through a small jitter buffer ---
+#
+# ElevenLabs can return raw 16-bit mono PCM (output_format "pcm_<rate>"),
+# which we write straight to the sound card instead of piping mp3 into an
+# mpv process per reply: no process spawn, no decode, and playback stops
+# within one period when it is cancelled.
+
+import os
+import time
+import wave
+import threading
+import contextvars
+import metrics
+
+# --- Configuration ---
+# ElevenLabs offers pcm_16000, pcm_22050, pcm_24000 and pcm_44100
+PLAYBACK_SAMPLE_RATE = int(os.getenv("PLAYBACK_SAMPLE_RATE", "24000"))
+PCM_OUTPUT_FORMAT = f"pcm_{PLAYBACK_SAMPLE_RATE}"
+SAMPLE_WIDTH = 2  # 16-bit samples
+CHANNELS = 1
+# Audio buffered before playback starts (and again after an underrun)
+JITTER_BUFFER_MS = int(os.getenv("JITTER_BUFFER_MS", "120"))
+# Audio handed to the sink per write; also how quickly a cancel takes effect
+PERIOD_MS = 20
+# "device" (sound card via pyaudio), "null" (discard in real time) or a .wav/.pcm path
+PLAYBACK_SINK = os.getenv("PLAYBACK_SINK", "device")
+
+class DeviceSink:
+    """Blocking pyaudio output stream, opened on first use and kept open between replies."""
+    def __init__(self, sample_rate=PLAYBACK_SAMPLE_RATE, period_ms=PERIOD_MS):
+        self.sample_rate = sample_rate
+        self.period_frames = sample_rate * period_ms // 1000
+        self.pa = None
+        self.stream = None
+
+    def write(self, pcm):
+        if self.stream is None:
+            import pyaudio  # only needed when playing to the sound card
+
+            self.pa = pyaudio.PyAudio()
+            self.stream = self.pa.open(
+                format=pyaudio.paInt16,
+                channels=CHANNELS,
+                rate=self.sample_rate,
+                output=True,
+                frames_per_buffer=self.period_frames,
+            )
+        self.stream.write(pcm)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.pa.terminate()
+            self.stream = None
+
+class NullSink:
+    """Discards audio, taking as long as playing it would (divided by `speed`); for headless runs."""
+    def __init__(self, sample_rate=PLAYBACK_SAMPLE_RATE, speed=1.0, realtime=True):
+        self.bytes_per_second = sample_rate * SAMPLE_WIDTH * CHANNELS
+        self.speed = speed
+        self.realtime = realtime
+        self.bytes_written = 0
+
+    def write(self, pcm):
+        self.bytes_written += len(pcm)
+        if self.realtime:
+            time.sleep(len(pcm) / self.bytes_per_second / self.speed)
+
+    def close(self):
+        pass
+
+class FileSink(NullSink):
+    """Appends everything played to a .wav (or raw .pcm) file, paced like NullSink."""
+    def __init__(self, path, sample_rate=PLAYBACK_SAMPLE_RATE, speed=1.0, realtime=True):
+        super().__init__(sample_rate, speed, realtime)
+        self.path = path
+        if path.endswith(".wav"):
+            self.file = wave.open(path, "wb")
+            self.file.setnchannels(CHANNELS)
+            self.file.setsampwidth(SAMPLE_WIDTH)
+            self.file.setframerate(sample_rate)
+        else:
+            self.file = open(path, "wb")
+        self.lock = threading.Lock()
+
+    def write(self, pcm):
+        with self.lock:
+            if isinstance(self.file, wave.Wave_write):
+                self.file.writeframes(pcm)  # also rewrites the header, so the file is always valid
+            else:
+                self.file.write(pcm)
+                self.file.flush()
+        super().write(pcm)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def make_sink(spec=PLAYBACK_SINK, sample_rate=PLAYBACK_SAMPLE_RATE):
+    if spec == "device":
+        return DeviceSink(sample_rate)
+    if spec == "null":
+        return NullSink(sample_rate)
+    return FileSink(spec, sample_rate)
+
+class PcmPlayer:
+    """
+    Plays streamed PCM chunks through `sink`. A feeder thread pulls chunks into
+    a byte buffer while the calling thread writes fixed periods to the sink;
+    playback starts once JITTER_BUFFER_MS is buffered. If the buffer runs dry
+    before the stream ends, that is counted as an underrun and playback waits
+    to rebuffer rather than stuttering period by period.
+    """
+    def __init__(self, sink, sample_rate=PLAYBACK_SAMPLE_RATE,
+                 jitter_ms=JITTER_BUFFER_MS, period_ms=PERIOD_MS):
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.frame_bytes = SAMPLE_WIDTH * CHANNELS
+        self.period_bytes = sample_rate * period_ms // 1000 * self.frame_bytes
+        self.jitter_bytes = max(self.period_bytes, sample_rate * jitter_ms // 1000 * self.frame_bytes)
+        self.period_seconds = period_ms / 1000
+        self.lock = threading.Lock()
+        # Totals for stats()
+        self.replies = 0
+        self.cancelled = 0
+        self.underruns = 0
+        self.underrun_seconds = 0.0
+        self.played_bytes = 0
+
+    def play(self, chunks, cancel_event=None):
+        """
+        Plays an iterable of PCM byte chunks to the end, or until `cancel_event`
+        is set. Returns False if it was cancelled.
+        """
+        cancel_event = cancel_event or threading.Event()
+        buffer = bytearray()
+        cond = threading.Condition()
+        state = {'finished': False}
+
+        def feed():
+            try:
+                for chunk in chunks:
+                    if cancel_event.is_set():
+                        break
+                    with cond:
+                        buffer.extend(chunk)
+                        cond.notify()
+            except Exception as e:
+                print(f"   -> Playback source error: {e}")
+            finally:
+                if cancel_event.is_set() and hasattr(chunks, "close"):
+                    chunks.close()
+                with cond:
+                    state['finished'] = True
+                    cond.notify()
+
+        # The source may record spans (e.g. tts_first_audio) into the caller's trace
+        feeder = threading.Thread(target=contextvars.copy_context().run, args=(feed,), daemon=True)
+        feeder.start()
+
+        started = False
+        rebuffering_since = None
+        underruns = 0
+        first_sound_at = None
+        played = 0
+        while not cancel_event.is_set():
+            with cond:
+                # Prime (or re-prime) the jitter buffer, then move one period at a time
+                need = self.period_bytes if started and rebuffering_since is None else self.jitter_bytes
+                cond.wait_for(lambda: len(buffer) >= need or state['finished'], self.period_seconds)
+                if len(buffer) < need and not state['finished']:
+                    if started and rebuffering_since is None:
+                        rebuffering_since = time.time()
+                        underruns += 1
+                    continue
+                if not buffer:
+                    break  # finished and fully played
+                size = min(self.period_bytes, len(buffer))
+                if size % self.frame_bytes and not state['finished']:
+                    size -= size % self.frame_bytes
+                data = bytes(buffer[:size])
+                del buffer[:size]
+            if rebuffering_since is not None:
+                metrics.record("playback_underrun", rebuffering_since)
+                with self.lock:
+                    self.underrun_seconds += time.time() - rebuffering_since
+                rebuffering_since = None
+            if len(data) % self.frame_bytes:
+                data += b"\x00" * (self.frame_bytes - len(data) % self.frame_bytes)
+            if first_sound_at is None:
+                first_sound_at = time.time()
+                trace = metrics.current_trace()
+                if trace is not None:
+                    metrics.record("first_sound", trace.started_at, first_sound_at, trace)
+            started = True
+            self.sink.write(data)
+            played += len(data)
+
+        completed = not cancel_event.is_set()
+        if completed:
+            feeder.join()
+        with self.lock:
+            self.replies += 1
+            self.cancelled += 0 if completed else 1
+            self.underruns += underruns
+            self.played_bytes += played
+        if underruns:
+            print(f"   -> ⚠️  Playback ran dry {underruns} time(s) waiting for audio")
+        return completed
+
+    def stats(self):
+        with self.lock:
+            return {
+                'replies': self.replies,
+                'cancelled': self.cancelled,
+                'underruns': self.underruns,
+                'underrun_seconds': round(self.underrun_seconds, 3),
+                'played_seconds': round(self.played_bytes / (self.sample_rate * self.frame_bytes), 1),
+            }
+
+    def close(self):
+        self.sink.close()
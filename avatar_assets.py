@@ -0,0 +1,123 @@
+# --- avatar_assets.py: prepare the avatar once and reuse its upload across SadTalker calls ---
+
+import io
+import os
+import time
+import threading
+from datetime import datetime, timezone
+
+# --- Configuration ---
+# Shorter side in pixels. SadTalker renders at 256px; keep twice that so its face crop still has detail
+AVATAR_SIZE = int(os.getenv("AVATAR_SIZE", "512"))
+AVATAR_JPEG_QUALITY = 92
+# Re-upload this long before Replicate says the file expires
+UPLOAD_EXPIRY_MARGIN = 300
+# Used when Replicate doesn't report an expiry
+UPLOAD_DEFAULT_TTL = 3600
+
+class AvatarAssets:
+    """
+    Downscales the avatar to AVATAR_SIZE once (again only if the file
+    changes), keeps the JPEG bytes in memory, and uploads them to Replicate's
+    file API once, handing out the same URL until it expires.
+    """
+    def __init__(self, image_path, size=AVATAR_SIZE):
+        self.image_path = image_path
+        self.size = size
+        self.marker = None
+        self.data = None
+        self.upload_url = None
+        self.upload_expires_at = 0.0
+        self.uploads = 0
+        self.reuses = 0
+        self.lock = threading.Lock()
+        # One upload at a time, so callers arriving mid-upload reuse its URL
+        self.upload_lock = threading.Lock()
+
+    def prepare(self):
+        """Processed JPEG bytes, rebuilt only when the source file changes."""
+        stat = os.stat(self.image_path)
+        marker = (os.path.abspath(self.image_path), stat.st_mtime, stat.st_size, self.size)
+        with self.lock:
+            if marker != self.marker:
+                from PIL import Image  # only needed when (re)processing
+
+                start_time = time.time()
+                with Image.open(self.image_path) as image:
+                    image = image.convert("RGBA")
+                    # Keep the whole picture; SadTalker's preprocess finds and crops the face itself
+                    scale = self.size / min(image.size)
+                    if scale < 1:
+                        image = image.resize(
+                            (round(image.width * scale), round(image.height * scale)), Image.LANCZOS
+                        )
+                    # Flatten transparency onto white; SadTalker wants an opaque RGB image
+                    background = Image.new("RGB", image.size, (255, 255, 255))
+                    background.paste(image, mask=image.getchannel("A"))
+                    buffer = io.BytesIO()
+                    background.save(buffer, format="JPEG", quality=AVATAR_JPEG_QUALITY)
+                self.data = buffer.getvalue()
+                self.marker = marker
+                self.upload_url = None
+                print(f"   -> 🖼️  Avatar prepared: {stat.st_size // 1024} KB -> {len(self.data) // 1024} KB "
+                      f"({background.width}x{background.height}) in {time.time() - start_time:.1f}s")
+            return self.data
+
+    def input_value(self):
+        """What to pass as SadTalker's `source_image`: the reusable upload URL, or the bytes as a file."""
+        try:
+            data = self.prepare()
+        except Exception as e:
+            print(f"   -> ⚠️  Could not prepare avatar ({e}), sending the original image")
+            with open(self.image_path, "rb") as f:
+                return self.as_file(f.read(), os.path.basename(self.image_path))
+        # self.lock is only held briefly, so prepare() and stats() never wait on the network
+        with self.upload_lock:
+            with self.lock:
+                if self.upload_url and time.time() < self.upload_expires_at and self.data is data:
+                    self.reuses += 1
+                    return self.upload_url
+            try:
+                import replicate  # imported on first use, so startup doesn't pay for the SDK
+
+                uploaded = replicate.files.create(
+                    io.BytesIO(data), filename="avatar.jpg", content_type="image/jpeg"
+                )
+            except Exception as e:
+                print(f"   -> ⚠️  Avatar upload failed ({e}), sending it with the request")
+                return self.as_file(data)
+            with self.lock:
+                # Only keep the URL if the avatar wasn't re-prepared meanwhile
+                if self.data is data:
+                    self.upload_url = uploaded.urls["get"]
+                    self.upload_expires_at = self._expiry(uploaded.expires_at)
+                self.uploads += 1
+            return uploaded.urls["get"]
+
+    @staticmethod
+    def as_file(data, name="avatar.jpg"):
+        buffer = io.BytesIO(data)
+        buffer.name = name
+        return buffer
+
+    @staticmethod
+    def _expiry(expires_at):
+        if expires_at:
+            try:
+                when = datetime.fromisoformat(expires_at.replace("Z", "+00:00"))
+                if when.tzinfo is None:
+                    when = when.replace(tzinfo=timezone.utc)
+                return when.timestamp() - UPLOAD_EXPIRY_MARGIN
+            except ValueError:
+                pass
+        return time.time() + UPLOAD_DEFAULT_TTL - UPLOAD_EXPIRY_MARGIN
+
+    def stats(self):
+        with self.lock:
+            return {
+                'prepared': self.data is not None,
+                'bytes': len(self.data) if self.data else None,
+                'size': self.size,
+                'uploads': self.uploads,
+                'upload_reuses': self.reuses,
+            }
@@ -0,0 +1,337 @@
+# --- benchmark.py: end-to-end latency benchmark against simulated providers ---
+#
+# Drives the terminal loop (main_orchestrator) or the web app (module2_brain)
+# with N concurrent simulated users, using the stand-in providers from
+# sim_providers, and reports time to first token / first audio, whole-turn
+# time and video latency as p50/p95/p99. No API keys or network needed.
+#
+#   python benchmark.py --target terminal --sessions 4 --turns 5
+#   python benchmark.py --target web-stream --sessions 20 --no-video --budget ttfa.p95=1.5
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+import contextvars
+
+import sim_providers
+
+METRICS = [
+    ('ttft', "time to first token"),
+    ('ttfa', "time to first audio"),
+    ('turn', "turn time"),
+    ('video', "time to video"),
+]
+PERCENTILES = (50, 95, 99)
+
+# The turn being measured, visible to the stand-ins via the copied context
+current_turn = contextvars.ContextVar("current_turn", default=None)
+
+class Turn:
+    """Timestamps of one user turn, measured from the end of the user's speech."""
+    def __init__(self, session, index, started_at):
+        self.session = session
+        self.index = index
+        self.started_at = started_at
+        self.first_token = None
+        self.first_audio = None
+        self.finished = None
+        self.video_job_id = None
+        self.video_done = None
+
+    def mark(self, name):
+        """Record the first time `name` happens."""
+        if getattr(self, name) is None:
+            setattr(self, name, time.time())
+
+    def metrics(self):
+        def since(at):
+            return round(at - self.started_at, 4) if at else None
+        return {
+            'session': self.session,
+            'turn_index': self.index,
+            'ttft': since(self.first_token),
+            'ttfa': since(self.first_audio),
+            'turn': since(self.finished),
+            'video': since(self.video_done),
+        }
+
+class Recorder:
+    def __init__(self):
+        self.turns = []
+        self.lock = threading.Lock()
+
+    def start(self, session, index, started_at=None):
+        turn = Turn(session, index, started_at or time.time())
+        with self.lock:
+            self.turns.append(turn)
+        return turn
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def summarize(turns):
+    rows = [turn.metrics() for turn in turns]
+    summary = {}
+    for key, _ in METRICS:
+        values = [row[key] for row in rows if row[key] is not None]
+        if not values:
+            continue
+        summary[key] = {
+            'count': len(values),
+            **{f"p{pct}": round(percentile(values, pct), 3) for pct in PERCENTILES},
+            'mean': round(sum(values) / len(values), 3),
+            'max': round(max(values), 3),
+        }
+    return summary
+
+def print_report(title, summary, elapsed):
+    print(f"\n📊 {title} ({elapsed:.1f}s wall clock)")
+    print(f"   {'metric':<22}{'n':>5}" + "".join(f"{'p' + str(p):>9}" for p in PERCENTILES)
+          + f"{'mean':>9}{'max':>9}")
+    for key, label in METRICS:
+        row = summary.get(key)
+        if not row:
+            print(f"   {label:<22}{'-':>5}   (not observed)")
+            continue
+        print(f"   {label:<22}{row['count']:>5}"
+              + "".join(f"{row['p' + str(p)]:>9.3f}" for p in PERCENTILES)
+              + f"{row['mean']:>9.3f}{row['max']:>9.3f}")
+
+def check_budgets(summary, budgets):
+    """Budgets look like "ttfa.p95=1.5"; returns the ones that were exceeded."""
+    failures = []
+    for budget in budgets:
+        name, _, limit = budget.partition("=")
+        metric, _, stat = name.partition(".")
+        value = summary.get(metric, {}).get(stat or 'p95')
+        if value is not None and value > float(limit):
+            failures.append(f"{name} = {value:.3f}s > {float(limit):.3f}s")
+    return failures
+
+# --- Terminal loop (main_orchestrator) ---
+
+async def bench_terminal(profile, sessions, turns, recorder):
+    """Runs `sessions` copies of main_conversation_loop, each for `turns` turns."""
+    import module1_ears
+    import module3_voice
+    import main_orchestrator
+
+    listeners = []
+
+    class TimedListener(sim_providers.SimListener):
+        def __init__(self, *args, **kwargs):
+            super().__init__(profile)
+            self.session = len(listeners)
+            self.done = asyncio.Event()
+            listeners.append(self)
+
+        async def next_utterance(self):
+            if self.turn >= turns:
+                self.done.set()
+                await asyncio.Future()  # parked until the benchmark stops the loop
+            text = await super().next_utterance()
+            current_turn.set(recorder.start(self.session, self.turn - 1, self.speech_ended_at))
+            return text
+
+    speak = module3_voice.speak_text_stream_chunked
+    play = module3_voice.play_audio_stream
+
+    def timed_speak(text_stream, *args, **kwargs):
+        turn = current_turn.get()
+
+        def tokens():
+            try:
+                for token in text_stream:
+                    turn.mark('first_token')
+                    yield token
+            finally:
+                if hasattr(text_stream, "close"):
+                    text_stream.close()
+
+        try:
+            return speak(tokens(), *args, **kwargs)
+        finally:
+            turn.mark('finished')
+
+    def timed_play(audio_chunks, cancel_event=None):
+        turn = current_turn.get()
+
+        def chunks():
+            for chunk in audio_chunks:
+                turn.mark('first_audio')
+                yield chunk
+
+        return play(chunks(), cancel_event)
+
+    module1_ears.Listener = TimedListener
+    module3_voice.speak_text_stream_chunked = timed_speak
+    module3_voice.play_audio_stream = timed_play
+
+    tasks = [asyncio.create_task(main_orchestrator.main_conversation_loop()) for _ in range(sessions)]
+    while len(listeners) < sessions:
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*(listener.done.wait() for listener in listeners))
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+# --- Web app (module2_brain) ---
+
+def bench_web(profile, sessions, turns, recorder, endpoint, video_timeout=300):
+    """Posts `turns` messages from each of `sessions` threads to /generate or /generate_stream."""
+    import module2_brain as brain
+
+    def run_session(number):
+        client = brain.app.test_client()
+        session_id = None
+        for index in range(turns):
+            time.sleep(profile.delay(profile.user_pause))
+            body = {
+                'transcript': sim_providers.USER_UTTERANCES[index % len(sim_providers.USER_UTTERANCES)],
+                'session_id': session_id,
+            }
+            turn = recorder.start(number, index)
+            if endpoint == 'generate':
+                data = client.post('/generate', json=body).get_json() or {}
+                if data.get('audio_url'):
+                    turn.mark('first_audio')
+                events = [data]
+            else:
+                events = []
+                response = client.post('/generate_stream', json=body, buffered=False)
+                buffer = b""
+                for chunk in response.response:
+                    buffer += chunk if isinstance(chunk, bytes) else chunk.encode()
+                    *lines, buffer = buffer.split(b"\n")
+                    for line in filter(None, lines):
+                        event = json.loads(line)
+                        events.append(event)
+                        if event['type'] == 'token':
+                            turn.mark('first_token')
+                        elif event['type'] == 'audio':
+                            turn.mark('first_audio')
+                response.close()
+            turn.mark('finished')
+            for event in events:
+                session_id = event.get('session_id', session_id)
+                turn.video_job_id = event.get('video_job_id') or event.get('job_id') or turn.video_job_id
+
+    threads = [threading.Thread(target=run_session, args=(n,), daemon=True) for n in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Video jobs outlive the requests; wait for them so their latency is reported too
+    deadline = time.time() + video_timeout
+    for turn in recorder.turns:
+        while turn.video_job_id and time.time() < deadline:
+            job = brain.video_queue.get(turn.video_job_id)
+            if job is None or job.status in (brain.video_jobs.DONE, brain.video_jobs.FAILED):
+                if job is not None and job.status == brain.video_jobs.DONE:
+                    turn.video_done = job.finished_at
+                break
+            time.sleep(0.05)
+
+def prepare_workdir(path, with_avatar):
+    """Run in a scratch directory so caches start cold and the real static/ is untouched."""
+    path = path or tempfile.mkdtemp(prefix="avatar-bench-")
+    os.makedirs(path, exist_ok=True)
+    os.chdir(path)
+    if with_avatar and not os.path.exists("avatar.png"):
+        from PIL import Image
+        Image.new("RGB", (1024, 1024), (200, 180, 170)).save("avatar.png")
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark with simulated providers")
+    parser.add_argument("--target", choices=["terminal", "web", "web-stream"], default="web-stream",
+                        help="terminal = main_orchestrator loop, web = POST /generate, web-stream = POST /generate_stream")
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=5, help="turns per user")
+    parser.add_argument("--llm-first-token", default="0.35", help="median[:sigma] seconds")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=40.0)
+    parser.add_argument("--tts-first-byte", default="0.25", help="median[:sigma] seconds")
+    parser.add_argument("--tts-bytes-per-sec", type=float, default=64000.0)
+    parser.add_argument("--stt-final", default="0.15", help="median[:sigma] seconds after speech ends")
+    parser.add_argument("--video-base", default="6", help="median[:sigma] seconds of SadTalker overhead")
+    parser.add_argument("--video-realtime-factor", type=float, default=1.5,
+                        help="SadTalker seconds per second of audio")
+    parser.add_argument("--playback-speed", type=float, default=1.0,
+                        help="terminal target: play simulated audio this much faster than real time")
+    parser.add_argument("--user-pause", default="0.3", help="median[:sigma] seconds between turns")
+    parser.add_argument("--stall-rate", type=float, default=0.0,
+                        help="share of provider calls (LLM, TTS, SadTalker) that stall")
+    parser.add_argument("--stall-seconds", type=float, default=5.0, help="how long a stalled call hangs")
+    parser.add_argument("--no-video", action="store_true", help="web targets: no avatar, audio-only replies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="directory for caches (default: a fresh temp dir)")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    parser.add_argument("--budget", action="append", default=[],
+                        help="fail if a stat exceeds a limit, e.g. ttfa.p95=1.5 (repeatable)")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own logging")
+    args = parser.parse_args(argv)
+
+    profile = sim_providers.SimProfile(
+        llm_first_token=args.llm_first_token, llm_tokens_per_sec=args.llm_tokens_per_sec,
+        tts_first_byte=args.tts_first_byte, tts_bytes_per_sec=args.tts_bytes_per_sec,
+        stt_final=args.stt_final, video_base=args.video_base,
+        video_realtime_factor=args.video_realtime_factor,
+        playback_speed=args.playback_speed, user_pause=args.user_pause,
+        stall_rate=args.stall_rate, stall_seconds=args.stall_seconds, seed=args.seed,
+    )
+
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    workdir = prepare_workdir(args.workdir, with_avatar=not args.no_video)
+    os.environ.setdefault("REPLICATE_API_TOKEN", "simulated")
+    os.environ.setdefault("DEEPGRAM_API_KEY", "simulated")
+    sim_providers.install(profile)
+
+    recorder = Recorder()
+    title = f"{args.target}: {args.sessions} sessions x {args.turns} turns"
+    print(f"🏁 Benchmarking {title} in {workdir}")
+    start = time.time()
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(open(os.devnull, "w")))
+        if args.target == "terminal":
+            asyncio.run(bench_terminal(profile, args.sessions, args.turns, recorder))
+        else:
+            endpoint = "generate" if args.target == "web" else "generate_stream"
+            bench_web(profile, args.sessions, args.turns, recorder, endpoint)
+    elapsed = time.time() - start
+
+    summary = summarize(recorder.turns)
+    print_report(title, summary, elapsed)
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({
+                'target': args.target,
+                'sessions': args.sessions,
+                'turns_per_session': args.turns,
+                'elapsed': round(elapsed, 3),
+                'profile': profile.describe(),
+                'summary': summary,
+                'turns': [turn.metrics() for turn in recorder.turns],
+            }, f, indent=2)
+        print(f"   -> Results written to {json_path}")
+
+    failures = check_budgets(summary, args.budget)
+    for failure in failures:
+        print(f"   ❌ Over budget: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
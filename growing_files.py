@@ -0,0 +1,137 @@
+# --- growing_files.py: serve files while they are still being written ---
+
+import time
+import asyncio
+import threading
+
+READ_CHUNK_BYTES = 16 * 1024
+
+class GrowingFile:
+    """
+    A file one thread is writing (at `tmp_path`, later renamed to `path`)
+    while readers stream it. The writer calls start() with its temp path,
+    append() after each flushed write and finish() when done; readers follow
+    the bytes as they land.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = None
+        self.size = 0
+        self.complete = False
+        self.ok = False
+        self.published = threading.Event()
+        self.cond = threading.Condition()
+
+    def start(self, tmp_path):
+        with self.cond:
+            self.tmp_path = tmp_path
+
+    def append(self, nbytes):
+        with self.cond:
+            self.size += nbytes
+            self.cond.notify_all()
+
+    def finish(self, ok):
+        with self.cond:
+            self.complete = True
+            self.ok = ok
+            self.cond.notify_all()
+
+    def wait_started(self, timeout):
+        """Block until the first bytes are written (True) or the write ends without any."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.size > 0 or self.complete, timeout)
+            return self.size > 0
+
+    async def wait_started_async(self, timeout, poll_seconds=0.02):
+        """wait_started() for asyncio callers."""
+        deadline = time.time() + timeout
+        while self.size == 0 and not self.complete and time.time() < deadline:
+            await asyncio.sleep(poll_seconds)
+        return self.size > 0
+
+    def _open(self):
+        # The rename to `path` is atomic, so the bytes are always at one of the two
+        for candidate in (self.tmp_path, self.path):
+            try:
+                return open(candidate, "rb") if candidate else None
+            except FileNotFoundError:
+                continue
+        return None
+
+    def iter_bytes(self, idle_timeout=30):
+        """The file's bytes, yielded as they are written, until the writer finishes."""
+        if not self.wait_started(idle_timeout):
+            return
+        f = self._open()
+        if f is None:
+            return
+        with f:
+            offset = 0
+            while True:
+                data = f.read(READ_CHUNK_BYTES)
+                if data:
+                    offset += len(data)
+                    yield data
+                    continue
+                with self.cond:
+                    if self.complete and offset >= self.size:
+                        return
+                    if not self.cond.wait_for(lambda: self.size > offset or self.complete, idle_timeout):
+                        return  # the writer stalled; end the response rather than hang
+
+    async def aiter_bytes(self, poll_seconds=0.02, idle_timeout=30):
+        """iter_bytes() for asyncio handlers (polls instead of blocking on the condition)."""
+        if not await self.wait_started_async(idle_timeout, poll_seconds):
+            return
+        f = self._open()
+        if f is None:
+            return
+        with f:
+            offset = 0
+            idle_since = time.time()
+            while True:
+                data = f.read(READ_CHUNK_BYTES)
+                if data:
+                    offset += len(data)
+                    idle_since = time.time()
+                    yield data
+                    continue
+                if (self.complete and offset >= self.size) or time.time() - idle_since > idle_timeout:
+                    return
+                await asyncio.sleep(poll_seconds)
+
+class GrowingFiles:
+    """Files currently being written, by name; entries stay until the file is published."""
+    def __init__(self):
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            return self.files.get(name)
+
+    def add(self, name, growing):
+        """Register `growing` unless `name` is already being written; returns the live entry and whether it is new."""
+        with self.lock:
+            if name in self.files:
+                return self.files[name], False
+            self.files[name] = growing
+            return growing, True
+
+    def remove(self, name):
+        """Forget `name` once its file is published (or the write failed)."""
+        with self.lock:
+            growing = self.files.pop(name, None)
+        if growing:
+            growing.published.set()
+
+    def wait_published(self, name, timeout=None):
+        """Block until `name` is no longer being written."""
+        growing = self.get(name)
+        if growing:
+            growing.published.wait(timeout)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.files)
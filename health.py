@@ -0,0 +1,126 @@
+# --- health.py: cheap, concurrent provider health checks with cached results ---
+#
+# Each provider is checked with one authenticated GET (no SDK import, nothing
+# billed), all at once. Results are kept in memory and in a small JSON file
+# for HEALTH_CHECK_TTL seconds, so a restart within that window starts
+# without touching the network. Changing an API key invalidates its result.
+
+import os
+import json
+import time
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import artifact_cache
+
+# --- Configuration ---
+HEALTH_CHECK_TTL = int(os.getenv("HEALTH_CHECK_TTL", "600"))
+# Failures are retried sooner, so a fixed key or outage is noticed quickly
+HEALTH_FAILURE_TTL = 30
+HEALTH_CACHE_PATH = os.getenv("HEALTH_CACHE_PATH", ".health_cache.json")
+PROBE_TIMEOUT = 5
+
+class Probe:
+    """An authenticated GET against a provider endpoint that is free and fast to call."""
+    def __init__(self, name, env_key, url, auth_header, auth_format="{}"):
+        self.name = name
+        self.env_key = env_key
+        self.url = url
+        self.auth_header = auth_header
+        self.auth_format = auth_format
+
+    def fingerprint(self):
+        """Changes whenever the key (or endpoint) does; the key itself is never stored."""
+        return artifact_cache.digest(self.name, self.url, os.getenv(self.env_key) or "")
+
+    def run(self):
+        key = os.getenv(self.env_key)
+        if not key:
+            return {'ok': False, 'detail': f"{self.env_key} not set", 'latency_ms': 0}
+        request = urllib.request.Request(self.url, headers={self.auth_header: self.auth_format.format(key)})
+        start_time = time.time()
+        try:
+            with urllib.request.urlopen(request, timeout=PROBE_TIMEOUT) as response:
+                ok, detail = True, f"HTTP {response.status}"
+        except urllib.error.HTTPError as e:
+            ok, detail = False, f"HTTP {e.code}" + (" (check the API key)" if e.code in (401, 403) else "")
+        except Exception as e:
+            ok, detail = False, str(e)
+        return {'ok': ok, 'detail': detail, 'latency_ms': round(1000 * (time.time() - start_time))}
+
+PROBES = [
+    Probe("replicate", "REPLICATE_API_TOKEN", "https://api.replicate.com/v1/account",
+          "Authorization", "Bearer {}"),
+    Probe("elevenlabs", "ELEVENLABS_API_KEY", "https://api.elevenlabs.io/v1/user", "xi-api-key"),
+    Probe("deepgram", "DEEPGRAM_API_KEY", "https://api.deepgram.com/v1/projects",
+          "Authorization", "Token {}"),
+]
+
+class HealthChecks:
+    """Runs the probes that have no fresh result, concurrently, and remembers the outcome."""
+    def __init__(self, probes=PROBES, cache_path=HEALTH_CACHE_PATH, ttl=HEALTH_CHECK_TTL):
+        self.probes = {probe.name: probe for probe in probes}
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.results = {}  # name -> {'ok', 'detail', 'latency_ms', 'checked_at', 'fingerprint'}
+        self.lock = threading.Lock()
+        self._load()
+
+    def check(self, names=None, force=False):
+        """{name: result} for the given providers (all by default); only stale ones hit the network."""
+        names = list(names or self.probes)
+        with self.lock:
+            stale = [name for name in names if force or not self._fresh(name)]
+        if stale:
+            with ThreadPoolExecutor(max_workers=len(stale), thread_name_prefix="health") as pool:
+                fresh = dict(zip(stale, pool.map(lambda name: self.probes[name].run(), stale)))
+            with self.lock:
+                for name, result in fresh.items():
+                    result['checked_at'] = time.time()
+                    result['fingerprint'] = self.probes[name].fingerprint()
+                    self.results[name] = result
+                self._save()
+        with self.lock:
+            return {name: self._public(name, cached=name not in stale) for name in names}
+
+    def snapshot(self):
+        """Latest known results, without probing (for /status)."""
+        with self.lock:
+            return {name: self._public(name, cached=True) for name in self.probes
+                    if 'checked_at' in self.results.get(name, {})}
+
+    def _fresh(self, name):
+        result = self.results.get(name)
+        if not result or result.get('fingerprint') != self.probes[name].fingerprint():
+            return False
+        ttl = self.ttl if result.get('ok') else HEALTH_FAILURE_TTL
+        return time.time() - result.get('checked_at', 0) < ttl
+
+    def _public(self, name, cached):
+        result = self.results[name]
+        return {
+            'ok': result['ok'],
+            'detail': result['detail'],
+            'latency_ms': result['latency_ms'],
+            'age_seconds': round(time.time() - result['checked_at'], 1),
+            'cached': cached,
+        }
+
+    def _load(self):
+        try:
+            with open(self.cache_path) as f:
+                self.results = json.load(f)
+        except (OSError, ValueError):
+            self.results = {}
+
+    def _save(self):
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.results, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"   -> ⚠️  Could not save health check cache: {e}")
+
+checks = HealthChecks()
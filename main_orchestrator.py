@@ -3,11 +3,19 @@
 import asyncio
 import os
 import time
-import replicate
+import threading
+from collections import deque
 from dotenv import load_dotenv
 
 import module1_ears      # STT module
 import module3_voice     # Optimized TTS module
+import phrase_bank       # Pre-rendered phrases and fillers
+import session_memory    # Conversation memory
+import speculation       # Early LLM start from interim transcripts
+import metrics           # Stage histograms and per-turn traces
+import health            # Cached provider health checks
+import resilience        # Deadlines, hedged requests and circuit breakers
+import response_cache    # Cached replies to common openers
 
 # Load environment variables from .env file
 load_dotenv()
@@ -17,12 +25,67 @@ if not os.getenv("REPLICATE_API_TOKEN"):
 # --- Optimized Llama 3 Model Configuration ---
 LLAMA3_8B_INSTRUCT = "meta/meta-llama-3-8b-instruct"
 
-def stream_llm_response(transcript: str):
+# --- Duplex (barge-in) Configuration ---
+# Keep listening while the avatar speaks and stop it when the user talks.
+# Use headphones: without echo cancellation the avatar can interrupt itself.
+DUPLEX_MODE = os.getenv("DUPLEX_MODE", "0") == "1"
+
+# --- Speculative Generation Configuration ---
+# Start the LLM from a stable interim transcript before Deepgram's final result
+SPECULATIVE_MODE = os.getenv("SPECULATIVE_MODE", "0") == "1"
+
+# --- Startup Checks Configuration ---
+# "fast": one cheap request per provider, run concurrently and cached for HEALTH_CHECK_TTL;
+# "full": also synthesize a test clip (the old, slow check); "off": skip
+STARTUP_CHECKS = os.getenv("STARTUP_CHECKS", "fast")
+
+# --- Trace Export Configuration ---
+# Write the latest turns' spans to this file as Chrome trace JSON (chrome://tracing)
+TRACE_EXPORT = os.getenv("TRACE_EXPORT")
+TRACE_EXPORT_TURNS = 200
+
+# --- Phrase Bank Configuration (shared with the web app) ---
+PHRASE_BANK_DIR = os.path.join("static", "phrases")
+phrases, fillers = phrase_bank.load_phrase_config(os.getenv("PHRASE_BANK_FILE"))
+PLAYBACK_FORMAT = module3_voice.playback_format()
+if PLAYBACK_FORMAT:
+    # The in-process player takes raw PCM, so the terminal keeps its own copy of the bank
+    bank = phrase_bank.PhraseBank(
+        os.path.join(PHRASE_BANK_DIR, PLAYBACK_FORMAT),
+        lambda text: module3_voice.audio_cache_key(text, PLAYBACK_FORMAT),
+        phrases, fillers, extension=".pcm",
+    )
+else:
+    bank = phrase_bank.PhraseBank(PHRASE_BANK_DIR, module3_voice.audio_cache_key, phrases, fillers)
+
+# Replies to conversation openers, kept across runs (see RESPONSE_CACHE_PATH)
+reply_cache = response_cache.ResponseCache()
+
+def render_phrase_audio(text, path):
+    return module3_voice.text_to_audio_file(text, path, output_format=PLAYBACK_FORMAT)
+
+def stream_llm_response(transcript: str, session=None, remember=True, cancel_event=None):
     """
     OPTIMIZED: Generator function that streams response from Llama 3 with faster settings.
+    With a session, earlier turns are included and (if `remember`) the finished reply is stored,
+    as well as cached when it opens the conversation. Speculative runs (remember=False) raise
+    errors instead of apologizing, so the reply is never mistaken for an answer. Setting
+    `cancel_event` cancels the predictions right away, even while the reader is waiting for a token.
     """
     print(f"\n🧠 AI is thinking...")
     start_time = time.time()
+
+    # The first message of a conversation doesn't depend on earlier turns
+    opener = session is None or not session.turn_count
+    if opener:
+        with metrics.span("cache_lookup"):
+            cached = reply_cache.lookup(transcript)
+        if cached:
+            print("   -> 💾 Opener answered from the response cache, skipping the LLM")
+            if session and remember:
+                session.add_turn(transcript, cached)
+            yield cached
+            return
     
     # --- MODIFIED SYSTEM PROMPT ---
     system_prompt = (
@@ -36,12 +99,16 @@ def stream_llm_response(transcript: str):
         "Keep your responses concise and thoughtful, typically 1-2 sentences."
     )
     
+    tokens = None
+    finished = False
     try:
-        # Use optimized parameters for faster generation
-        stream = replicate.stream(
+        # Use optimized parameters for faster generation. Each attempt is a
+        # prediction we create ourselves (rather than replicate.stream), so it
+        # can be cancelled on barge-in, or when a hedged request wins.
+        tokens = resilience.hedged_stream(resilience.replicate_stream(
             LLAMA3_8B_INSTRUCT,
-            input={
-                "prompt": transcript,
+            {
+                "prompt": session.build_prompt(transcript) if session else transcript,
                 "system_prompt": system_prompt,
                 "max_new_tokens": 100,  # Reduced for faster responses
                 "temperature": 0.7,
@@ -49,19 +116,41 @@ def stream_llm_response(transcript: str):
                 "top_k": 50,
                 "stop_sequences": ["\n\n"],  # Stop at double newlines
             },
-        )
+        ), cancel_event=cancel_event)
         
         response_started = False
-        for event in stream:
+        parts = []
+        for event in tokens:
             if not response_started:
                 think_time = time.time() - start_time
                 print(f"   -> Response started in {think_time:.1f}s")
+                metrics.record("llm_first_token", start_time)
                 response_started = True
+            parts.append(str(event))
             yield str(event)
+        
+        if cancel_event is not None and cancel_event.is_set():
+            return  # cut short: not a reply to remember
+        finished = True
+        metrics.record("llm_complete", start_time)
+        if remember and parts:
+            # Speculative runs (remember=False) answer an interim transcript and may be discarded
+            if opener:
+                reply_cache.add(transcript, "".join(parts))
+            if session:
+                session.add_turn(transcript, "".join(parts))
             
     except Exception as e:
+        finished = True
         print(f"   -> Error generating response: {e}")
+        if not remember:
+            raise
         yield "Sorry, I encountered an error. Please try again."
+    finally:
+        # Closed early (e.g. the user interrupted): cancelling the predictions stops paying for the rest
+        if tokens is not None and not finished:
+            tokens.close()
+            print("   -> LLM generation cancelled")
 
 async def main_conversation_loop():
     """
@@ -72,97 +161,160 @@ async def main_conversation_loop():
     print("   - Speak clearly and naturally")
     print("   - Press Ctrl+C to exit")
     print("   - Each conversation cycle is optimized for speed")
+    if DUPLEX_MODE:
+        print("   - Duplex mode: just start talking to interrupt the AI")
     print("="*60)
     
     conversation_count = 0
+    session = session_memory.Session("terminal")
+    traces = deque(maxlen=TRACE_EXPORT_TURNS)
     
-    while True:
-        conversation_count += 1
-        print(f"\n{'='*20} Conversation #{conversation_count} {'='*20}")
-        
-        try:
-            # 1. Listen for user speech (Module 1)
-            print("👂 Listening for your voice...")
-            listen_start = time.time()
-            
-            user_transcript = await module1_ears.listen_for_speech()
+    # One microphone + Deepgram connection for the whole conversation
+    listener = module1_ears.Listener()
+    await listener.start()
+    
+    # Speculation builds on the session but only records a turn once it is accepted
+    speculator = speculation.Speculator(
+        lambda text, cancel_event: stream_llm_response(text, session, remember=False, cancel_event=cancel_event)
+    )
+    
+    try:
+        while True:
+            conversation_count += 1
+            print(f"\n{'='*20} Conversation #{conversation_count} {'='*20}")
             
-            if user_transcript and user_transcript.strip():
-                listen_time = time.time() - listen_start
-                print(f"🗣️ You said: \"{user_transcript}\"")
-                print(f"   -> Speech captured in {listen_time:.1f}s")
-                
-                # 2. Get streaming response from LLM (Module 2)
-                print("🤖 AI responding...")
-                
-                llm_response_stream = stream_llm_response(user_transcript)
-                
-                # 3. Stream the response through voice (Module 3)
-                module3_voice.speak_text_stream(llm_response_stream)
-                
-                total_time = time.time() - listen_start
-                print(f"   -> Total conversation cycle: {total_time:.1f}s")
+            try:
+                # 1. Listen for user speech (Module 1)
+                print("👂 Listening for your voice...")
+                listen_start = time.time()
                 
-            else:
-                print("❌ No clear speech detected. Please try again.")
-                print("💡 Tip: Speak clearly and wait for the listening prompt")
+                watcher = asyncio.create_task(speculator.watch(listener)) if SPECULATIVE_MODE else None
+                try:
+                    user_transcript = await listener.next_utterance()
+                finally:
+                    if watcher:
+                        watcher.cancel()
                 
-        except KeyboardInterrupt:
-            print("\n👋 Conversation ended by user")
-            break
-        except Exception as e:
-            print(f"❌ Unexpected error: {e}")
-            print("🔄 Continuing conversation... (Press Ctrl+C to exit)")
-            continue
+                if user_transcript and user_transcript.strip():
+                    trace = metrics.start_trace(f"turn {conversation_count}")
+                    if listener.speech_ended_at and listener.final_at:
+                        metrics.record("stt", listener.speech_ended_at, listener.final_at)
+                    listen_time = time.time() - listen_start
+                    print(f"🗣️ You said: \"{user_transcript}\"")
+                    print(f"   -> Speech captured in {listen_time:.1f}s")
+                    
+                    if not DUPLEX_MODE:
+                        # Don't transcribe the avatar's own voice while it speaks
+                        listener.pause()
+                    
+                    # 2. Get streaming response from LLM (Module 2)
+                    print("🤖 AI responding...")
+                    
+                    cancel_event = threading.Event()
+                    speculative = speculator.take(user_transcript) if SPECULATIVE_MODE else None
+                    if speculative:
+                        print("   -> 🔮 Speculation hit, reusing the early response")
+                        llm_response_stream = speculative.tokens()
+                    else:
+                        llm_response_stream = stream_llm_response(user_transcript, session,
+                                                                  cancel_event=cancel_event)
+                    
+                    # 3. Speak the response sentence by sentence (Module 3),
+                    # off the event loop so the listener's keepalives keep running
+                    listener.speech_detected.clear()
+                    speaking = asyncio.create_task(asyncio.to_thread(
+                        module3_voice.speak_text_stream_chunked,
+                        llm_response_stream,
+                        filler_audio=bank.filler_audio(),
+                        cached_audio=bank.matched_audio,
+                        cancel_event=cancel_event,
+                    ))
+                    
+                    if DUPLEX_MODE:
+                        barge_in = asyncio.create_task(listener.speech_detected.wait())
+                        await asyncio.wait({speaking, barge_in}, return_when=asyncio.FIRST_COMPLETED)
+                        if not speaking.done():
+                            # The new utterance is picked up by the next next_utterance()
+                            print("\n✋ You started speaking - stopping the reply")
+                            cancel_event.set()
+                            if speculative:
+                                speculative.cancel()
+                        barge_in.cancel()
+                    await speaking
+                    
+                    # A speculation that failed or was cut short isn't a reply to remember
+                    if speculative and speculative.finished and speculative.error is None:
+                        session.add_turn(user_transcript, speculative.reply())
+                    if SPECULATIVE_MODE:
+                        spec = speculator.stats()
+                        print(f"   -> Speculation: {spec['hits']} hits / {spec['wasted']} wasted "
+                              f"of {spec['started']} (hit rate {spec['hit_rate']})")
+                    
+                    total_time = time.time() - listen_start
+                    metrics.record("turn", trace.started_at)
+                    print(f"   -> Total conversation cycle: {total_time:.1f}s (trace {trace.id})")
+                    if TRACE_EXPORT:
+                        traces.append(trace)
+                        metrics.export_chrome_trace(traces, TRACE_EXPORT)
+                    mic = listener.stats()
+                    print(f"   -> Mic: queue {mic['queue_depth']} (max {mic['max_queue_depth']}), "
+                          f"dropped {mic['dropped_chunks']}, send avg {mic['avg_send_ms']}ms / max {mic['max_send_ms']}ms")
+                    if module3_voice.player:
+                        playback = module3_voice.player.stats()
+                        print(f"   -> Playback: {playback['underruns']} underruns ({playback['underrun_seconds']}s) "
+                              f"over {playback['replies']} replies")
+                    
+                else:
+                    print("❌ No clear speech detected. Please try again.")
+                    print("💡 Tip: Speak clearly and wait for the listening prompt")
+                    
+            except KeyboardInterrupt:
+                print("\n👋 Conversation ended by user")
+                break
+            except Exception as e:
+                print(f"❌ Unexpected error: {e}")
+                print("🔄 Continuing conversation... (Press Ctrl+C to exit)")
+                continue
+    finally:
+        await listener.close()
     
     print("\n✨ Thanks for chatting! Goodbye!")
 
-def test_all_modules():
+def test_all_modules(full=False):
     """
-    Test all modules to ensure they're working properly.
+    Check every provider concurrently with a cheap authenticated request
+    (results are cached, see health.py). With `full`, probe again regardless
+    of the cache and also synthesize a test clip.
     """
-    print("🧪 Testing all modules...")
+    print("🧪 Checking providers...")
+    start_time = time.time()
+    results = health.checks.check(force=full)
     
-    # Test API connections
-    print("\n1. Testing Replicate API...")
-    try:
-        # A simple call to list models to verify the API key is working
-        list(replicate.models.list())
-        print("   ✅ Replicate API connected")
-    except Exception as e:
-        print(f"   ❌ Replicate API error: {e}")
-        return False
+    def show(label, result):
+        source = "cached" if result['cached'] else f"{result['latency_ms']}ms"
+        if result['ok']:
+            print(f"   ✅ {label} connected ({source})")
+        else:
+            print(f"   ❌ {label}: {result['detail']}")
     
-    print("\n2. Testing ElevenLabs API...")
+    show("Replicate API", results['replicate'])
     if not os.getenv("ELEVENLABS_API_KEY"):
         print("   ⚠️ ELEVENLABS_API_KEY not set - audio will be text-only")
     else:
-        try:
-            import module3_voice
-            success = module3_voice.test_audio_generation()
-            if success:
-                print("   ✅ ElevenLabs API connected")
-            else:
-                print("   ❌ ElevenLabs API test failed")
-        except Exception as e:
-            print(f"   ❌ ElevenLabs API error: {e}")
+        show("ElevenLabs API", results['elevenlabs'])
+        if full and results['elevenlabs']['ok'] and not module3_voice.test_audio_generation():
+            print("   ❌ ElevenLabs API test failed")
+    show("Deepgram API", results['deepgram'])
     
-    print("\n3. Testing Deepgram API...")
-    if not os.getenv("DEEPGRAM_API_KEY"):
-        print("   ❌ DEEPGRAM_API_KEY not set - speech recognition won't work")
-        return False
-    else:
-        print("   ✅ DEEPGRAM_API_KEY configured")
-    
-    print("\n✅ Module testing complete!")
-    return True
+    print(f"   -> Checks finished in {time.time() - start_time:.2f}s")
+    return results['replicate']['ok'] and results['deepgram']['ok']
 
 if __name__ == "__main__":
     try:
         print("🚀 AI Avatar Terminal - Starting Up...")
         
         # Test all modules first
-        if not test_all_modules():
+        if STARTUP_CHECKS != "off" and not test_all_modules(full=STARTUP_CHECKS == "full"):
             print("\n❌ Some modules failed testing. Please check your API keys.")
             print("💡 Make sure your .env file contains:")
             print("   - REPLICATE_API_TOKEN")
@@ -170,8 +322,13 @@ if __name__ == "__main__":
             print("   - DEEPGRAM_API_KEY")
             exit(1)
         
+        if os.getenv("ELEVENLABS_API_KEY"):
+            # Import the TTS SDK off the critical path, before the first reply needs it
+            threading.Thread(target=module3_voice.elevenlabs_client, daemon=True).start()
+            # Missing phrases render in the background; fillers are skipped until they exist
+            threading.Thread(target=bank.warm_up, args=(render_phrase_audio,), daemon=True).start()
+        
         print("\n🎉 All systems ready! Starting conversation...")
-        time.sleep(1)
         
         # Run the optimized conversation loop
         asyncio.run(main_conversation_loop())
@@ -0,0 +1,171 @@
+# --- metrics.py: per-stage latency histograms, request traces and exporters ---
+#
+# Every timed stage (stt, llm_first_token, llm_complete, tts, cache_lookup,
+# video, ...) is observed into one histogram labelled by stage, rendered in
+# the Prometheus text format for /metrics. Spans are also attached to the
+# current trace (one per request or terminal turn), which can be exported as
+# Chrome trace JSON (chrome://tracing, ui.perfetto.dev).
+
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency buckets; SadTalker runs land in the top ones
+STAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0,
+                 8.0, 13.0, 20.0, 30.0, 60.0, 120.0)
+# How far back "current" latency looks (admission control, /status)
+RECENT_WINDOW_SECONDS = 60
+RECENT_MAX_SAMPLES = 2048
+
+class Histogram:
+    """Thread-safe cumulative histogram keyed by a label tuple."""
+    def __init__(self, name, help_text, label_names, buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            series = self.series.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def summary(self):
+        """{label: {'count', 'mean'}} for /status."""
+        with self.lock:
+            return {
+                ",".join(labels): {
+                    'count': series[len(self.buckets)],
+                    'mean': round(series[-1] / series[len(self.buckets)], 3),
+                }
+                for labels, series in self.series.items()
+            }
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, series in sorted(self.series.items()):
+                pairs = [f'{name}="{value}"' for name, value in zip(self.label_names, labels)]
+                for bound, count in zip(self.buckets + ("+Inf",), series):
+                    le = ",".join(pairs + [f'le="{bound}"'])
+                    lines.append(f"{self.name}_bucket{{{le}}} {count}")
+                label_text = "{" + ",".join(pairs) + "}" if pairs else ""
+                lines.append(f"{self.name}_sum{label_text} {series[-1]:.6f}")
+                lines.append(f"{self.name}_count{label_text} {series[len(self.buckets)]}")
+        return "\n".join(lines)
+
+stage_seconds = Histogram(
+    "avatar_stage_seconds", "Latency of each pipeline stage in seconds.", ["stage"]
+)
+
+class RecentLatency:
+    """The last `window` seconds of observations per stage, for percentiles of the current load."""
+    def __init__(self, window=RECENT_WINDOW_SECONDS, max_samples=RECENT_MAX_SAMPLES):
+        self.window = window
+        self.max_samples = max_samples
+        self.samples = {}  # stage -> deque of (observed at, seconds), oldest first
+        self.lock = threading.Lock()
+
+    def observe(self, stage, value, at=None):
+        with self.lock:
+            samples = self.samples.setdefault(stage, deque(maxlen=self.max_samples))
+            samples.append((time.time() if at is None else at, value))
+
+    def percentile(self, stage, pct):
+        """The `pct`th percentile of `stage` over the window, or None without recent samples."""
+        cutoff = time.time() - self.window
+        with self.lock:
+            samples = self.samples.get(stage)
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+            values = sorted(value for _, value in samples) if samples else []
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+recent = RecentLatency()
+
+class Trace:
+    """Spans of one web request or terminal turn, identified by a trace id."""
+    def __init__(self, name, trace_id=None):
+        self.name = name
+        self.id = trace_id or uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.spans = []  # (stage, start, end, thread id)
+        self.lock = threading.Lock()
+
+    def add(self, stage, start, end):
+        with self.lock:
+            self.spans.append((stage, start, end, threading.get_ident()))
+
+    def to_chrome_events(self, pid=1):
+        """Complete ("X") events in microseconds, as chrome://tracing expects."""
+        with self.lock:
+            spans = list(self.spans)
+        # Spans may start before the trace did (e.g. STT ends where the turn begins)
+        first = min([start for _, start, _, _ in spans] + [self.started_at])
+        last = max([end for _, _, end, _ in spans] + [self.started_at])
+        events = [{
+            'name': self.name, 'cat': 'trace', 'ph': 'X', 'pid': pid, 'tid': 0,
+            'ts': int(first * 1e6), 'dur': int((last - first) * 1e6),
+            'args': {'trace_id': self.id},
+        }]
+        for stage, start, end, tid in spans:
+            events.append({
+                'name': stage, 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': int(start * 1e6), 'dur': int((end - start) * 1e6),
+                'args': {'trace_id': self.id},
+            })
+        return events
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+def start_trace(name, trace_id=None):
+    """Begin a trace and make it current for this thread/task (and contexts copied from it)."""
+    trace = Trace(name, trace_id)
+    _current_trace.set(trace)
+    return trace
+
+def current_trace():
+    return _current_trace.get()
+
+def record(stage, start, end=None, trace=None):
+    """Observe a stage that ran from `start` to `end` (default: now), both time.time() values."""
+    end = time.time() if end is None else end
+    stage_seconds.observe(max(0.0, end - start), stage)
+    recent.observe(stage, max(0.0, end - start), end)
+    trace = trace or current_trace()
+    if trace is not None:
+        trace.add(stage, start, end)
+    return end - start
+
+@contextmanager
+def span(stage, trace=None):
+    """Time the enclosed block as `stage`, even if it raises."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(stage, start, trace=trace)
+
+def render_prometheus():
+    return stage_seconds.render() + "\n"
+
+def export_chrome_trace(traces, path):
+    """Write traces as a Chrome trace JSON file (written to a temp file, then renamed)."""
+    events = [event for trace in traces for event in trace.to_chrome_events()]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,492 @@
+# --- mic_replay.py: record microphone sessions and replay them without a sound card ---
+#
+# With MIC_RECORD=path, the Microphone writes every captured chunk to a
+# compact binary file, and the Listener writes every Deepgram transcript
+# event. Each entry is stamped with its offset from the start of capture.
+# With MIC_REPLAY=path, the Microphone reads those chunks back instead of
+# opening pyaudio, paced at the recorded times and sped up by
+# MIC_REPLAY_SPEED, so the capture, VAD and endpointing path runs headless.
+# The audio goes to Deepgram as usual, or, with MIC_REPLAY_STT=local, to a
+# websocket stand-in on localhost. The stand-in speaks Deepgram's live
+# protocol and answers with the recorded transcript events.
+#
+#   MIC_RECORD=session.mic python main_orchestrator.py
+#   python mic_replay.py info session.mic
+#   python mic_replay.py replay session.mic --speed 4 --stt local
+
+import os
+import sys
+import json
+import time
+import atexit
+import struct
+import asyncio
+import argparse
+import threading
+
+# --- Configuration ---
+MIC_RECORD = os.getenv("MIC_RECORD", "")
+MIC_REPLAY = os.getenv("MIC_REPLAY", "")
+# 1 = real time, 4 = four times faster
+MIC_REPLAY_SPEED = float(os.getenv("MIC_REPLAY_SPEED", "1"))
+# "local" answers from the recorded transcript events, "deepgram" sends the audio to Deepgram
+MIC_REPLAY_STT = os.getenv("MIC_REPLAY_STT", "local")
+# A Finalize is answered with a recorded final due at most this many recorded seconds later
+FINALIZE_LOOKAHEAD = float(os.getenv("MIC_REPLAY_FINALIZE_LOOKAHEAD", "1.5"))
+# Recorded seconds to keep listening after the last chunk, for late transcripts
+REPLAY_TAIL_SECONDS = 2.0
+STAND_IN_POLL_SECONDS = 0.005
+
+# --- File format ---
+# Header, then records of (kind, offset seconds, payload length) + payload.
+# Audio payloads are raw 16-bit PCM; transcript payloads are small JSON objects.
+MAGIC = b"MICR"
+VERSION = 1
+HEADER = struct.Struct("<4sHIHH")   # magic, version, rate, channels, frames per chunk
+RECORD = struct.Struct("<cdI")      # kind, offset, payload length
+AUDIO = b"A"
+TRANSCRIPT = b"T"
+
+class MicRecorder:
+    """
+    Writes timestamped audio chunks and transcript events to a recording
+    file. `clock` gives the offsets; by default, seconds since it was opened.
+    """
+    def __init__(self, path, rate, channels, chunk, clock=None):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, rate, channels, chunk))
+        started_at = time.perf_counter()
+        self.clock = clock or (lambda: time.perf_counter() - started_at)
+        self.lock = threading.Lock()
+        self.chunks = 0
+        self.events = 0
+
+    def audio(self, data):
+        """Store one captured chunk (called from the capture thread)."""
+        if self._write(AUDIO, data):
+            self.chunks += 1
+
+    def transcript(self, result):
+        """Store a Deepgram transcript result, keeping only the fields replay needs."""
+        alternative = result.channel.alternatives[0]
+        event = {
+            'transcript': alternative.transcript,
+            'confidence': getattr(alternative, "confidence", 0.0),
+            'is_final': bool(result.is_final),
+            'speech_final': bool(result.speech_final),
+            'from_finalize': bool(getattr(result, "from_finalize", False)),
+            'start': getattr(result, "start", 0.0),
+            'duration': getattr(result, "duration", 0.0),
+        }
+        # Flushed right away, so a crash loses at most the audio after the last event
+        if self._write(TRANSCRIPT, json.dumps(event).encode(), flush=True):
+            self.events += 1
+
+    def _write(self, kind, payload, flush=False):
+        with self.lock:
+            if self.file is None:
+                return False
+            self.file.write(RECORD.pack(kind, self.clock(), len(payload)))
+            self.file.write(payload)
+            if flush:
+                self.file.flush()
+            return True
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.close()
+            self.file = None
+        print(f"🎙️ Recorded {self.chunks} audio chunks and {self.events} transcript events to {self.path}")
+
+class Recording:
+    """A recording in memory: audio as [(offset, pcm)] and transcript events as [(offset, event)]."""
+    def __init__(self, rate, channels, chunk, audio, events, path=None):
+        self.rate = rate
+        self.channels = channels
+        self.chunk = chunk
+        self.audio = audio
+        self.events = events
+        self.path = path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            raise ValueError(f"{path} is not a microphone recording")
+        magic, version, rate, channels, chunk = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} microphone recording")
+        audio, events = [], []
+        pos = HEADER.size
+        while pos + RECORD.size <= len(data):
+            kind, offset, length = RECORD.unpack_from(data, pos)
+            pos += RECORD.size
+            if pos + length > len(data):
+                break  # cut short by a crash; keep what is complete
+            payload = data[pos:pos + length]
+            pos += length
+            if kind == AUDIO:
+                audio.append((offset, payload))
+            elif kind == TRANSCRIPT:
+                events.append((offset, json.loads(payload)))
+        return cls(rate, channels, chunk, audio, events, path)
+
+    @property
+    def duration(self):
+        return self.audio[-1][0] if self.audio else 0.0
+
+    def endpoints(self):
+        """Offsets at which the recorded session handed out an utterance (a final that ended speech)."""
+        offsets, heard = [], False
+        for offset, event in self.events:
+            if event['is_final'] and event['transcript']:
+                heard = True
+            if event['is_final'] and (event['speech_final'] or event['from_finalize']) and heard:
+                offsets.append(offset)
+                heard = False
+        return offsets
+
+class ReplayStream:
+    """
+    Reads a Recording's audio like a pyaudio input stream, sleeping until
+    each chunk's recorded offset (divided by `speed`).
+    Stopping freezes the recording's clock, so the next Microphone carries
+    on where the last one stopped instead of catching up.
+    """
+    def __init__(self, recording, speed=MIC_REPLAY_SPEED):
+        if speed <= 0:
+            raise ValueError(f"replay speed must be positive, not {speed}")
+        self.recording = recording
+        self.speed = speed
+        self.index = 0
+        self.offset = 0.0       # recorded offset of the last chunk read
+        self.anchor = None      # perf_counter() at recorded offset 0, None while stopped
+        self.ended_at = None
+        self.lock = threading.Lock()
+
+    def read(self, num_frames, exception_on_overflow=True):
+        if self.index >= len(self.recording.audio):
+            raise IOError("end of recording")
+        offset, data = self.recording.audio[self.index]
+        now = time.perf_counter()
+        if self.anchor is None:
+            self.anchor = now - self.offset / self.speed
+        delay = self.anchor + offset / self.speed - now
+        if delay > 0:
+            time.sleep(delay)
+        with self.lock:
+            self.index += 1
+            self.offset = offset
+            if self.index == len(self.recording.audio):
+                self.ended_at = time.perf_counter()
+        return data
+
+    def position(self):
+        """Recorded offset the replay has reached; keeps running after the last chunk."""
+        with self.lock:
+            if self.ended_at is None:
+                return self.offset
+            return self.offset + (time.perf_counter() - self.ended_at) * self.speed
+
+    def is_active(self):
+        return self.index < len(self.recording.audio)
+
+    def stop_stream(self):
+        self.anchor = None
+
+    def close(self):
+        pass
+
+def results_message(event):
+    """A Deepgram live "Results" message carrying a recorded transcript event."""
+    return json.dumps({
+        'type': "Results",
+        'channel_index': [0, 1],
+        'duration': event['duration'],
+        'start': event['start'],
+        'is_final': event['is_final'],
+        'speech_final': event['speech_final'],
+        'from_finalize': event['from_finalize'],
+        'channel': {'alternatives': [
+            {'transcript': event['transcript'], 'confidence': event['confidence'], 'words': []},
+        ]},
+        'metadata': {
+            'request_id': "replay",
+            'model_info': {'name': "replay", 'version': "", 'arch': ""},
+            'model_uuid': "",
+        },
+    })
+
+class DeepgramStandIn:
+    """
+    Local websocket server that speaks enough of Deepgram's live protocol to
+    replace it during a replay: binary audio, KeepAlive, Finalize and
+    CloseStream come in, and "Results" messages go out.
+
+    Each recorded transcript event is sent once `clock()` (the replay
+    position) reaches its recorded offset. A Finalize gets the next recorded
+    final right away, flagged from_finalize, if that final is due within
+    `lookahead` seconds. Otherwise it gets an empty final, which is what
+    Deepgram sends when nothing is pending. Events are used up across
+    reconnects, so no event is sent twice.
+    """
+    def __init__(self, events, clock, rate=16000, lookahead=FINALIZE_LOOKAHEAD, host="127.0.0.1"):
+        self.events = events
+        self.clock = clock
+        self.rate = rate
+        self.lookahead = lookahead
+        self.host = host
+        self.next_event = 0
+        self.url = None
+        self.loop = None
+        self.runner = None
+        # Totals for stats()
+        self.connections = 0
+        self.audio_bytes = 0
+        self.sent = 0
+        self.finalizes = 0
+        self.finalize_hits = 0
+
+    async def start(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get("/v1/listen", self._handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, 0).start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://{self.host}:{port}"
+        self.loop = asyncio.get_running_loop()
+        print(f"   -> 🔁 Deepgram stand-in replaying {len(self.events)} transcript events on {self.url}")
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def _handle(self, request):
+        from aiohttp import web, WSMsgType
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        sender = asyncio.create_task(self._send_events(ws))
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.BINARY:
+                    self.audio_bytes += len(msg.data)
+                elif msg.type == WSMsgType.TEXT:
+                    try:
+                        kind = json.loads(msg.data).get("type")
+                    except ValueError:
+                        continue
+                    if kind == "Finalize":
+                        await self._finalize(ws)
+                    elif kind == "CloseStream":
+                        break
+        finally:
+            sender.cancel()
+            await ws.close()
+        return ws
+
+    async def _send_events(self, ws):
+        while True:
+            if self.next_event < len(self.events) and self.events[self.next_event][0] <= self.clock():
+                _, event = self.events[self.next_event]
+                self.next_event += 1
+                await self._send(ws, event)
+            else:
+                await asyncio.sleep(STAND_IN_POLL_SECONDS)
+
+    async def _finalize(self, ws):
+        self.finalizes += 1
+        due = self.clock() + self.lookahead
+        for i in range(self.next_event, len(self.events)):
+            offset, event = self.events[i]
+            if offset > due:
+                break
+            if event['is_final']:
+                # Interim results before this final are superseded by it
+                self.next_event = i + 1
+                self.finalize_hits += 1
+                await self._send(ws, dict(event, from_finalize=True))
+                return
+        await self._send(ws, {
+            'transcript': "", 'confidence': 0.0, 'is_final': True, 'speech_final': False,
+            'from_finalize': True, 'start': 0.0, 'duration': 0.0,
+        })
+
+    async def _send(self, ws, event):
+        if not ws.closed:
+            await ws.send_str(results_message(event))
+            self.sent += 1
+
+    def stats(self):
+        return {
+            'connections': self.connections,
+            'audio_seconds_received': round(self.audio_bytes / 2 / self.rate, 2),
+            'events_sent': self.sent,
+            'events_left': len(self.events) - self.next_event,
+            'finalizes': self.finalizes,
+            'finalize_hits': self.finalize_hits,
+        }
+
+class Replay:
+    """
+    One replayed recording per process: the stream every Microphone reads
+    from and, with stt="local", the Deepgram stand-in answering it.
+    """
+    def __init__(self, path, speed=MIC_REPLAY_SPEED, stt=MIC_REPLAY_STT):
+        self.recording = Recording.load(path)
+        self.stream = ReplayStream(self.recording, speed)
+        self.speed = speed
+        self.stt = stt
+        self.stand_in = None
+        if stt == "local" and not self.recording.events:
+            print(f"   -> ⚠️  {path} has no transcript events, the local stand-in will stay silent")
+
+    async def stt_url(self):
+        """URL for DeepgramClientOptions, or None to use Deepgram itself."""
+        if self.stt != "local":
+            return None
+        if self.stand_in is None or self.stand_in.loop is not asyncio.get_running_loop():
+            self.stand_in = DeepgramStandIn(self.recording.events, self.stream.position, self.recording.rate)
+            await self.stand_in.start()
+        return self.stand_in.url
+
+_replay = None
+_recorder = None
+_lock = threading.Lock()
+
+def replay():
+    """The replay named by MIC_REPLAY (loaded once per process), or None for live capture."""
+    global _replay
+    if not MIC_REPLAY:
+        return None
+    with _lock:
+        if _replay is None:
+            _replay = Replay(MIC_REPLAY)
+        return _replay
+
+def recorder(rate, channels, chunk, source=None):
+    """
+    The MicRecorder writing to MIC_RECORD, or None when not recording. One
+    per process, so consecutive Microphones append to the same recording.
+    Re-recording a replay (`source`, else MIC_REPLAY's) keeps the replayed
+    timeline, whatever the speed.
+    """
+    global _recorder
+    if not MIC_RECORD:
+        return None
+    source = source or replay()
+    with _lock:
+        if _recorder is None:
+            clock = source.stream.position if source else None
+            _recorder = MicRecorder(MIC_RECORD, rate, channels, chunk, clock)
+            atexit.register(_recorder.close)
+        return _recorder
+
+# --- Command line ---
+
+def print_info(path):
+    recording = Recording.load(path)
+    finals = sum(1 for _, event in recording.events if event['is_final'])
+    print(f"🎙️ {path}: {recording.duration:.1f}s at {recording.rate} Hz, "
+          f"{len(recording.audio)} chunks of {recording.chunk} frames")
+    print(f"   -> {len(recording.events)} transcript events ({finals} final), "
+          f"{len(recording.endpoints())} utterances")
+    for offset, event in recording.events:
+        if event['is_final'] and event['transcript']:
+            flags = " speech_final" * event['speech_final'] + " from_finalize" * event['from_finalize']
+            print(f"   {offset:7.2f}s {event['transcript']}{flags}")
+
+async def replay_listener(path, speed, stt, use_vad):
+    """Runs a Listener over a recording and reports when each utterance was handed out."""
+    import module1_ears
+
+    # Passed in rather than set as module globals: run as a script, this
+    # module is __main__, and module1_ears has its own copy of it
+    source = Replay(path, speed, stt)
+    stream = source.stream
+    recorded = source.recording.endpoints()
+    utterances = []
+
+    listener = module1_ears.Listener(use_vad=use_vad, replay=source)
+    await listener.start()
+
+    async def collect():
+        while True:
+            text = await listener.next_utterance()
+            utterances.append((text, stream.position(), listener.final_at - listener.speech_ended_at))
+
+    collector = asyncio.create_task(collect())
+    while stream.ended_at is None:
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(REPLAY_TAIL_SECONDS / speed)
+    collector.cancel()
+    stats = listener.stats()
+    await listener.close()
+
+    print(f"\n🔁 Replayed {path} at {speed}x ({stt} STT, VAD {'on' if use_vad else 'off'})")
+    for i, (text, position, stt_seconds) in enumerate(utterances):
+        line = f"   {position:7.2f}s  stt {stt_seconds * 1000:5.0f}ms  {text}"
+        if i < len(recorded):
+            line += f"  (recorded at {recorded[i]:.2f}s, {position - recorded[i]:+.2f}s)"
+        print(line)
+    print(f"   -> {len(utterances)} utterances (recorded: {len(recorded)})")
+    print(f"   -> Mic: {json.dumps(stats)}")
+    if source.stand_in:
+        print(f"   -> Stand-in: {json.dumps(source.stand_in.stats())}")
+        await source.stand_in.stop()
+
+async def record_listener(path):
+    """Runs a Listener on the real microphone, recording until Ctrl+C."""
+    import module1_ears
+
+    target = MicRecorder(path, module1_ears.RATE, module1_ears.CHANNELS, module1_ears.CHUNK)
+    listener = module1_ears.Listener(recorder=target)
+    try:
+        await listener.start()
+        while True:
+            print(f"\n🗣️ {await listener.next_utterance()}")
+    finally:
+        await listener.close()
+        target.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and replay microphone sessions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="record the microphone and Deepgram's transcripts")
+    record.add_argument("path")
+    info = commands.add_parser("info", help="summarize a recording")
+    info.add_argument("path")
+    replay_cmd = commands.add_parser("replay", help="run the listener over a recording")
+    replay_cmd.add_argument("path")
+    replay_cmd.add_argument("--speed", type=float, default=MIC_REPLAY_SPEED, help="1 = real time, 4 = four times faster")
+    replay_cmd.add_argument("--stt", choices=["local", "deepgram"], default=MIC_REPLAY_STT)
+    replay_cmd.add_argument("--no-vad", action="store_true", help="send all audio and rely on Deepgram's endpointing")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "info":
+            print_info(args.path)
+        elif args.command == "record":
+            asyncio.run(record_listener(args.path))
+        else:
+            asyncio.run(replay_listener(args.path, args.speed, args.stt, not args.no_vad))
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
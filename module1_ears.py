@@ -2,8 +2,12 @@ import asyncio
 import os
 import sys
 import threading
+import time
+from collections import deque
 from dotenv import load_dotenv
 import pyaudio
+import vad
+import mic_replay
 from deepgram import (
     DeepgramClient,
     DeepgramClientOptions,
@@ -21,6 +25,43 @@ CHANNELS = 1
 RATE = 16000
 CHUNK = 1024
 
+# --- Capture Buffer Configuration ---
+# Chunks held between the capture thread and the event loop (~4s at 64ms/chunk)
+MIC_RING_CHUNKS = int(os.getenv("MIC_RING_CHUNKS", "64"))
+# Wait for at least this many chunks before sending, and send at most MAX per call
+MIC_BATCH_CHUNKS = int(os.getenv("MIC_BATCH_CHUNKS", "1"))
+MIC_MAX_BATCH_CHUNKS = int(os.getenv("MIC_MAX_BATCH_CHUNKS", "8"))
+# What to do when the ring is full: "drop_oldest" or "drop_newest"
+MIC_OVERFLOW_POLICY = os.getenv("MIC_OVERFLOW_POLICY", "drop_oldest")
+
+# --- Persistent Listener Configuration ---
+KEEPALIVE_INTERVAL = 5          # seconds; Deepgram closes idle sockets after ~10s
+RECONNECT_MAX_DELAY = 10        # seconds between reconnect attempts, at most
+# Audio kept while the connection is down, replayed once it is back (~10s)
+BACKLOG_CHUNKS = RATE * 10 // CHUNK
+# Words an interim transcript needs before it counts as the user speaking (barge-in)
+BARGE_IN_MIN_WORDS = int(os.getenv("BARGE_IN_MIN_WORDS", "1"))
+# Gate silence locally and end utterances before Deepgram's endpoint fires
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") == "1"
+# The VAD gates the silence Deepgram's endpointing needs, so if no from_finalize
+# result answers our finalize() within this long, the utterance ends anyway
+FINALIZE_TIMEOUT_MS = int(os.getenv("FINALIZE_TIMEOUT_MS", "1000"))
+
+def live_options():
+    return LiveOptions(
+        model="nova-2", language="en-US", smart_format=True,
+        encoding="linear16", channels=1, sample_rate=RATE,
+        interim_results=True, endpointing="500", utterance_end_ms="1000",
+    )
+
+async def deepgram_client(replay=None):
+    """Deepgram client, pointed at the local stand-in when replaying (`replay` or MIC_REPLAY) with local STT."""
+    replay = replay or mic_replay.replay()
+    url = await replay.stt_url() if replay else None
+    if url:
+        return DeepgramClient(DEEPGRAM_API_KEY or "replay", DeepgramClientOptions(verbose=0, url=url))
+    return DeepgramClient(DEEPGRAM_API_KEY, DeepgramClientOptions(verbose=0))
+
 class TranscriptCollector:
     def __init__(self):
         self.reset()
@@ -34,24 +75,107 @@ class TranscriptCollector:
     def get_full_transcript(self):
         return ' '.join(self.transcript_parts)
 
+class FrameRing:
+    """
+    Fixed-size ring of audio chunks between the capture thread and the event loop.
+    All memory is allocated up front; when full, `policy` decides whether the
+    oldest queued chunk or the incoming one is dropped.
+    """
+    def __init__(self, capacity, chunk_bytes, policy=MIC_OVERFLOW_POLICY):
+        self.capacity = capacity
+        self.chunk_bytes = chunk_bytes
+        self.policy = policy
+        self.buffer = bytearray(capacity * chunk_bytes)
+        self.lengths = [0] * capacity
+        self.head = 0   # index of the oldest chunk
+        self.count = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.lock = threading.Lock()
+
+    def push(self, data):
+        """Store one chunk; returns True if the ring was empty before (reader may be idle)."""
+        data = data[:self.chunk_bytes]
+        with self.lock:
+            was_empty = self.count == 0
+            if self.count == self.capacity:
+                self.dropped += 1
+                if self.policy == "drop_newest":
+                    return False
+                self.head = (self.head + 1) % self.capacity
+                self.count -= 1
+            slot = (self.head + self.count) % self.capacity
+            start = slot * self.chunk_bytes
+            self.buffer[start:start + len(data)] = data
+            self.lengths[slot] = len(data)
+            self.count += 1
+            self.max_depth = max(self.max_depth, self.count)
+            return was_empty
+
+    def pop_batch(self, max_chunks):
+        """Remove up to `max_chunks` of the oldest chunks and return them as one bytes object."""
+        with self.lock:
+            n = min(max_chunks, self.count)
+            view = memoryview(self.buffer)
+            parts = []
+            for i in range(n):
+                slot = (self.head + i) % self.capacity
+                start = slot * self.chunk_bytes
+                parts.append(view[start:start + self.lengths[slot]])
+            data = b"".join(parts)
+            self.head = (self.head + n) % self.capacity
+            self.count -= n
+            return data
+
+    def __len__(self):
+        return self.count
+
 class Microphone:
-    def __init__(self, callback, loop):
+    """
+    Captures audio on a thread into a FrameRing; a single sender task on the
+    event loop drains it in batches, so a stalled send never piles up futures.
+    With a `replay` (or MIC_REPLAY set), the audio comes from a recording
+    instead of pyaudio, and with a `recorder` (or MIC_RECORD set), every
+    captured chunk is also written to a file.
+    """
+    def __init__(self, callback, loop, batch_chunks=MIC_BATCH_CHUNKS,
+                 max_batch_chunks=MIC_MAX_BATCH_CHUNKS, ring_chunks=MIC_RING_CHUNKS,
+                 replay=None, recorder=None):
         self.callback = callback
         self.loop = loop
-        self.p = pyaudio.PyAudio()
-        self.stream = self.p.open(
-            format=FORMAT,
-            channels=CHANNELS,
-            rate=RATE,
-            input=True,
-            frames_per_buffer=CHUNK,
-        )
+        self.batch_chunks = max(1, batch_chunks)
+        self.max_batch_chunks = max(self.batch_chunks, max_batch_chunks)
+        self.replay = replay or mic_replay.replay()
+        if self.replay:
+            self.p = None
+            self.stream = self.replay.stream
+        else:
+            self.p = pyaudio.PyAudio()
+            self.stream = self.p.open(
+                format=FORMAT,
+                channels=CHANNELS,
+                rate=RATE,
+                input=True,
+                frames_per_buffer=CHUNK,
+            )
+        self.recorder = recorder or mic_replay.recorder(RATE, CHANNELS, CHUNK, self.replay)
+        self.ring = FrameRing(ring_chunks, CHUNK * 2 * CHANNELS)  # 16-bit samples
+        self.data_ready = asyncio.Event()
         self.is_running = False
         self.thread = None
+        self.sender = None
+        # Send metrics
+        self.sent_batches = 0
+        self.send_seconds = 0.0
+        self.max_send_seconds = 0.0
 
     def start(self):
-        print("\n🎤 Microphone stream started. Speak now! (Press Ctrl+C to stop testing)\n")
+        if self.replay:
+            print(f"\n🎤 Replaying {self.replay.recording.path} at {self.replay.speed}x\n")
+        else:
+            print("\n🎤 Microphone stream started. Speak now! (Press Ctrl+C to stop testing)\n")
         self.is_running = True
+        self.sender = asyncio.run_coroutine_threadsafe(self._send_loop(), self.loop)
         self.thread = threading.Thread(target=self._run)
         self.thread.start()
 
@@ -59,19 +183,56 @@ class Microphone:
         while self.is_running and self.stream.is_active():
             try:
                 data = self.stream.read(CHUNK, exception_on_overflow=False)
-                asyncio.run_coroutine_threadsafe(self.callback(data), self.loop)
             except IOError:
                 break
+            if self.recorder:
+                self.recorder.audio(data)
+            if self.ring.push(data) or len(self.ring) >= self.batch_chunks:
+                self.loop.call_soon_threadsafe(self.data_ready.set)
+
+    async def _send_loop(self):
+        while self.is_running:
+            if len(self.ring) < self.batch_chunks:
+                self.data_ready.clear()
+                await self.data_ready.wait()
+                continue
+            batch = self.ring.pop_batch(self.max_batch_chunks)
+            if not batch:
+                continue
+            send_start = time.perf_counter()
+            try:
+                await self.callback(batch)
+            except Exception as e:
+                print(f"   -> Microphone send error: {e}")
+            elapsed = time.perf_counter() - send_start
+            self.sent_batches += 1
+            self.send_seconds += elapsed
+            self.max_send_seconds = max(self.max_send_seconds, elapsed)
+
+    def stats(self):
+        return {
+            'queue_depth': len(self.ring),
+            'max_queue_depth': self.ring.max_depth,
+            'dropped_chunks': self.ring.dropped,
+            'sent_batches': self.sent_batches,
+            'avg_send_ms': round(1000 * self.send_seconds / self.sent_batches, 1) if self.sent_batches else None,
+            'max_send_ms': round(1000 * self.max_send_seconds, 1),
+        }
 
     def finish(self):
         if self.is_running:
             self.is_running = False
             if self.thread:
                 self.thread.join()
+            # Wake the sender so it notices we stopped and exits
+            self.loop.call_soon_threadsafe(self.data_ready.set)
             if self.stream.is_active():
                 self.stream.stop_stream()
             self.stream.close()
-            self.p.terminate()
+            if self.p:
+                self.p.terminate()
+            if self.recorder:
+                self.recorder.flush()
             print("🎤 Microphone stream finished.")
 
 # This is the main function that will be imported by our orchestrator
@@ -84,12 +245,13 @@ async def listen_for_speech():
     dg_connection = None
 
     try:
-        config = DeepgramClientOptions(verbose=0)
-        deepgram = DeepgramClient(DEEPGRAM_API_KEY, config)
+        deepgram = await deepgram_client()
         dg_connection = deepgram.listen.asyncwebsocket.v("1")
 
         async def on_message(self, result: LiveResultResponse, **kwargs):
             nonlocal final_transcript
+            if microphone and microphone.recorder:
+                microphone.recorder.transcript(result)
             sentence = result.channel.alternatives[0].transcript
             if not sentence:
                 return
@@ -116,13 +278,7 @@ async def listen_for_speech():
         dg_connection.on(LiveTranscriptionEvents.Transcript, on_message)
         dg_connection.on(LiveTranscriptionEvents.Error, on_error)
 
-        options = LiveOptions(
-            model="nova-2", language="en-US", smart_format=True,
-            encoding="linear16", channels=1, sample_rate=RATE,
-            interim_results=True, endpointing="500", utterance_end_ms="1000",
-        )
-
-        await dg_connection.start(options)
+        await dg_connection.start(live_options())
         
         loop = asyncio.get_running_loop()
         microphone = Microphone(dg_connection.send, loop)
@@ -140,9 +296,237 @@ async def listen_for_speech():
         if dg_connection:
             await dg_connection.finish()
 
+class Listener:
+    """
+    Long-lived microphone and Deepgram connection that hands out one utterance
+    at a time, so turns don't pay for a new socket and audio device.
+
+    Audio keeps flowing between turns, so speech that starts before the next
+    call to next_utterance() is not lost. While paused (e.g. while the avatar is
+    speaking) frames are dropped and the socket is kept open with KeepAlive
+    messages. If the socket drops it is reopened with backoff, and audio captured
+    in the meantime is replayed.
+
+    With VAD enabled, only speech (plus a short pre-roll and tail) is sent, and
+    a local end-of-utterance asks Deepgram to finalize right away.
+
+    `replay` (a mic_replay.Replay) and `recorder` (a mic_replay.MicRecorder)
+    override MIC_REPLAY and MIC_RECORD.
+    """
+    def __init__(self, use_vad=VAD_ENABLED, replay=None, recorder=None):
+        self.replay = replay
+        self.recorder = recorder
+        self.vad = vad.VoiceActivityDetector(RATE) if use_vad else None
+        self.finalize_pending = False
+        self.finalize_timer = None
+        self.transcript_collector = TranscriptCollector()
+        self.utterances = asyncio.Queue()
+        # Set whenever transcribed speech is heard; used to interrupt playback
+        self.speech_detected = asyncio.Event()
+        # Best guess at the utterance in progress (finals so far + latest interim)
+        self.partial_text = ""
+        self.partial_changed_at = 0.0
+        # When the user stopped talking (local VAD end, else the last interim result)
+        # and when the final transcript arrived, for the last utterance handed out
+        self.local_end_at = None
+        self.last_interim_at = None
+        self.speech_ended_at = None
+        self.final_at = None
+        self.backlog = deque(maxlen=BACKLOG_CHUNKS)
+        self.loop = None
+        self.microphone = None
+        self.dg_connection = None
+        self.connected = False
+        self.paused = False
+        self.closing = False
+        self.reconnect_task = None
+        self.keepalive_task = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        await self._connect()
+        self.microphone = Microphone(self._on_audio, self.loop, replay=self.replay, recorder=self.recorder)
+        self.microphone.start()
+        self.keepalive_task = asyncio.create_task(self._keepalive())
+
+    async def next_utterance(self):
+        """Resume capture if paused and wait for the next final transcript."""
+        self.resume()
+        text, self.speech_ended_at, self.final_at = await self.utterances.get()
+        return text
+
+    def pause(self):
+        """Stop forwarding microphone audio (the connection stays open)."""
+        self.paused = True
+
+    def resume(self):
+        if self.paused and self.vad:
+            self.vad.reset()
+        self.paused = False
+
+    def stats(self):
+        stats = self.microphone.stats() if self.microphone else {}
+        if self.vad:
+            stats.update(self.vad.stats())
+        return stats
+
+    async def close(self):
+        self.closing = True
+        for task in (self.keepalive_task, self.reconnect_task):
+            if task:
+                task.cancel()
+        if self.microphone:
+            self.microphone.finish()
+        if self.dg_connection:
+            try:
+                await self.dg_connection.finish()
+            except Exception:
+                pass
+
+    async def _connect(self):
+        deepgram = await deepgram_client(self.replay)
+        dg_connection = deepgram.listen.asyncwebsocket.v("1")
+        dg_connection.on(LiveTranscriptionEvents.Transcript, self._on_message)
+        dg_connection.on(LiveTranscriptionEvents.Error, self._on_error)
+        dg_connection.on(LiveTranscriptionEvents.Close, self._on_close)
+        if await dg_connection.start(live_options()) is False:
+            raise ConnectionError("Could not open Deepgram connection")
+        self.dg_connection = dg_connection
+        self.connected = True
+        while self.backlog:
+            await dg_connection.send(self.backlog.popleft())
+
+    async def _on_audio(self, data):
+        if self.paused:
+            return
+        ended = False
+        if self.vad:
+            data, ended = self.vad.process(data)
+        if data:
+            if not self.connected:
+                self.backlog.append(data)
+            else:
+                try:
+                    await self.dg_connection.send(data)
+                except Exception as e:
+                    self.backlog.append(data)
+                    self._schedule_reconnect(e)
+        if ended and self.connected:
+            # Silence detected locally: flush the transcript now instead of waiting for Deepgram
+            self.finalize_pending = True
+            self.local_end_at = time.time()
+            try:
+                await self.dg_connection.finalize()
+            except Exception as e:
+                print(f"   -> Could not finalize transcript: {e}")
+                self.finalize_pending = False
+                return
+            if self.finalize_timer:
+                self.finalize_timer.cancel()
+            self.finalize_timer = self.loop.call_later(FINALIZE_TIMEOUT_MS / 1000, self._finalize_timed_out)
+
+    async def _on_message(self, _client, result: LiveResultResponse, **kwargs):
+        if self.microphone and self.microphone.recorder:
+            self.microphone.recorder.transcript(result)
+        sentence = result.channel.alternatives[0].transcript
+        # Only the response to our own finalize() ends the utterance early; an ordinary
+        # final that was already in flight only closes a sentence (older SDKs: speech_final only)
+        local_end = result.is_final and self.finalize_pending and getattr(result, "from_finalize", False)
+        if len(sentence.split()) >= BARGE_IN_MIN_WORDS:
+            self.speech_detected.set()
+
+        if not result.is_final:
+            if sentence:
+                self.last_interim_at = time.time()
+                self._set_partial(f"{self.transcript_collector.get_full_transcript()} {sentence}".strip())
+                sys.stdout.write(f"\r Interim: {sentence.ljust(80)}")
+                sys.stdout.flush()
+            return
+
+        if sentence:
+            self.transcript_collector.add_part(sentence)
+            full_transcript = self.transcript_collector.get_full_transcript()
+            self._set_partial(full_transcript)
+            sys.stdout.write(f"\r{' ' * 80}\r")
+            sys.stdout.flush()
+            print(f"Current Sentence: {full_transcript}")
+
+        if result.speech_final or local_end:
+            self._end_utterance()
+
+    def _finalize_timed_out(self):
+        self.finalize_timer = None
+        if self.finalize_pending:
+            # e.g. an older SDK that doesn't flag finalize responses
+            print("   -> No finalize response in time, ending the utterance")
+            self._end_utterance()
+
+    def _end_utterance(self):
+        """Hand out the transcript collected so far as one utterance."""
+        self.finalize_pending = False
+        if self.finalize_timer:
+            self.finalize_timer.cancel()
+            self.finalize_timer = None
+        full_transcript = self.transcript_collector.get_full_transcript()
+        self.transcript_collector.reset()
+        self._set_partial("")
+        now = time.time()
+        speech_ended_at = self.local_end_at or self.last_interim_at or now
+        self.local_end_at = self.last_interim_at = None
+        if full_transcript:
+            self.utterances.put_nowait((full_transcript, speech_ended_at, now))
+
+    def _set_partial(self, text):
+        if text != self.partial_text:
+            self.partial_text = text
+            self.partial_changed_at = time.time()
+
+    async def _on_error(self, client, error, **kwargs):
+        print(f"\n\nError: {error}\n\n")
+        if client is self.dg_connection:
+            self._schedule_reconnect(error)
+
+    async def _on_close(self, client, *args, **kwargs):
+        # Ignore late close events from a connection we already replaced
+        if client is self.dg_connection:
+            self._schedule_reconnect("connection closed")
+
+    def _schedule_reconnect(self, reason):
+        if self.closing or (self.reconnect_task and not self.reconnect_task.done()):
+            return
+        self.connected = False
+        print(f"\n🔌 Deepgram connection lost ({reason}), reconnecting...")
+        self.reconnect_task = self.loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 0.5
+        while not self.closing:
+            try:
+                if self.dg_connection:
+                    try:
+                        await self.dg_connection.finish()
+                    except Exception:
+                        pass
+                await self._connect()
+                print("🔌 Deepgram reconnected")
+                return
+            except Exception as e:
+                print(f"   -> Reconnect failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _keepalive(self):
+        while not self.closing:
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+            if self.connected:
+                try:
+                    await self.dg_connection.keep_alive()
+                except Exception as e:
+                    self._schedule_reconnect(e)
+
 # This block allows you to run this script by itself for testing Module 1
 if __name__ == "__main__":
-    if DEEPGRAM_API_KEY is None:
+    if DEEPGRAM_API_KEY is None and not (mic_replay.MIC_REPLAY and mic_replay.MIC_REPLAY_STT == "local"):
         print("Please set your DEEPGRAM_API_KEY environment variable.")
         sys.exit(1)
         
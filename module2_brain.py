@@ -1,20 +1,27 @@
 # --- OPTIMIZED and CORRECTED module2_brain.py ---
 
 import os
-import replicate
-from flask import Flask, request, jsonify, render_template, url_for
+import json
+from flask import Flask, request, jsonify, render_template, url_for, Response, stream_with_context, send_from_directory
 from dotenv import load_dotenv
 import module3_voice
 import module4_face
+import video_jobs
+import artifact_cache
+import phrase_bank
+import session_memory
+import metrics
+import growing_files
+import health
+import admission
+import resilience
+import response_cache
 import time
 import threading
-from concurrent.futures import ThreadPoolExecutor
-import glob
+import contextvars
 
 # Load environment variables
 load_dotenv()
-if not os.getenv("REPLICATE_API_TOKEN"):
-    raise Exception("REPLICATE_API_TOKEN environment variable not set!")
 
 # --- Flask App Initialization ---
 app = Flask(__name__, static_folder='static', static_url_path='/static')
@@ -27,23 +34,244 @@ LLAMA3_8B_INSTRUCT = "meta/meta-llama-3-8b-instruct"
 # --- Avatar Configuration ---
 AVATAR_IMAGE_PATH = "avatar.png"
 
-# Thread pool for parallel processing
-executor = ThreadPoolExecutor(max_workers=2)
+# --- MODIFIED SYSTEM PROMPT ---
+SYSTEM_PROMPT = (
+    "You are an experienced therapist with a warm, empathetic, and gentle demeanor, like a wise older woman. "
+    "Your goal is to provide a calm and supportive space. Listen carefully to the user. "
+    "IMPORTANT: You must vary your conversational patterns and avoid asking 'Can you tell me more' repeatedly. "
+    "Instead, you can: "
+    "1. Offer a gentle, comforting observation (e.g., 'That sounds incredibly difficult to carry.'). "
+    "2. Ask a specific, clarifying question about a detail (e.g., 'When you say you feel unwell, is it more of a physical feeling or an emotional one?'). "
+    "3. Share a brief, reassuring thought (e.g., 'It's alright to not have all the answers right now.'). "
+    "Keep your responses concise and thoughtful, typically 1-2 sentences."
+)
 
-def cleanup_old_files():
-    """Clean up old files in background"""
-    try:
-        if os.path.exists('static'):
-            files = glob.glob(os.path.join('static', 'response_*.mp3'))
-            if len(files) > 10:
-                files.sort(key=os.path.getmtime)
-                for old_file in files[:-10]:
-                    try:
-                        os.remove(old_file)
-                    except Exception:
-                        pass
-    except Exception:
-        pass
+# Shared generation parameters for the blocking and streaming endpoints
+LLM_INPUT = {
+    "max_new_tokens": 100,
+    "temperature": 0.7,
+    "top_p": 0.9,
+}
+
+# Conversation memory, keyed by the session id the page sends with each message
+sessions = session_memory.SessionStore()
+
+# --- Video Job Configuration ---
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", "2"))
+VIDEO_QUEUE_LIMIT = int(os.getenv("VIDEO_QUEUE_LIMIT", "20"))
+
+# --- Audio Cache Configuration ---
+AUDIO_CACHE_DIR = os.path.join('static', 'audio')
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "200"))
+
+# Replies are cached by a digest of (text, voice, model, voice settings)
+audio_cache = artifact_cache.ArtifactCache(
+    AUDIO_CACHE_DIR, ".mp3", max_bytes=AUDIO_CACHE_MAX_MB * 1024 * 1024
+)
+
+# --- Progressive Audio Configuration ---
+# Stream TTS bytes to disk and hand out the URL as soon as the first bytes land;
+# /audio/<name> serves the file while it is still being written
+PROGRESSIVE_AUDIO = os.getenv("PROGRESSIVE_AUDIO", "0") == "1"
+AUDIO_URL_PREFIX = '/audio'
+AUDIO_FIRST_BYTE_TIMEOUT = 10
+
+# Replies still being synthesized, by cache filename
+audio_in_progress = growing_files.GrowingFiles()
+
+# --- Video Cache Configuration ---
+VIDEO_CACHE_DIR = os.path.join('static', 'videos')
+VIDEO_CACHE_MAX_MB = int(os.getenv("VIDEO_CACHE_MAX_MB", "1000"))
+VIDEO_URL_PREFIX = '/videos'
+
+# Rendered mp4s are cached by a digest of (avatar, audio, SadTalker settings)
+video_cache = artifact_cache.ArtifactCache(
+    VIDEO_CACHE_DIR, ".mp4", max_bytes=VIDEO_CACHE_MAX_MB * 1024 * 1024
+)
+
+# --- Phrase Bank Configuration ---
+PHRASE_BANK_DIR = os.path.join('static', 'phrases')
+PHRASE_BANK_VIDEO = os.getenv("PHRASE_BANK_VIDEO", "0") == "1"
+
+phrases, fillers = phrase_bank.load_phrase_config(os.getenv("PHRASE_BANK_FILE"))
+bank = phrase_bank.PhraseBank(PHRASE_BANK_DIR, module3_voice.audio_cache_key, phrases, fillers)
+
+# --- Response Cache ---
+# Replies to common conversation openers ("hi", "I feel sad today"), so those skip the LLM
+reply_cache = response_cache.ResponseCache()
+
+def cached_reply(session, transcript):
+    """A cached reply if this is the opener of a conversation and one is stored, else None"""
+    if session.turn_count:
+        return None  # later turns depend on the conversation so far
+    with metrics.span("cache_lookup"):
+        reply = reply_cache.lookup(transcript)
+    if reply:
+        print("   -> 💾 Opener answered from the response cache, skipping the LLM")
+    return reply
+
+def cache_reply(session, transcript, reply, decision):
+    """Offer a fresh LLM reply to the response cache (call before the turn is added to the session)"""
+    # Replies cut short under load are not worth repeating
+    if not session.turn_count and decision.max_new_tokens >= LLM_INPUT["max_new_tokens"]:
+        reply_cache.add(transcript, reply)
+
+def start_progressive_audio(cache_key, text):
+    """Synthesize in the background and return once the first bytes are on disk (True) or it failed"""
+    filename = audio_cache.filename_for(cache_key)
+    growing, is_new = audio_in_progress.add(filename, growing_files.GrowingFile(audio_cache.path_for(cache_key)))
+    if is_new:
+        def render(tmp_path):
+            growing.start(tmp_path)
+            return module3_voice.text_to_audio_file(text, tmp_path, on_chunk=growing.append)
+
+        def run():
+            audio_start = time.time()
+            path = None
+            try:
+                path = audio_cache.create(cache_key, render)
+            finally:
+                growing.finish(path is not None)
+                audio_in_progress.remove(filename)
+                metrics.record("tts", audio_start)
+
+        threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+
+    with metrics.span("tts_first_byte"):
+        started = growing.wait_started(AUDIO_FIRST_BYTE_TIMEOUT)
+    return started or os.path.exists(growing.path)
+
+def synthesize_audio(full_response):
+    """Render the reply to a cached mp3 and return (file path, public URL), or (None, None) if TTS failed"""
+    with metrics.span("cache_lookup"):
+        banked = bank.match(full_response)
+    if banked:
+        print("   -> 📚 Reply matches a banked phrase, skipping TTS")
+        return bank.audio_path(banked), url_for('static', filename=f"phrases/{banked['audio']}")
+
+    cache_key = module3_voice.audio_cache_key(full_response)
+    audio_filepath = audio_cache.path_for(cache_key)
+    audio_url = url_for('static', filename=f"audio/{audio_cache.filename_for(cache_key)}")
+
+    with metrics.span("cache_lookup"):
+        cached = audio_cache.lookup(cache_key)
+    if cached:
+        print("   -> 🔊 Using cached audio file")
+    elif PROGRESSIVE_AUDIO:
+        print("   -> 🔊 Streaming audio to disk...")
+        audio_start = time.time()
+        if not start_progressive_audio(cache_key, full_response):
+            print("   -> 🔊 Audio generation failed, text-only response")
+            return None, None
+        print(f"   -> 🔊 First audio bytes in {time.time() - audio_start:.1f}s")
+        audio_url = f"{AUDIO_URL_PREFIX}/{audio_cache.filename_for(cache_key)}"
+    else:
+        print("   -> 🔊 Generating audio...")
+        audio_start = time.time()
+        # Concurrent requests for the same reply share one TTS call
+        path = audio_cache.create(cache_key, lambda tmp_path: module3_voice.text_to_audio_file(full_response, tmp_path))
+        audio_time = metrics.record("tts", audio_start)
+        if not path:
+            print("   -> 🔊 Audio generation failed, text-only response")
+            return None, None
+        print(f"   -> 🔊 Audio generated in {audio_time:.1f}s")
+
+    return audio_filepath, audio_url
+
+def generate_video(audio_filepath):
+    """Run lip-sync for an audio file, returning the video URL or None"""
+    video_url = None
+    # SadTalker needs the complete audio file
+    audio_in_progress.wait_published(os.path.basename(audio_filepath), timeout=120)
+    if os.path.exists(AVATAR_IMAGE_PATH):
+        with metrics.span("cache_lookup"):
+            cache_key = module4_face.video_cache_key(AVATAR_IMAGE_PATH, audio_filepath)
+            cached = video_cache.lookup(cache_key)
+        local_url = f"{VIDEO_URL_PREFIX}/{video_cache.filename_for(cache_key)}"
+        if cached:
+            print("   -> 🎬 Using cached video file")
+            return local_url
+
+        print("   -> 🎬 Starting video generation...")
+        video_start = time.time()
+        remote_url = None
+
+        def render(tmp_path):
+            nonlocal remote_url
+            with metrics.span("video"):
+                video_output = module4_face.generate_lip_sync_video(AVATAR_IMAGE_PATH, audio_filepath)
+            if not video_output:
+                return False
+            with metrics.span("video_download"):
+                if module4_face.save_video(video_output, tmp_path):
+                    return True
+            remote_url = str(video_output) # FIX: Convert object to string
+            return False
+
+        # Jobs for the same avatar and audio share one SadTalker run
+        if video_cache.create(cache_key, render):
+            video_url = local_url
+        else:
+            video_url = remote_url
+        if video_url:
+            video_time = time.time() - video_start
+            print(f"   -> 🎬 Video generated in {video_time:.1f}s")
+        else:
+            print("   -> 🎬 Video generation failed, audio-only response")
+    else:
+        print(f"   -> ⚠️  Avatar image not found at {AVATAR_IMAGE_PATH}")
+    return video_url
+
+# Lip-sync runs here instead of on the request thread
+video_queue = video_jobs.VideoJobQueue(
+    generate_video, max_workers=VIDEO_WORKERS, max_queued=VIDEO_QUEUE_LIMIT,
+    deferred_max_age=admission.deferred_video_max_age(),
+)
+
+# Degrades (or sheds) requests when the video queue or recent latency threatens the SLOs
+admission_control = admission.AdmissionController(video_queue.stats, LLM_INPUT["max_new_tokens"])
+
+def start_video_job(audio_filepath, decision=None):
+    """Queue lip-sync for an audio file (as the admission decision allows), returning the job or None"""
+    if audio_filepath is None:
+        return None
+    if not os.path.exists(AVATAR_IMAGE_PATH):
+        print(f"   -> ⚠️  Avatar image not found at {AVATAR_IMAGE_PATH}")
+        return None
+    video = admission_control.admit_video(decision) if decision else admission.VIDEO_NOW
+    if video == admission.VIDEO_SKIPPED:
+        print("   -> 🚦 Server busy, skipping video (audio-only response)")
+        return None
+    return video_queue.submit(audio_filepath, defer=video == admission.VIDEO_DEFERRED)
+
+def llm_input(prompt, decision):
+    return {
+        "prompt": prompt,
+        "system_prompt": SYSTEM_PROMPT,
+        **LLM_INPUT,
+        "max_new_tokens": decision.max_new_tokens,
+    }
+
+def require_replicate_token():
+    """Checked on first use (like module4_face), so importing this module never needs the key"""
+    if not os.getenv("REPLICATE_API_TOKEN"):
+        raise Exception("REPLICATE_API_TOKEN environment variable not set!")
+
+def stream_llm(prompt, decision):
+    """Reply tokens under the LLM deadlines, hedged with a second request when the first token is late"""
+    require_replicate_token()
+    return resilience.hedged_stream(resilience.replicate_stream(LLAMA3_8B_INSTRUCT, llm_input(prompt, decision)))
+
+def shed_response(decision):
+    """Fast 503 for a request the admission controller turned away"""
+    print("   -> 🚦 Server overloaded, shedding request")
+    response = jsonify({
+        'error': 'Server busy, please try again in a moment',
+        'response': admission.BUSY_RESPONSE,
+        'admission': decision.to_dict(),
+    })
+    response.headers['Retry-After'] = str(admission.SHED_RETRY_AFTER)
+    return response, 503
 
 @app.route('/')
 def index():
@@ -64,79 +292,47 @@ def generate_response():
         return jsonify({'error': 'Bad Request: transcript cannot be empty'}), 400
     
     print(f"   -> User said: \"{user_transcript}\"")
+    decision = admission_control.admit()
+    if decision.shed:
+        return shed_response(decision)
+    session = sessions.get(request.json.get('session_id'))
+    trace = metrics.start_trace("generate")
 
-    # --- MODIFIED SYSTEM PROMPT ---
-    system_prompt = (
-        "You are an experienced therapist with a warm, empathetic, and gentle demeanor, like a wise older woman. "
-        "Your goal is to provide a calm and supportive space. Listen carefully to the user. "
-        "IMPORTANT: You must vary your conversational patterns and avoid asking 'Can you tell me more' repeatedly. "
-        "Instead, you can: "
-        "1. Offer a gentle, comforting observation (e.g., 'That sounds incredibly difficult to carry.'). "
-        "2. Ask a specific, clarifying question about a detail (e.g., 'When you say you feel unwell, is it more of a physical feeling or an emotional one?'). "
-        "3. Share a brief, reassuring thought (e.g., 'It's alright to not have all the answers right now.'). "
-        "Keep your responses concise and thoughtful, typically 1-2 sentences."
-    )
-    
     try:
         print("   -> 🤔 Thinking...")
         start_time = time.time()
         
-        # Get AI response with optimized parameters
-        output = replicate.run(
-            LLAMA3_8B_INSTRUCT,
-            input={
-                "prompt": user_transcript,
-                "system_prompt": system_prompt,
-                "max_new_tokens": 100,
-                "temperature": 0.7,
-                "top_p": 0.9,
-            }
-        )
-        
-        full_response = "".join(output)
-        ai_time = time.time() - start_time
-        print(f"   -> 💭 AI responded in {ai_time:.1f}s: \"{full_response}\"")
+        cached = cached_reply(session, user_transcript)
+        if cached:
+            full_response = cached
+        else:
+            # Get AI response with optimized parameters
+            full_response = "".join(str(token) for token in stream_llm(session.build_prompt(user_transcript), decision))
+            ai_time = metrics.record("llm_complete", start_time)
+            print(f"   -> 💭 AI responded in {ai_time:.1f}s: \"{full_response}\"")
 
         if not full_response:
             return jsonify({'error': 'AI generated empty response'}), 500
+        if not cached:
+            cache_reply(session, user_transcript, full_response, decision)
+        session.add_turn(user_transcript, full_response)
 
-        audio_filename = f"response_{hash(full_response)}.mp3"
-        audio_filepath = os.path.join(app.static_folder, audio_filename)
-        audio_url = url_for('static', filename=audio_filename)
-        video_url = None
-        
-        if not os.path.exists(audio_filepath):
-            print("   -> 🔊 Generating audio...")
-            audio_start = time.time()
-            module3_voice.text_to_audio_file(full_response, audio_filepath)
-            audio_time = time.time() - audio_start
-            print(f"   -> 🔊 Audio generated in {audio_time:.1f}s")
-        else:
-            print("   -> 🔊 Using cached audio file")
-
-        if os.path.exists(AVATAR_IMAGE_PATH):
-            print("   -> 🎬 Starting video generation...")
-            video_start = time.time()
-            video_output = module4_face.generate_lip_sync_video(AVATAR_IMAGE_PATH, audio_filepath)
-            
-            if video_output:
-                video_url = str(video_output) # FIX: Convert object to string
-                video_time = time.time() - video_start
-                print(f"   -> 🎬 Video generated in {video_time:.1f}s")
-            else:
-                video_url = None
-                print("   -> 🎬 Video generation failed, audio-only response")
-        else:
-            print(f"   -> ⚠️  Avatar image not found at {AVATAR_IMAGE_PATH}")
+        audio_filepath, audio_url = synthesize_audio(full_response)
+        video_job = start_video_job(audio_filepath, decision)
 
-        executor.submit(cleanup_old_files)
-        total_time = time.time() - start_time
+        total_time = metrics.record("request", start_time)
         print(f"   -> ✅ Total processing time: {total_time:.1f}s")
 
         return jsonify({
             'response': full_response,
+            'response_cached': bool(cached),
+            'session_id': session.id,
+            'trace_id': trace.id,
             'audio_url': audio_url,
-            'video_url': video_url,
+            'video_url': None,
+            'video_job_id': video_job.id if video_job else None,
+            'video_status_url': url_for('job_status', job_id=video_job.id) if video_job else None,
+            'admission': decision.to_dict(),
             'processing_time': round(total_time, 1)
         })
 
@@ -146,6 +342,116 @@ def generate_response():
             'error': f'Processing error: {str(e)}',
             'response': 'Sorry, I encountered an error processing your request.'
         }), 500
+    finally:
+        admission_control.release()
+
+@app.route('/generate_stream', methods=['POST'])
+def generate_response_stream():
+    """
+    Progressive variant of /generate. Streams newline-delimited JSON events:
+    'token' events while the LLM is writing, 'audio' as soon as TTS is done,
+    'video_job' with the queued lip-sync job to poll, and a final 'done' (or 'error').
+    """
+    print("🧠 Brain (Web UI) received a streaming request...")
+
+    if not request.json or 'transcript' not in request.json:
+        return jsonify({'error': 'Bad Request: transcript key is missing'}), 400
+
+    user_transcript = request.json['transcript']
+    if not user_transcript:
+        return jsonify({'error': 'Bad Request: transcript cannot be empty'}), 400
+
+    print(f"   -> User said: \"{user_transcript}\"")
+    decision = admission_control.admit()
+    if decision.shed:
+        return shed_response(decision)
+    session = sessions.get(request.json.get('session_id'))
+
+    def event(kind, **payload):
+        return json.dumps({'type': kind, **payload}) + "\n"
+
+    def generate():
+        trace = metrics.start_trace("generate_stream")
+        start_time = time.time()
+        try:
+            print("   -> 🤔 Thinking...")
+            parts = []
+            cached = cached_reply(session, user_transcript)
+            if cached:
+                parts.append(cached)
+                yield event('token', text=cached)
+            else:
+                for token in stream_llm(session.build_prompt(user_transcript), decision):
+                    token = str(token)
+                    if not parts:
+                        print(f"   -> 💭 First token in {metrics.record('llm_first_token', start_time):.1f}s")
+                    parts.append(token)
+                    yield event('token', text=token)
+
+            full_response = "".join(parts)
+            if not cached:
+                print(f"   -> 💭 AI responded in {metrics.record('llm_complete', start_time):.1f}s: \"{full_response}\"")
+            if not full_response:
+                yield event('error', error='AI generated empty response')
+                return
+            if not cached:
+                cache_reply(session, user_transcript, full_response, decision)
+            session.add_turn(user_transcript, full_response)
+            yield event('response', response=full_response, response_cached=bool(cached), session_id=session.id,
+                        trace_id=trace.id, admission=decision.to_dict(),
+                        elapsed=round(time.time() - start_time, 1))
+
+            audio_filepath, audio_url = synthesize_audio(full_response)
+            yield event('audio', audio_url=audio_url,
+                        elapsed=round(time.time() - start_time, 1))
+
+            video_job = start_video_job(audio_filepath, decision)
+            if video_job:
+                yield event('video_job', job_id=video_job.id,
+                            status_url=url_for('job_status', job_id=video_job.id))
+
+            total_time = metrics.record("request", start_time)
+            print(f"   -> ✅ Total streaming time: {total_time:.1f}s")
+            yield event('done', processing_time=round(total_time, 1), admission=decision.to_dict())
+
+        except Exception as e:
+            print(f"   -> ❌ Error occurred: {e}")
+            yield event('error', error=f'Processing error: {str(e)}',
+                        response='Sorry, I encountered an error processing your request.')
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+    # Runs even if the client goes away before the stream starts
+    response.call_on_close(admission_control.release)
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report the state of a queued video job"""
+    job = video_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+    return jsonify(job.to_dict())
+
+@app.route(f'{VIDEO_URL_PREFIX}/<path:filename>')
+def cached_video(filename):
+    """Serve a cached video; conditional responses handle Range requests for seeking"""
+    return send_from_directory(
+        os.path.abspath(VIDEO_CACHE_DIR), filename, mimetype='video/mp4', conditional=True
+    )
+
+@app.route(f'{AUDIO_URL_PREFIX}/<path:filename>')
+def streamed_audio(filename):
+    """Serve reply audio; a file still being synthesized is streamed as it grows (chunked), a finished one supports Range"""
+    growing = audio_in_progress.get(filename)
+    if growing:
+        return Response(growing.iter_bytes(), mimetype='audio/mpeg', headers={'Cache-Control': 'no-cache'})
+    return send_from_directory(
+        os.path.abspath(AUDIO_CACHE_DIR), filename, mimetype='audio/mpeg', conditional=True
+    )
 
 @app.route('/status')
 def status():
@@ -153,9 +459,53 @@ def status():
     return jsonify({
         'status': 'healthy',
         'avatar_available': os.path.exists(AVATAR_IMAGE_PATH),
-        'static_files': len([f for f in os.listdir('static') if f.endswith('.mp3')]) if os.path.exists('static') else 0
+        'avatar': module4_face.avatar_for(AVATAR_IMAGE_PATH).stats(),
+        'video_jobs': video_queue.stats(),
+        'admission': admission_control.stats(),
+        'sessions': sessions.stats(),
+        'audio_cache': audio_cache.stats(),
+        'audio_in_progress': len(audio_in_progress),
+        'video_cache': video_cache.stats(),
+        'stages': metrics.stage_seconds.summary(),
+        'providers': health.checks.snapshot(),
+        'resilience': resilience.stats(),
+        'response_cache': reply_cache.stats(),
     })
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Per-stage latency histograms in the Prometheus text format"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def warm_up_phrase_bank():
+    """Render banked phrases (and their videos, if enabled) that are missing on disk"""
+    if os.getenv("ELEVENLABS_API_KEY"):
+        bank.warm_up(module3_voice.text_to_audio_file, generate_video if PHRASE_BANK_VIDEO else None)
+
+_warm_up_started = False
+_warm_up_lock = threading.Lock()
+
+def warm_up():
+    """
+    Serve right away: provider checks (cached), the TTS SDK import, the avatar
+    upload and the phrase bank run in the background, once per process
+    """
+    global _warm_up_started
+    with _warm_up_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    jobs = [health.checks.check, module3_voice.elevenlabs_client, warm_up_phrase_bank]
+    if os.path.exists(AVATAR_IMAGE_PATH):
+        jobs.append(module4_face.avatar_for(AVATAR_IMAGE_PATH).input_value)
+    for job in jobs:
+        threading.Thread(target=job, daemon=True).start()
+
+@app.before_request
+def start_warm_up():
+    # gunicorn and `flask run` never execute the __main__ block below
+    warm_up()
+
 if __name__ == '__main__':
     print("🤖 Module 2 (Brain for Web App) is running at http://127.0.0.1:5000")
     if os.path.exists(AVATAR_IMAGE_PATH):
@@ -175,5 +525,9 @@ if __name__ == '__main__':
     else:
         print("   ✅ All API keys configured")
     
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        # Start warming up now rather than on the first request (reloader's serving process only)
+        warm_up()
+
     print("   🚀 Starting optimized server...")
     app.run(debug=True, port=5000, threaded=True)
\ No newline at end of file
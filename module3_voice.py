@@ -1,17 +1,45 @@
 # --- OPTIMIZED module3_voice.py ---
 
 import os
+import re
 import time
-from elevenlabs import stream, save
-from elevenlabs.client import ElevenLabs
+import queue
+import shutil
+import threading
+import subprocess
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from dotenv import load_dotenv
+import artifact_cache
+import audio_playback
+import metrics
+import resilience
 
 # Load environment variables
 load_dotenv()
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 
 # --- ElevenLabs Client Initialization ---
-client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+# Created on first use: importing the SDK is the slowest part of starting up
+client = None
+# Non-blocking client for the asyncio web server
+async_client = None
+
+def elevenlabs_client():
+    global client
+    if client is None:
+        from elevenlabs.client import ElevenLabs
+
+        client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+    return client
+
+def elevenlabs_async_client():
+    global async_client
+    if async_client is None:
+        from elevenlabs.client import AsyncElevenLabs
+
+        async_client = AsyncElevenLabs(api_key=ELEVENLABS_API_KEY)
+    return async_client
 
 # --- MODIFIED VOICE SETTINGS FOR GRANDMA PERSONA ---
 
@@ -21,6 +49,30 @@ VOICE_ID = "XrExE9yKIg1WjnnlVkGX"
 # --- FIX: Reverting to the multilingual model which is confirmed to be on your account. ---
 MODEL_ID = "eleven_multilingual_v2"
 
+# Fine-tuned settings for a slower, softer, calmer tone
+VOICE_SETTINGS = {
+    "stability": 0.3,
+    "similarity_boost": 0.75, 
+    "style": 0.0,
+    "use_speaker_boost": True 
+}
+
+# --- Sentence Pipeline Configuration ---
+# How many sentences may be synthesized ahead of the one that is playing
+TTS_LOOKAHEAD = int(os.getenv("TTS_LOOKAHEAD", "2"))
+# Clauses (split on , ; :) are only cut off once they are at least this long
+MIN_CLAUSE_CHARS = 40
+# Play a filler if the first sentence isn't ready after this many seconds
+FILLER_DELAY = float(os.getenv("FILLER_DELAY", "0.8"))
+
+# --- Terminal Playback Configuration ---
+# "pcm": raw PCM from ElevenLabs played in-process (audio_playback.py); "mpv": mp3 piped into mpv
+PLAYBACK_ENGINE = os.getenv("PLAYBACK_ENGINE", "pcm")
+player = None  # the PcmPlayer, created on first use
+
+SENTENCE_END = re.compile(r'[.!?…]+["\')\]]*\s')
+CLAUSE_END = re.compile(r'[,;:]\s')
+
 def speak_text_stream(text_stream):
     """
     OPTIMIZED: Takes a generator of text chunks and streams the audio directly.
@@ -35,13 +87,14 @@ def speak_text_stream(text_stream):
     start_time = time.time()
     
     try:
-        audio_stream = client.text_to_speech.stream(
+        audio_stream = elevenlabs_client().text_to_speech.stream(
             text=text_stream,
             voice=VOICE_ID,
             model=MODEL_ID,
+            **format_options(playback_format()),
         )
         
-        stream(audio_stream)
+        play_audio_stream(audio_stream)
         
         stream_time = time.time() - start_time
         print(f"   -> Audio streamed in {stream_time:.1f}s")
@@ -51,9 +104,250 @@ def speak_text_stream(text_stream):
         full_text = "".join(text for text in text_stream)
         print(f"🤖 AI Says (audio failed): {full_text}")
 
-def text_to_audio_file(text: str, file_path: str):
+def audio_cache_key(text: str, output_format=None) -> str:
+    """Cache key covering everything that changes the rendered audio."""
+    if output_format:
+        return artifact_cache.digest(text.strip(), VOICE_ID, MODEL_ID, VOICE_SETTINGS, output_format)
+    return artifact_cache.digest(text.strip(), VOICE_ID, MODEL_ID, VOICE_SETTINGS)
+
+def playback_format():
+    """ElevenLabs output_format the terminal player expects (None means the default mp3)."""
+    return audio_playback.PCM_OUTPUT_FORMAT if PLAYBACK_ENGINE == "pcm" else None
+
+def format_options(output_format):
+    return {"output_format": output_format} if output_format else {}
+
+def split_sentences(text_stream, min_clause_chars=MIN_CLAUSE_CHARS):
+    """
+    Regroups raw LLM token fragments into sentences, or long clauses, so each
+    can be synthesized as soon as it is complete.
+    """
+    buffer = ""
+    for fragment in text_stream:
+        buffer += fragment
+        while True:
+            match = SENTENCE_END.search(buffer)
+            if not match:
+                match = CLAUSE_END.search(buffer, min_clause_chars)
+            if not match:
+                break
+            sentence, buffer = buffer[:match.end()].strip(), buffer[match.end():]
+            if sentence:
+                yield sentence
+    if buffer.strip():
+        yield buffer.strip()
+
+def synthesize_sentence(text: str, output_format=None) -> bytes:
+    """
+    Synthesizes one sentence and returns the complete audio bytes (mp3 unless
+    `output_format` says otherwise). Raises CircuitOpen or DeadlineExceeded
+    rather than waiting on a failing or stalled ElevenLabs.
+    """
+    with resilience.breakers['tts'].guard():
+        audio = elevenlabs_client().text_to_speech.convert(
+            text=text,
+            voice_id=VOICE_ID,
+            model_id=MODEL_ID,
+            voice_settings=VOICE_SETTINGS,
+            **format_options(output_format),
+        )
+        return b"".join(resilience.iterate_within(audio, resilience.TTS_DEADLINE, "tts"))
+
+def playback_player():
+    global player
+    if player is None:
+        player = audio_playback.PcmPlayer(audio_playback.make_sink())
+    return player
+
+def play_audio_stream(audio_chunks, cancel_event=None):
+    """
+    Plays audio chunks in the format playback_format() asked for, stopping as
+    soon as `cancel_event` is set. Returns False if it was cancelled.
+    """
+    if PLAYBACK_ENGINE == "pcm":
+        return playback_player().play(audio_chunks, cancel_event)
+    return play_mp3_with_mpv(audio_chunks, cancel_event)
+
+def play_mp3_with_mpv(audio_chunks, cancel_event=None):
+    """
+    Pipes mp3 chunks into mpv (like elevenlabs.stream), but stops playback
+    immediately when `cancel_event` is set. Returns False if it was cancelled.
+    """
+    if not shutil.which("mpv"):
+        raise ValueError("mpv not found, necessary to stream audio. Install it from https://mpv.io/")
+
+    process = subprocess.Popen(
+        ["mpv", "--no-cache", "--no-terminal", "--", "fd://0"],
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    def stop_on_cancel():
+        while process.poll() is None:
+            if cancel_event.wait(0.05):
+                process.kill()
+                return
+
+    if cancel_event:
+        threading.Thread(target=stop_on_cancel, daemon=True).start()
+
+    try:
+        for chunk in audio_chunks:
+            if cancel_event and cancel_event.is_set():
+                break
+            process.stdin.write(chunk)
+            process.stdin.flush()
+    except BrokenPipeError:
+        pass  # mpv was killed mid-write
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
+    return not (cancel_event and cancel_event.is_set())
+
+def speak_text_stream_chunked(text_stream, lookahead=TTS_LOOKAHEAD,
+                              filler_audio=None, cached_audio=None, cancel_event=None):
+    """
+    Splits the token stream into sentences and synthesizes sentence N+1 while
+    sentence N plays. Playback order is strict and at most `lookahead`
+    sentences are buffered ahead of the player.
+
+    `filler_audio` (bytes in playback_format()) is played if the first sentence
+    is not ready within FILLER_DELAY. `cached_audio(sentence)` may return
+    pre-rendered bytes for a sentence, which are used instead of calling the TTS API.
+
+    Setting `cancel_event` (a threading.Event) stops playback and returns at
+    once: in-flight synthesis is abandoned, and the text stream is closed as
+    soon as the reader gets it back (pass the same event to the LLM stream to
+    cancel it while it is still waiting for a token). Returns False if the
+    reply was cut short.
+    """
+    if not ELEVENLABS_API_KEY:
+        speak_text_stream(text_stream)
+        return True
+
+    print("🔊 Voice module streaming audio sentence by sentence...")
+    start_time = time.time()
+
+    # Futures in playback order; the bound gives backpressure on the LLM reader
+    pending = queue.Queue(maxsize=lookahead)
+    done = object()
+    spoken = []
+    # Set once playback is over, so a producer still reading the LLM stops too
+    stopped = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=lookahead, thread_name_prefix="tts")
+
+    def cancelled():
+        return stopped.is_set() or (cancel_event is not None and cancel_event.is_set())
+
+    def synthesize(sentence):
+        audio = cached_audio(sentence) if cached_audio else None
+        if audio:
+            print(f"   -> Using banked audio for: \"{sentence}\"")
+            return audio
+        with metrics.span("tts"):
+            return synthesize_sentence(sentence, playback_format())
+
+    def enqueue(item):
+        """Waits for room in the queue, giving up once the reply is cancelled."""
+        while not cancelled():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for sentence in split_sentences(text_stream):
+                if cancelled():
+                    break
+                spoken.append(sentence)
+                future = pool.submit(contextvars.copy_context().run, synthesize, sentence)
+                if not enqueue((sentence, future)):
+                    break
+        except Exception as e:
+            if not cancelled():
+                print(f"   -> Sentence pipeline error: {e}")
+        finally:
+            if cancelled():
+                # Closing the generator lets the LLM side cancel its request
+                if hasattr(text_stream, "close"):
+                    text_stream.close()
+            enqueue(done)
+
+    def next_item(timeout=None):
+        """Next queued sentence, `done` when cancelled, or None after `timeout`."""
+        deadline = time.time() + timeout if timeout is not None else None
+        while not cancelled():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.time())
+            if wait <= 0:
+                return None
+            try:
+                return pending.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return done
+
+    def audio_chunks():
+        first_audio = True
+        item = None
+        if filler_audio:
+            item = next_item(timeout=FILLER_DELAY)
+            if item is None:
+                print("   -> Playing filler while the AI thinks")
+                yield filler_audio
+        while True:
+            if item is None:
+                item = next_item()
+            if item is done:
+                return
+            sentence, future = item
+            item = None
+            try:
+                while True:
+                    if cancelled():
+                        return
+                    try:
+                        audio = future.result(timeout=0.1)
+                        break
+                    except FutureTimeout:
+                        continue
+            except Exception as e:
+                print(f"   -> Audio synthesis error: {e}")
+                print(f"🤖 AI Says (audio failed): {sentence}")
+                continue
+            if first_audio:
+                print(f"   -> First sentence ready in {metrics.record('tts_first_audio', start_time):.1f}s")
+                first_audio = False
+            yield audio
+
+    # The producer (and the LLM stream it reads) records spans into the caller's trace
+    producer = threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True)
+    producer.start()
+    completed = True
+    try:
+        completed = play_audio_stream(audio_chunks(), cancel_event)
+        if completed:
+            print(f"   -> Audio streamed in {time.time() - start_time:.1f}s")
+        else:
+            print(f"   -> Playback interrupted after {time.time() - start_time:.1f}s")
+    except Exception as e:
+        print(f"   -> Audio streaming error: {e}")
+        print(f"🤖 AI Says (audio failed): {' '.join(spoken)}")
+    finally:
+        # Don't wait for the LLM or in-flight synthesis: the producer sees `stopped` and cleans up
+        stopped.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    return completed
+
+def text_to_audio_file(text: str, file_path: str, on_chunk=None, output_format=None):
     """
     OPTIMIZED: Converts text to audio file with settings for the grandma persona.
+    Bytes are flushed to disk as they stream in; `on_chunk(nbytes)` is called
+    after each write so readers can serve the file while it grows.
     """
     if not ELEVENLABS_API_KEY:
         print("Warning: ELEVENLABS_API_KEY not set. Cannot generate audio file.")
@@ -71,20 +365,22 @@ def text_to_audio_file(text: str, file_path: str):
             print("   -> Using cached audio file")
             return True
         
-        audio = client.text_to_speech.convert(
-            text=text.strip(),
-            voice_id=VOICE_ID,
-            model_id=MODEL_ID,
-            # Fine-tuned settings for a slower, softer, calmer tone
-            voice_settings={
-                "stability": 0.3,
-                "similarity_boost": 0.75, 
-                "style": 0.0,
-                "use_speaker_boost": True 
-            }
-        )
+        # A failing ElevenLabs is skipped outright, a stalled one given up on after TTS_DEADLINE
+        with resilience.breakers['tts'].guard():
+            audio = elevenlabs_client().text_to_speech.convert(
+                text=text.strip(),
+                voice_id=VOICE_ID,
+                model_id=MODEL_ID,
+                voice_settings=VOICE_SETTINGS,
+                **format_options(output_format),
+            )
 
-        save(audio, file_path)
+            with open(file_path, "wb") as f:
+                for chunk in resilience.iterate_within(audio, resilience.TTS_DEADLINE, "tts"):
+                    f.write(chunk)
+                    f.flush()
+                    if on_chunk:
+                        on_chunk(len(chunk))
         
         generation_time = time.time() - start_time
         print(f"   -> Audio file saved in {generation_time:.1f}s")
@@ -96,6 +392,55 @@ def text_to_audio_file(text: str, file_path: str):
             
     except Exception as e:
         print(f"   -> Audio generation error: {e}")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return False
+
+async def text_to_audio_file_async(text: str, file_path: str, on_chunk=None):
+    """
+    Non-blocking twin of text_to_audio_file, used by the asyncio web server.
+    """
+    if not ELEVENLABS_API_KEY:
+        print("Warning: ELEVENLABS_API_KEY not set. Cannot generate audio file.")
+        return False
+
+    if not text or not text.strip():
+        print("Warning: Empty text provided. Cannot generate audio.")
+        return False
+
+    print(f"🔊 Voice module generating audio file at {file_path}...")
+    start_time = time.time()
+
+    try:
+        if os.path.exists(file_path):
+            print("   -> Using cached audio file")
+            return True
+
+        with resilience.breakers['tts'].guard(), open(file_path, "wb") as f:
+            audio = elevenlabs_async_client().text_to_speech.convert(
+                text=text.strip(),
+                voice_id=VOICE_ID,
+                model_id=MODEL_ID,
+                voice_settings=VOICE_SETTINGS,
+            )
+            async for chunk in resilience.iterate_within_async(audio, resilience.TTS_DEADLINE, "tts"):
+                f.write(chunk)
+                f.flush()
+                if on_chunk:
+                    on_chunk(len(chunk))
+
+        generation_time = time.time() - start_time
+        print(f"   -> Audio file saved in {generation_time:.1f}s")
+
+        if not (os.path.exists(file_path) and os.path.getsize(file_path) > 0):
+             print("   -> Error: Audio file was not created properly after generation.")
+             return False
+        return True
+
+    except Exception as e:
+        print(f"   -> Audio generation error: {e}")
+        if os.path.exists(file_path):
+            os.remove(file_path)
         return False
 
 # (The rest of the file remains the same)
@@ -1,22 +1,89 @@
 # --- FINAL CORRECTED module4_face.py ---
 
+import io
 import os
 import glob
-import replicate
+import asyncio
+import shutil
+import urllib.request
 from dotenv import load_dotenv
 import time
 import threading
 import sys
+import artifact_cache
+import avatar_assets
+import resilience
 
-# Load environment variables
+# Load environment variables (the token is checked when a video is requested,
+# so importing this module never fails)
 load_dotenv()
-if not os.getenv("REPLICATE_API_TOKEN"):
-    raise Exception("REPLICATE_API_TOKEN environment variable not set!")
 
 # --- SOLUTION: Use a different, stable version of the SadTalker model ---
 # This version is maintained by a different user and does not have the 'glob' bug.
 WORKING_SADTALKER_MODEL = "lucataco/sadtalker:85c698db7c0a66d5011435d0191db323034e1da04b912a6d365833141b6a285b"
 
+SADTALKER_PARAMS = {
+    "preprocess": "crop",
+    "still": True,
+    "facerender": "facevid2vid",
+    "expression_scale": 1.0, # This model works well with default
+}
+SADTALKER_VERSION = WORKING_SADTALKER_MODEL.split(":", 1)[1]
+
+def sadtalker_input(source_image, audio_path):
+    """SadTalker input with the audio read into memory, so no file is left open if the call is abandoned."""
+    with open(audio_path, "rb") as f:
+        driven_audio = io.BytesIO(f.read())
+    driven_audio.name = os.path.basename(audio_path)
+    return {"source_image": source_image, "driven_audio": driven_audio, **SADTALKER_PARAMS}
+
+# Prepared avatars (downscaled bytes + reusable upload), one per image path
+_avatars = {}
+_avatars_lock = threading.Lock()
+
+def avatar_for(image_path):
+    with _avatars_lock:
+        if image_path not in _avatars:
+            _avatars[image_path] = avatar_assets.AvatarAssets(image_path)
+        return _avatars[image_path]
+
+# Avatar digests keyed by (path, mtime, size) so the image is hashed once, not per request
+_image_digests = {}
+
+def _image_digest(image_path):
+    stat = os.stat(image_path)
+    marker = (os.path.abspath(image_path), stat.st_mtime, stat.st_size)
+    if marker not in _image_digests:
+        _image_digests[marker] = artifact_cache.file_digest(image_path)
+    return _image_digests[marker]
+
+def video_cache_key(image_path: str, audio_path: str) -> str:
+    """Cache key covering the avatar (and its preprocessing), the driven audio and the SadTalker settings."""
+    return artifact_cache.digest(
+        _image_digest(image_path),
+        avatar_for(image_path).size,
+        artifact_cache.file_digest(audio_path),
+        WORKING_SADTALKER_MODEL,
+        SADTALKER_PARAMS,
+    )
+
+def save_video(output, file_path: str) -> bool:
+    """Downloads a SadTalker output (file object or URL) to a local path."""
+    try:
+        if hasattr(output, "read"):
+            data = output.read()
+            with open(file_path, "wb") as f:
+                f.write(data)
+        else:
+            with urllib.request.urlopen(str(output), timeout=60) as response, open(file_path, "wb") as f:
+                shutil.copyfileobj(response, f)
+        return os.path.getsize(file_path) > 0
+    except Exception as e:
+        print(f"   -> Face Error: could not download video: {e}")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return False
+
 def print_progress_indicator(stop_event):
     """Show progress dots while video is being generated"""
     i = 0
@@ -39,6 +106,9 @@ def generate_lip_sync_video(image_path: str, audio_path: str) -> str:
     if not os.path.exists(audio_path):
         print(f"   -> Face Error: Driven audio not found at {audio_path}")
         return None
+    if not os.getenv("REPLICATE_API_TOKEN"):
+        print("   -> Face Error: REPLICATE_API_TOKEN not set, cannot generate video")
+        return None
 
     print(f"🙂 Face module generating video with a stable model...")
     
@@ -50,18 +120,14 @@ def generate_lip_sync_video(image_path: str, audio_path: str) -> str:
         progress_thread.start()
         start_time = time.time()
         
-        with open(image_path, "rb") as image_file, open(audio_path, "rb") as audio_file:
+        # The downscaled avatar is uploaded once and its URL reused
+        source_image = avatar_for(image_path).input_value()
+        # Past VIDEO_DEADLINE (or while SadTalker keeps failing) the reply stays audio-only
+        with resilience.breakers['video'].guard():
             # Call the WORKING model version
-            output = replicate.run(
-                WORKING_SADTALKER_MODEL,
-                input={
-                    "source_image": image_file,
-                    "driven_audio": audio_file,
-                    "preprocess": "crop",
-                    "still": True,
-                    "facerender": "facevid2vid",
-                    "expression_scale": 1.0, # This model works well with default
-                }
+            output = resilience.replicate_prediction(
+                SADTALKER_VERSION, sadtalker_input(source_image, audio_path),
+                resilience.VIDEO_DEADLINE, "video",
             )
         
         end_time = time.time()
@@ -84,6 +150,55 @@ def generate_lip_sync_video(image_path: str, audio_path: str) -> str:
         print(f"   -> Please check your Replicate account credits and API key.")
         return None
 
+async def generate_lip_sync_video_async(image_path: str, audio_path: str):
+    """
+    Non-blocking twin of generate_lip_sync_video, used by the asyncio web server.
+    """
+    if not os.path.exists(image_path):
+        print(f"   -> Face Error: Source image not found at {image_path}")
+        return None
+    if not os.path.exists(audio_path):
+        print(f"   -> Face Error: Driven audio not found at {audio_path}")
+        return None
+    if not os.getenv("REPLICATE_API_TOKEN"):
+        print("   -> Face Error: REPLICATE_API_TOKEN not set, cannot generate video")
+        return None
+
+    print(f"🙂 Face module generating video with a stable model...")
+    start_time = time.time()
+
+    try:
+        source_image = await asyncio.to_thread(avatar_for(image_path).input_value)
+        with resilience.breakers['video'].guard():
+            output = await resilience.replicate_prediction_async(
+                SADTALKER_VERSION, sadtalker_input(source_image, audio_path),
+                resilience.VIDEO_DEADLINE, "video",
+            )
+
+        processing_time = int(time.time() - start_time)
+        print(f"   -> ✅ Video generated successfully in {processing_time} seconds!")
+        return output
+
+    except Exception as e:
+        print(f"   -> ❌ Video generation failed: {e}")
+        print(f"   -> Please check your Replicate account credits and API key.")
+        return None
+
+async def save_video_async(output, file_path: str) -> bool:
+    """Downloads a SadTalker output without blocking the event loop."""
+    if not hasattr(output, "aread"):
+        return await asyncio.to_thread(save_video, output, file_path)
+    try:
+        data = await output.aread()
+        with open(file_path, "wb") as f:
+            f.write(data)
+        return os.path.getsize(file_path) > 0
+    except Exception as e:
+        print(f"   -> Face Error: could not download video: {e}")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return False
+
 # Your other functions (cleanup, etc.) do not need to change.
 # For simplicity, I am omitting them here, but you should keep them in your file.
 # Make sure to remove the fallback function as it is no longer needed.
@@ -0,0 +1,146 @@
+# --- phrase_bank.py: pre-rendered phrases and latency-masking fillers ---
+
+import os
+import re
+import json
+import random
+import threading
+
+# Short lines the therapist persona comes back to again and again
+DEFAULT_PHRASES = [
+    "That sounds incredibly difficult to carry.",
+    "That sounds really hard.",
+    "It's alright to not have all the answers right now.",
+    "I'm here with you.",
+    "Thank you for sharing that with me.",
+    "Take all the time you need.",
+]
+
+# Played while the LLM is still thinking, to hide the silent gap
+DEFAULT_FILLERS = [
+    "Mm, I hear you…",
+    "Mm-hmm.",
+    "I see…",
+]
+
+INDEX_FILENAME = "index.json"
+
+def normalize(text):
+    """Case- and whitespace-insensitive form used for exact matching."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def load_phrase_config(path):
+    """
+    Reads phrases and fillers from a JSON file shaped like
+    {"phrases": [...], "fillers": [...]}; missing keys fall back to the defaults.
+    """
+    config = {}
+    if path and os.path.exists(path):
+        try:
+            with open(path) as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"   -> ⚠️  Could not read phrase bank config {path}: {e}")
+    phrases = [str(p) for p in config.get("phrases", DEFAULT_PHRASES) if str(p).strip()]
+    fillers = [str(p) for p in config.get("fillers", DEFAULT_FILLERS) if str(p).strip()]
+    return phrases, fillers
+
+class PhraseBank:
+    """
+    Renders a fixed set of phrases once (warm-up) and keeps an index so they can
+    be answered instantly at runtime.
+
+    `key_fn(text)` names the audio file, so a change of voice or model renders
+    the phrases again instead of reusing stale audio. `extension` is the audio
+    format's (".mp3" for the web, ".pcm" for the terminal's in-process player).
+    """
+    def __init__(self, directory, key_fn, phrases=None, fillers=None, extension=".mp3"):
+        self.directory = directory
+        self.key_fn = key_fn
+        self.extension = extension
+        self.phrases = phrases if phrases is not None else list(DEFAULT_PHRASES)
+        self.fillers = fillers if fillers is not None else list(DEFAULT_FILLERS)
+        self.index = {}
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def audio_path(self, entry):
+        return os.path.join(self.directory, entry["audio"])
+
+    def warm_up(self, render_audio, render_video=None):
+        """
+        Renders any phrase or filler that is missing. `render_audio(text, path)`
+        returns True on success; `render_video(audio_path)` (optional) returns a URL.
+        """
+        print(f"📚 Warming up phrase bank ({len(self.phrases)} phrases, {len(self.fillers)} fillers)...")
+        rendered = 0
+        for kind, texts in (("phrase", self.phrases), ("filler", self.fillers)):
+            for text in texts:
+                filename = f"{self.key_fn(text)}{self.extension}"
+                path = os.path.join(self.directory, filename)
+                if not os.path.exists(path):
+                    if not render_audio(text, path):
+                        continue
+                    rendered += 1
+                entry = {"text": text, "kind": kind, "audio": filename}
+                with self.lock:
+                    previous = self.index.get(normalize(text), {})
+                video_url = previous.get("video_url") if previous.get("audio") == filename else None
+                if kind == "phrase" and render_video and not video_url:
+                    video_url = render_video(path)
+                if video_url:
+                    entry["video_url"] = video_url
+                with self.lock:
+                    self.index[normalize(text)] = entry
+        with self.lock:
+            self._save_index()
+        print(f"   ✅ Phrase bank ready ({rendered} newly rendered)")
+
+    def match(self, text):
+        """Index entry for a reply that exactly matches a banked phrase, or None."""
+        with self.lock:
+            entry = self.index.get(normalize(text))
+        if not entry or entry["kind"] != "phrase":
+            return None
+        # Audio rendered with an older voice/model no longer counts as a match
+        if entry["audio"] != f"{self.key_fn(entry['text'])}{self.extension}":
+            return None
+        if not os.path.exists(self.audio_path(entry)):
+            return None
+        return entry
+
+    def matched_audio(self, text):
+        """Pre-rendered audio bytes for a banked phrase, or None."""
+        entry = self.match(text)
+        if entry is None:
+            return None
+        with open(self.audio_path(entry), "rb") as f:
+            return f.read()
+
+    def filler_audio(self):
+        """Audio bytes for a random filler, or None if none are rendered."""
+        with self.lock:
+            entries = [e for e in self.index.values() if e["kind"] == "filler"]
+        entries = [e for e in entries if os.path.exists(self.audio_path(e))]
+        if not entries:
+            return None
+        with open(self.audio_path(random.choice(entries)), "rb") as f:
+            return f.read()
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_FILENAME)) as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def _save_index(self):
+        index_path = os.path.join(self.directory, INDEX_FILENAME)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.index, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print(f"   -> ⚠️  Could not save phrase bank index: {e}")
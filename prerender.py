@@ -0,0 +1,402 @@
+# --- prerender.py: batch pre-rendering of replies into the web app's caches ---
+#
+# Reads a JSONL file of prompts ({"prompt": ...}) and fixed replies
+# ({"reply": ...}) and runs them through the LLM, TTS and SadTalker offline.
+# Each stage has its own pool of workers, so all three provider quotas are
+# kept busy at once. Audio and video land in the artifact caches the web
+# app serves from (static/audio, static/videos). Replies to prompts are
+# offered to the response cache, so a later live request with the same
+# opener is answered from the caches end to end. Progress is checkpointed
+# to a JSONL file: a rerun skips finished items and reuses the replies that
+# were already generated.
+#
+#   python prerender.py onboarding.jsonl --llm-concurrency 8 --tts-concurrency 4 --video-concurrency 2
+#
+# Input lines look like:
+#   {"id": "welcome", "prompt": "Hi, I'm new here", "variants": 3}
+#   {"reply": "Take all the time you need.", "video": false}
+
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import contextlib
+
+import module2_brain as brain   # shared caches, prompt, phrase bank and response cache
+import module3_voice
+import module4_face
+import admission
+import resilience
+import artifact_cache
+import session_memory
+
+# --- Configuration ---
+# Workers per stage; the defaults follow the async server's provider limits
+PRERENDER_LLM_CONCURRENCY = int(os.getenv("PRERENDER_LLM_CONCURRENCY", os.getenv("LLM_CONCURRENCY", "8")))
+PRERENDER_TTS_CONCURRENCY = int(os.getenv("PRERENDER_TTS_CONCURRENCY", os.getenv("TTS_CONCURRENCY", "4")))
+PRERENDER_VIDEO_CONCURRENCY = int(os.getenv("PRERENDER_VIDEO_CONCURRENCY", str(brain.VIDEO_WORKERS)))
+# Attempts per item and stage after the first; a stage whose circuit is open is waited out
+PRERENDER_RETRIES = int(os.getenv("PRERENDER_RETRIES", "2"))
+RETRY_DELAY = 2.0
+PROGRESS_SECONDS = 10
+
+class Item:
+    """One reply on its way through the stages."""
+    def __init__(self, item_id, prompt=None, reply=None, video=True):
+        self.id = item_id
+        self.prompt = prompt
+        self.reply = reply
+        self.video = video
+        self.audio_path = None
+        self.audio_url = None
+        self.video_url = None
+        self.cached = []    # stages answered from a cache
+
+def read_items(path, variants, video):
+    """Items from a JSONL file; a prompt line yields `variants` items (or its own "variants")."""
+    items = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: {e}")
+            if not isinstance(entry, dict) or not (entry.get("prompt") or entry.get("reply")):
+                raise ValueError(f"{path}:{line_number}: expected an object with a \"prompt\" or a \"reply\"")
+            base_id = str(entry.get("id") or artifact_cache.digest(entry)[:12])
+            wants_video = bool(entry.get("video", video))
+            if entry.get("reply"):
+                items.append(Item(base_id, entry.get("prompt"), entry["reply"].strip(), wants_video))
+                continue
+            count = int(entry.get("variants", variants))
+            for variant in range(count):
+                item_id = base_id if count == 1 else f"{base_id}#{variant + 1}"
+                items.append(Item(item_id, entry["prompt"], None, wants_video))
+    return items
+
+class Checkpoint:
+    """
+    Append-only JSONL log of finished stages. "llm" records keep generated
+    replies, so a resumed run renders the same text. "done" records double
+    as the manifest of what was rendered where.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.replies = {}
+        self.done = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by an interrupted run
+                    if record.get("stage") == "llm":
+                        self.replies[record["id"]] = record["reply"]
+                    elif record.get("stage") == "done":
+                        self.done[record["id"]] = record
+        self.file = open(path, "a")
+
+    def write(self, record):
+        with self.lock:
+            if self.file is None:
+                return  # closed by an interrupted run
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.file = None
+
+class Stage:
+    """
+    A pool of `workers` threads that take items from an inbox, run
+    `work(item)` and pass the items that succeed on to `next_stage`.
+    `work` returns True if it did the work, False if a cache already had
+    the result, and None if the item does not need this stage. Failures
+    are retried PRERENDER_RETRIES times and then reported to `out`.
+    """
+    def __init__(self, name, work, workers, next_stage=None, on_failure=None, out=None):
+        self.name = name
+        self.work = work
+        self.workers = max(1, workers)
+        self.next_stage = next_stage
+        self.on_failure = on_failure
+        self.out = out
+        self.inbox = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+        # Totals for stats()
+        self.active = 0
+        self.rendered = 0
+        self.cached = 0
+        self.skipped = 0
+        self.failed = 0
+        self.retries = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self):
+        self.started_at = time.time()
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._run, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, item):
+        self.inbox.put(item)
+
+    def close(self):
+        """Wait for everything queued so far to go through."""
+        for _ in self.threads:
+            self.inbox.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.finished_at = time.time()
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                return
+            with self.lock:
+                self.active += 1
+            start = time.time()
+            rendered, error = self._attempt(item)
+            with self.lock:
+                self.active -= 1
+                self.busy_seconds += time.time() - start
+                if error:
+                    self.failed += 1
+                elif rendered:
+                    self.rendered += 1
+                elif rendered is None:
+                    self.skipped += 1
+                else:
+                    self.cached += 1
+            if error:
+                print(f"   -> ❌ {self.name} failed for {item.id}: {error}", file=self.out, flush=True)
+                if self.on_failure:
+                    self.on_failure(item, self.name, error)
+            else:
+                if rendered is False:
+                    item.cached.append(self.name)
+                if self.next_stage:
+                    self.next_stage.put(item)
+
+    def _attempt(self, item):
+        """(rendered, error) after up to PRERENDER_RETRIES retries."""
+        error = None
+        for attempt in range(PRERENDER_RETRIES + 1):
+            if attempt:
+                with self.lock:
+                    self.retries += 1
+                breaker = resilience.breakers.get(self.name)
+                if breaker and breaker.stats()['state'] == resilience.OPEN:
+                    time.sleep(breaker.reset_seconds)  # fail-fast calls would only burn the retries
+                else:
+                    time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+            try:
+                return self.work(item), None
+            except Exception as e:
+                error = e
+        return False, error
+
+    def stats(self):
+        with self.lock:
+            elapsed = (self.finished_at or time.time()) - (self.started_at or time.time())
+            processed = self.rendered + self.cached + self.skipped + self.failed
+            return {
+                'workers': self.workers,
+                'queued': self.inbox.qsize(),
+                'active': self.active,
+                'rendered': self.rendered,
+                'cached': self.cached,
+                'skipped': self.skipped,
+                'failed': self.failed,
+                'retries': self.retries,
+                # Provider throughput: cache hits and skips don't count
+                'per_minute': round(60 * self.rendered / elapsed, 1) if elapsed > 0 else 0.0,
+                'mean_seconds': round(self.busy_seconds / processed, 2) if processed else None,
+                # Share of the stage's worker time spent on items; low means the stage was starved
+                'utilization': round(self.busy_seconds / (elapsed * self.workers), 3) if elapsed > 0 else 0.0,
+            }
+
+class Prerenderer:
+    """Runs items through LLM -> TTS -> video stages, writing to the web app's caches."""
+    def __init__(self, checkpoint, llm_workers=PRERENDER_LLM_CONCURRENCY,
+                 tts_workers=PRERENDER_TTS_CONCURRENCY, video_workers=PRERENDER_VIDEO_CONCURRENCY, out=None):
+        self.checkpoint = checkpoint
+        # Full-length replies, as an unloaded server would give them
+        self.decision = admission.Decision(admission.NORMAL, admission.VIDEO_NOW,
+                                           brain.LLM_INPUT["max_new_tokens"], [])
+        self.finished = 0
+        self.lock = threading.Lock()
+        # Failures are reported to `out`, which stays visible when the pipeline's own logging is hidden
+        self.done = Stage("done", self.finish, 1, out=out)
+        self.video = Stage("video", self.render_video, video_workers, self.done, on_failure=self.failed, out=out)
+        self.tts = Stage("tts", self.render_audio, tts_workers, self.video, on_failure=self.failed, out=out)
+        self.llm = Stage("llm", self.generate_reply, llm_workers, self.tts, on_failure=self.failed, out=out)
+        self.stages = [self.llm, self.tts, self.video]
+
+    def generate_reply(self, item):
+        prompt = session_memory.Session("prerender").build_prompt(item.prompt)
+        reply = "".join(str(token) for token in brain.stream_llm(prompt, self.decision)).strip()
+        if not reply:
+            raise RuntimeError("AI generated empty response")
+        item.reply = reply
+        self.checkpoint.write({'id': item.id, 'stage': "llm", 'prompt': item.prompt, 'reply': reply})
+        return True
+
+    def render_audio(self, item):
+        banked = brain.bank.match(item.reply)
+        if banked:
+            item.audio_path = brain.bank.audio_path(banked)
+            item.audio_url = f"{brain.app.static_url_path}/phrases/{banked['audio']}"
+            return False
+        cache_key = module3_voice.audio_cache_key(item.reply)
+        item.audio_path = brain.audio_cache.path_for(cache_key)
+        item.audio_url = f"{brain.app.static_url_path}/audio/{brain.audio_cache.filename_for(cache_key)}"
+        if brain.audio_cache.lookup(cache_key):
+            return False
+        render = lambda tmp_path: module3_voice.text_to_audio_file(item.reply, tmp_path)
+        if not brain.audio_cache.create(cache_key, render):
+            raise RuntimeError("audio generation failed")
+        return True
+
+    def render_video(self, item):
+        if not item.video or not os.path.exists(brain.AVATAR_IMAGE_PATH):
+            return None
+        cache_key = module4_face.video_cache_key(brain.AVATAR_IMAGE_PATH, item.audio_path)
+        if brain.video_cache.lookup(cache_key):
+            item.video_url = f"{brain.VIDEO_URL_PREFIX}/{brain.video_cache.filename_for(cache_key)}"
+            return False
+        # generate_video() falls back to SadTalker's expiring remote URL when the
+        # download fails; only a video in the cache counts as pre-rendered
+        if not brain.generate_video(item.audio_path) or not brain.video_cache.lookup(cache_key):
+            raise RuntimeError("video generation failed or was not saved to the cache")
+        item.video_url = f"{brain.VIDEO_URL_PREFIX}/{brain.video_cache.filename_for(cache_key)}"
+        return True
+
+    def finish(self, item):
+        if item.prompt and item.reply:
+            brain.reply_cache.add(item.prompt, item.reply)
+        self.checkpoint.write({
+            'id': item.id, 'stage': "done", 'prompt': item.prompt, 'reply': item.reply,
+            'audio_url': item.audio_url, 'video_url': item.video_url, 'cached': item.cached,
+        })
+        with self.lock:
+            self.finished += 1
+        return True
+
+    def failed(self, item, stage, error):
+        self.checkpoint.write({'id': item.id, 'stage': "failed", 'failed_stage': stage, 'error': str(error)})
+
+    def run(self, items):
+        """Render `items` (skipping finished ones); returns how many were already done."""
+        for stage in self.stages + [self.done]:
+            stage.start()
+        resumed = 0
+        for item in items:
+            if item.id in self.checkpoint.done:
+                resumed += 1
+            elif item.reply:
+                self.tts.put(item)
+            elif item.id in self.checkpoint.replies:
+                item.reply = self.checkpoint.replies[item.id]
+                item.cached.append("llm")
+                self.tts.put(item)
+            else:
+                self.llm.put(item)
+        # Each stage only closes once everything upstream has been handed to it
+        for stage in self.stages + [self.done]:
+            stage.close()
+        return resumed
+
+    def progress(self, total):
+        parts = []
+        for stage in self.stages:
+            stats = stage.stats()
+            parts.append(f"{stage.name} {stats['rendered'] + stats['cached'] + stats['skipped']} ok, {stats['failed']} failed, "
+                         f"{stats['active']}/{stats['workers']} busy, {stats['queued']} queued")
+        return f"⏳ {self.finished}/{total} finished | " + " | ".join(parts)
+
+def print_report(prerenderer, total, resumed, elapsed, out=sys.stdout):
+    print(f"\n📦 Finished {prerenderer.finished + resumed} of {total} items in {elapsed:.1f}s"
+          f" ({resumed} of them in an earlier run)", file=out)
+    if elapsed > 0:
+        print(f"   -> {60 * prerenderer.finished / elapsed:.1f} items/min overall", file=out)
+    print(f"   {'stage':<6} {'workers':>7} {'rendered':>8} {'cached':>6} {'skipped':>7} {'failed':>6} {'retries':>7}"
+          f" {'per min':>8} {'mean s':>7} {'util':>6}", file=out)
+    for stage in prerenderer.stages:
+        s = stage.stats()
+        mean = f"{s['mean_seconds']:.2f}" if s['mean_seconds'] is not None else "-"
+        print(f"   {stage.name:<6} {s['workers']:>7} {s['rendered']:>8} {s['cached']:>6} {s['skipped']:>7} {s['failed']:>6}"
+              f" {s['retries']:>7} {s['per_minute']:>8} {mean:>7} {s['utilization']:>6.0%}", file=out)
+    for name, cache in (("audio", brain.audio_cache), ("video", brain.video_cache)):
+        stats = cache.stats()
+        print(f"   -> {name} cache: {stats['entries']} files, {stats['total_bytes'] / 1e6:.1f} MB"
+              f" of {stats['max_bytes'] / 1e6:.0f} MB", file=out)
+        if stats['evictions']:
+            print(f"   -> ⚠️  {stats['evictions']} {name} files were evicted to make room;"
+                  f" raise {name.upper()}_CACHE_MAX_MB to keep everything", file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render replies into the web app's audio and video caches")
+    parser.add_argument("input", help="JSONL file of {\"prompt\": ...} and {\"reply\": ...} lines")
+    parser.add_argument("--checkpoint", help="progress file (default: <input>.checkpoint.jsonl)")
+    parser.add_argument("--llm-concurrency", type=int, default=PRERENDER_LLM_CONCURRENCY)
+    parser.add_argument("--tts-concurrency", type=int, default=PRERENDER_TTS_CONCURRENCY)
+    parser.add_argument("--video-concurrency", type=int, default=PRERENDER_VIDEO_CONCURRENCY)
+    parser.add_argument("--variants", type=int, default=brain.reply_cache.variants,
+                        help="replies generated per prompt (the response cache serves an opener once it has this many)")
+    parser.add_argument("--no-video", action="store_true", help="audio only, unless a line asks for video")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own logging")
+    args = parser.parse_args(argv)
+
+    try:
+        items = read_items(args.input, args.variants, not args.no_video)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    checkpoint = Checkpoint(args.checkpoint or f"{args.input}.checkpoint.jsonl")
+    out = sys.stdout
+    prerenderer = Prerenderer(checkpoint, args.llm_concurrency, args.tts_concurrency, args.video_concurrency, out)
+    print(f"📦 Pre-rendering {len(items)} items (LLM x{args.llm_concurrency}, TTS x{args.tts_concurrency},"
+          f" video x{args.video_concurrency}), checkpoint {checkpoint.path}")
+
+    stop = threading.Event()
+
+    def report_progress():
+        while not stop.wait(PROGRESS_SECONDS):
+            print(prerenderer.progress(len(items)), file=out, flush=True)
+
+    threading.Thread(target=report_progress, daemon=True).start()
+    start = time.time()
+    resumed = 0
+    interrupted = False
+    try:
+        with contextlib.ExitStack() as stack:
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stdout(open(os.devnull, "w")))
+            resumed = prerenderer.run(items)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\nInterrupted; rerun the same command to resume.", file=out)
+    finally:
+        stop.set()
+        checkpoint.close()
+    print_report(prerenderer, len(items), resumed, time.time() - start, out)
+    failed = sum(stage.stats()['failed'] for stage in prerenderer.stages)
+    return 1 if failed or interrupted else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,574 @@
+# --- resilience.py: stage deadlines, hedged LLM requests and per-provider circuit breakers ---
+#
+# Our tail latency comes from occasional multi-second provider stalls, not
+# from the median. So every provider call runs under a stage deadline. A
+# streamed LLM request that has no first token by the recent
+# LLM_HEDGE_PERCENTILE of first-token latency is raced against an identical
+# second request, and the loser is cancelled. Each provider has a circuit
+# breaker: once it keeps failing, callers skip it at once and use their
+# text-only or audio-only fallback instead of waiting out its deadline.
+
+import os
+import time
+import queue
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+import metrics
+
+# --- Deadline Configuration (seconds) ---
+LLM_FIRST_TOKEN_DEADLINE = float(os.getenv("LLM_FIRST_TOKEN_DEADLINE", "8"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "30"))
+TTS_DEADLINE = float(os.getenv("TTS_DEADLINE", "20"))
+VIDEO_DEADLINE = float(os.getenv("VIDEO_DEADLINE", "180"))
+
+# --- Hedging Configuration ---
+# Hedge once the first token is later than this percentile of recent ones (0 disables)
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Never hedge sooner than this, however fast recent first tokens were
+HEDGE_MIN_DELAY = 0.5
+# Used until a first-token latency has been observed
+HEDGE_DEFAULT_DELAY = 2.0
+
+# --- Circuit Breaker Configuration ---
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class DeadlineExceeded(TimeoutError):
+    """A provider call ran past its stage deadline."""
+
+class CircuitOpen(RuntimeError):
+    """The provider's breaker is open, so the call was not made."""
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures of one provider. After `failure_threshold` of
+    them the breaker opens and calls fail fast with CircuitOpen for
+    `reset_seconds`. Then a single trial call is let through (half-open),
+    and its outcome closes the breaker or opens it again. A trial that never
+    reports back (e.g. the user interrupted it) is replaced after
+    `reset_seconds`.
+    """
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+        # Totals for stats()
+        self.calls = 0
+        self.failed = 0
+        self.rejected = 0
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """Raises CircuitOpen unless a call may go ahead now."""
+        with self.lock:
+            now = time.time()
+            if self.state == OPEN and now - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+                self.trial_started_at = None
+            trial_pending = (self.trial_started_at is not None
+                             and now - self.trial_started_at < self.reset_seconds)
+            if self.state == OPEN or (self.state == HALF_OPEN and trial_pending):
+                self.rejected += 1
+                retry_in = max(0.0, self.reset_seconds - (now - self.opened_at))
+                raise CircuitOpen(f"{self.name} circuit is open (next try in {retry_in:.0f}s)")
+            if self.state == HALF_OPEN:
+                self.trial_started_at = now
+            self.calls += 1
+
+    def record_success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                print(f"   -> 🔌 {self.name} is answering again, circuit closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_started_at = None
+
+    def record_failure(self, error):
+        with self.lock:
+            self.failures += 1
+            self.failed += 1
+            self.trial_started_at = None
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.time()
+                self.opened += 1
+                print(f"   -> 🔌 {self.name} circuit opened after {self.failures} failure(s): {error}")
+
+    @contextmanager
+    def guard(self):
+        """Wraps one call: CircuitOpen if it may not run, and its outcome is recorded."""
+        self.before_call()
+        try:
+            yield
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'calls': self.calls,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'opened': self.opened,
+            }
+
+# One breaker per provider; SadTalker and Llama both run on Replicate but fail independently
+breakers = {
+    'llm': CircuitBreaker("Replicate (Llama 3)"),
+    'tts': CircuitBreaker("ElevenLabs"),
+    'video': CircuitBreaker("Replicate (SadTalker)"),
+}
+
+# Totals for stats()
+_counts = {'hedged': 0, 'hedge_wins': 0, 'deadlines': {}}
+_counts_lock = threading.Lock()
+
+def _count_deadline(stage):
+    with _counts_lock:
+        _counts['deadlines'][stage] = _counts['deadlines'].get(stage, 0) + 1
+
+def stats():
+    """Breaker states and hedge/deadline totals, for /status."""
+    with _counts_lock:
+        counts = {'hedged': _counts['hedged'], 'hedge_wins': _counts['hedge_wins'],
+                  'deadlines_exceeded': dict(_counts['deadlines'])}
+    return {
+        'breakers': {name: breaker.stats() for name, breaker in breakers.items()},
+        'hedge_after_seconds': hedge_delay(),
+        **counts,
+    }
+
+def hedge_delay(pct=LLM_HEDGE_PERCENTILE):
+    """Seconds to wait for a first token before hedging, or None when hedging is off."""
+    if not pct:
+        return None
+    observed = metrics.recent.percentile("llm_first_token", pct)
+    return round(max(HEDGE_MIN_DELAY, HEDGE_DEFAULT_DELAY if observed is None else observed), 3)
+
+# --- Blocking callers (Flask threads, terminal loop) ---
+
+def iterate_within(iterable, deadline, stage):
+    """
+    Yields from `iterable` (pulled on a helper thread) until it ends, raising
+    DeadlineExceeded once `deadline` seconds have passed. An abandoned
+    iterator is closed by the helper as soon as its pending item arrives.
+    """
+    items = queue.Queue()
+    stop = threading.Event()
+    end = object()
+
+    def pull():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    break
+                items.put((item, None))
+        except Exception as e:
+            items.put((end, e))
+            return
+        finally:
+            if stop.is_set() and hasattr(iterable, "close"):
+                iterable.close()
+        items.put((end, None))
+
+    threading.Thread(target=contextvars.copy_context().run, args=(pull,), daemon=True).start()
+    deadline_at = time.time() + deadline
+    try:
+        while True:
+            try:
+                item, error = items.get(timeout=max(0.0, deadline_at - time.time()))
+            except queue.Empty:
+                _count_deadline(stage)
+                raise DeadlineExceeded(f"{stage} took longer than {deadline:g}s")
+            if error is not None:
+                raise error
+            if item is end:
+                return
+            yield item
+    finally:
+        stop.set()
+
+def call_within(fn, deadline, stage, *args, **kwargs):
+    """
+    fn(*args, **kwargs) on a helper thread, raising DeadlineExceeded after
+    `deadline` seconds. The call itself cannot be interrupted and finishes
+    in the background, but the caller is free to fall back.
+    """
+    result = {}
+    done = threading.Event()
+
+    def run():
+        try:
+            result['value'] = fn(*args, **kwargs)
+        except Exception as e:
+            result['error'] = e
+        done.set()
+
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+    if not done.wait(deadline):
+        _count_deadline(stage)
+        raise DeadlineExceeded(f"{stage} took longer than {deadline:g}s")
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+def _is_output(event):
+    """True for the server-sent events that carry output; `logs` and `done` don't."""
+    kind = getattr(event, "event", "output")  # plain strings are output
+    return getattr(kind, "value", kind) == "output"
+
+def replicate_stream(model, input):
+    """hedged_stream() attempt: a streamed Replicate prediction, cancellable on its own."""
+    def start():
+        import replicate  # imported on first use, so startup doesn't pay for the SDK
+
+        prediction = replicate.predictions.create(model=model, input=input, stream=True)
+        tokens = (str(event) for event in prediction.stream() if _is_output(event))
+        return tokens, prediction.cancel
+    return start
+
+def replicate_prediction(version, input, deadline, stage):
+    """
+    Runs a Replicate prediction to completion and returns its output. Past
+    `deadline` seconds the prediction is cancelled (it would otherwise keep
+    running, and billing, after the caller gave up) and DeadlineExceeded is
+    raised.
+    """
+    import replicate
+
+    state = {'prediction': None, 'abandoned': False}
+    lock = threading.Lock()
+
+    def run():
+        prediction = replicate.predictions.create(version=version, input=input)
+        with lock:
+            state['prediction'] = prediction
+            abandoned = state['abandoned']
+        if abandoned:
+            prediction.cancel()
+            return None
+        prediction.wait()
+        if prediction.status != "succeeded":
+            raise RuntimeError(prediction.error or f"prediction {prediction.status}")
+        return prediction.output
+
+    try:
+        return call_within(run, deadline, stage)
+    except DeadlineExceeded:
+        with lock:
+            state['abandoned'] = True
+            prediction = state['prediction']
+        if prediction is not None:
+            try:
+                prediction.cancel()
+            except Exception:
+                pass
+        raise
+
+def hedged_stream(start, stage="llm", hedge_after=None, first_deadline=LLM_FIRST_TOKEN_DEADLINE,
+                  deadline=LLM_DEADLINE, breaker=None, cancel_event=None):
+    """
+    Yields the items of one attempt, where `start()` returns (iterator, cancel).
+    If no item has arrived after `hedge_after` seconds (default: hedge_delay()),
+    a second attempt is started and whichever yields first is streamed; the
+    other is cancelled. Raises DeadlineExceeded if there is no first item
+    within `first_deadline` or the stream runs past `deadline`. Closing the
+    generator early cancels every attempt; so does setting `cancel_event`
+    (barge-in), which works from any thread and then ends the stream.
+    """
+    breaker = breaker or breakers['llm']
+    breaker.before_call()
+    hedge_after = hedge_delay() if hedge_after is None else hedge_after
+    events = queue.Queue()
+    attempts = []  # per attempt: {'stop', 'cancel', 'finished'}
+    lock = threading.Lock()
+
+    def cancel_attempt(attempt):
+        with lock:
+            attempt['stop'].set()
+            cancel = None if attempt['finished'] else attempt['cancel']
+            attempt['cancel'] = None  # once is enough
+        if cancel:
+            try:
+                cancel()
+            except Exception:
+                pass
+
+    def launch():
+        index = len(attempts)
+        attempt = {'stop': threading.Event(), 'cancel': None, 'finished': False}
+        attempts.append(attempt)
+
+        def run():
+            try:
+                iterator, cancel = start()
+                with lock:
+                    attempt['cancel'] = cancel
+                if attempt['stop'].is_set():
+                    cancel_attempt(attempt)
+                    return
+                for item in iterator:
+                    if attempt['stop'].is_set():
+                        return
+                    events.put((index, 'item', item))
+                with lock:
+                    attempt['finished'] = True
+                events.put((index, 'end', None))
+            except Exception as e:
+                with lock:
+                    attempt['finished'] = True
+                events.put((index, 'error', e))
+
+        threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+
+    ended = threading.Event()
+
+    def stop_on_cancel():
+        # The consumer may be blocked waiting for a token, so cancel from here
+        while not ended.is_set():
+            if cancel_event.wait(0.05):
+                for attempt in list(attempts):
+                    cancel_attempt(attempt)
+                events.put((None, 'cancelled', None))
+                return
+
+    if cancel_event:
+        threading.Thread(target=stop_on_cancel, daemon=True).start()
+
+    started_at = time.time()
+    first_by = started_at + first_deadline
+    end_by = started_at + deadline
+    hedge_at = started_at + hedge_after if hedge_after else None
+    winner = None
+    failed = set()
+    launch()
+    try:
+        while True:
+            limit = end_by if winner is not None else min(first_by, end_by)
+            if winner is None and hedge_at and len(attempts) == 1:
+                limit = min(limit, hedge_at)
+            try:
+                index, kind, value = events.get(timeout=max(0.0, limit - time.time()))
+            except queue.Empty:
+                if (winner is None and hedge_at and len(attempts) == 1 and time.time() < first_by
+                        and not (cancel_event and cancel_event.is_set())):
+                    print(f"   -> ⏱️  No first token after {hedge_after:.1f}s, sending a hedged request")
+                    with _counts_lock:
+                        _counts['hedged'] += 1
+                    launch()
+                    continue
+                stage_name = f"{stage}_first_token" if winner is None else stage
+                _count_deadline(stage_name)
+                raise DeadlineExceeded(f"{stage_name} took longer than "
+                                       f"{first_deadline if winner is None else deadline:g}s")
+            if kind == 'cancelled':
+                return
+            if winner is not None and index != winner:
+                continue
+            if kind == 'error':
+                failed.add(index)
+                if winner is None and len(failed) < len(attempts):
+                    continue  # the other attempt may still answer
+                raise value
+            if winner is None:
+                winner = index
+                for other, attempt in enumerate(attempts):
+                    if other != winner:
+                        cancel_attempt(attempt)
+                if winner > 0:
+                    print("   -> ⏱️  Hedged request answered first")
+                    with _counts_lock:
+                        _counts['hedge_wins'] += 1
+            if kind == 'end':
+                break
+            yield value
+    except GeneratorExit:
+        raise
+    except Exception as e:
+        breaker.record_failure(e)
+        raise
+    finally:
+        ended.set()
+        for attempt in attempts:
+            cancel_attempt(attempt)
+    breaker.record_success()
+
+# --- asyncio callers (async_server) ---
+
+async def call_within_async(awaitable, deadline, stage):
+    """Awaits `awaitable`, cancelling it and raising DeadlineExceeded after `deadline` seconds."""
+    try:
+        return await asyncio.wait_for(awaitable, deadline)
+    except asyncio.TimeoutError:
+        _count_deadline(stage)
+        raise DeadlineExceeded(f"{stage} took longer than {deadline:g}s")
+
+async def iterate_within_async(aiterable, deadline, stage):
+    """Async twin of iterate_within."""
+    iterator = aiterable.__aiter__()
+    deadline_at = time.time() + deadline
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(iterator.__anext__(), max(0.0, deadline_at - time.time()))
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                _count_deadline(stage)
+                raise DeadlineExceeded(f"{stage} took longer than {deadline:g}s")
+            yield item
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+def replicate_stream_async(model, input):
+    """hedged_stream_async() attempt: a streamed Replicate prediction."""
+    async def start():
+        import replicate
+
+        prediction = await replicate.predictions.async_create(model=model, input=input, stream=True)
+
+        async def tokens():
+            async for event in prediction.async_stream():
+                if _is_output(event):
+                    yield str(event)
+        return tokens(), prediction.async_cancel
+    return start
+
+async def replicate_prediction_async(version, input, deadline, stage):
+    """Async twin of replicate_prediction."""
+    import replicate
+
+    created = []
+
+    async def run():
+        prediction = await replicate.predictions.async_create(version=version, input=input)
+        created.append(prediction)
+        await prediction.async_wait()
+        if prediction.status != "succeeded":
+            raise RuntimeError(prediction.error or f"prediction {prediction.status}")
+        return prediction.output
+
+    try:
+        return await call_within_async(run(), deadline, stage)
+    except DeadlineExceeded:
+        for prediction in created:
+            try:
+                await prediction.async_cancel()
+            except Exception:
+                pass
+        raise
+
+async def hedged_stream_async(start, stage="llm", hedge_after=None, first_deadline=LLM_FIRST_TOKEN_DEADLINE,
+                              deadline=LLM_DEADLINE, breaker=None, slots=None):
+    """
+    Async twin of hedged_stream; `start()` is a coroutine returning (async iterator, async cancel).
+    `slots` is the provider's asyncio.Semaphore, of which the caller holds a slot for the
+    first attempt: a hedge takes a slot of its own, and is not sent while none is free.
+    """
+    breaker = breaker or breakers['llm']
+    breaker.before_call()
+    hedge_after = hedge_delay() if hedge_after is None else hedge_after
+    events = asyncio.Queue()
+    tasks = []
+    cancels = {}
+
+    async def run(index):
+        try:
+            iterator, cancel = await start()
+            cancels[index] = cancel
+            async for item in iterator:
+                await events.put((index, 'item', item))
+            cancels.pop(index, None)
+            await events.put((index, 'end', None))
+        except asyncio.CancelledError:
+            cancel = cancels.pop(index, None)
+            if cancel:
+                try:
+                    await cancel()
+                except Exception:
+                    pass
+            raise
+        except Exception as e:
+            cancels.pop(index, None)
+            await events.put((index, 'error', e))
+
+    async def run_in_slot(index):
+        async with slots:
+            await run(index)
+
+    def launch():
+        index = len(tasks)
+        tasks.append(asyncio.create_task(run_in_slot(index) if index and slots is not None else run(index)))
+
+    started_at = time.time()
+    first_by = started_at + first_deadline
+    end_by = started_at + deadline
+    hedge_at = started_at + hedge_after if hedge_after else None
+    winner = None
+    failed = set()
+    launch()
+    try:
+        while True:
+            limit = end_by if winner is not None else min(first_by, end_by)
+            if winner is None and hedge_at and len(tasks) == 1:
+                limit = min(limit, hedge_at)
+            try:
+                index, kind, value = await asyncio.wait_for(events.get(), max(0.0, limit - time.time()))
+            except asyncio.TimeoutError:
+                if winner is None and hedge_at and len(tasks) == 1 and time.time() < first_by:
+                    if slots is not None and slots.locked():
+                        hedge_at = None  # every slot is busy: keep waiting on the first attempt
+                        continue
+                    print(f"   -> ⏱️  No first token after {hedge_after:.1f}s, sending a hedged request")
+                    with _counts_lock:
+                        _counts['hedged'] += 1
+                    launch()
+                    continue
+                stage_name = f"{stage}_first_token" if winner is None else stage
+                _count_deadline(stage_name)
+                raise DeadlineExceeded(f"{stage_name} took longer than "
+                                       f"{first_deadline if winner is None else deadline:g}s")
+            if winner is not None and index != winner:
+                continue
+            if kind == 'error':
+                failed.add(index)
+                if winner is None and len(failed) < len(tasks):
+                    continue
+                raise value
+            if winner is None:
+                winner = index
+                for other, task in enumerate(tasks):
+                    if other != winner:
+                        task.cancel()
+                if winner > 0:
+                    print("   -> ⏱️  Hedged request answered first")
+                    with _counts_lock:
+                        _counts['hedge_wins'] += 1
+            if kind == 'end':
+                break
+            yield value
+    except (GeneratorExit, asyncio.CancelledError):
+        raise
+    except Exception as e:
+        breaker.record_failure(e)
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+    breaker.record_success()
@@ -0,0 +1,220 @@
+# --- response_cache.py: replies to common openers, found by near-duplicate lookup ---
+#
+# Conversations very often open the same way ("hi", "hello there", "I feel
+# sad today"). Short openers are normalized (case, punctuation, leading
+# fillers) and matched against earlier ones with the same content words by
+# character trigram similarity.
+# Once a few different replies have been collected for one, it is answered
+# from the cache without calling the LLM. The reply text then repeats too,
+# so the audio and video caches hit as well. The cache is kept in a small
+# JSON file, so it outlives restarts (and the terminal's one opener per run).
+
+import os
+import re
+import json
+import time
+import random
+import threading
+from collections import OrderedDict
+
+# --- Configuration ---
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1") == "1"
+# Dice similarity of character trigrams needed to count as the same opener
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.85"))
+# Replies collected per opener before it is served from the cache (and rotated through)
+RESPONSE_CACHE_VARIANTS = int(os.getenv("RESPONSE_CACHE_VARIANTS", "3"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+# Only openers this short are cached; longer messages say something specific
+RESPONSE_CACHE_MAX_WORDS = int(os.getenv("RESPONSE_CACHE_MAX_WORDS", "8"))
+# Empty keeps the cache in memory only
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", ".response_cache.json")
+
+# Dropped from the start of an opener only ("well" and "so" mean something later on)
+FILLER_WORDS = {"um", "umm", "uh", "uhh", "uhm", "er", "erm", "ah", "hmm", "hm", "mm", "mmm", "oh", "well", "so"}
+FILLER_PHRASES = ("you know", "i mean")
+# Words two openers may differ in; any other word (sad/mad, not, lonely/lovely) makes them different
+FUNCTION_WORDS = {"a", "an", "the", "so", "very", "really", "just", "too", "quite", "am", "is", "are", "to", "and"}
+NGRAM = 3
+
+def normalize(text):
+    """Lower case, no punctuation, no leading fillers, single spaces: "Um, hi there!" -> "hi there"."""
+    text = re.sub(r"[^\w\s']", " ", text.lower()).replace("'", "")
+    text = re.sub(r"\s+", " ", text).strip()
+    while True:
+        for filler in FILLER_PHRASES + tuple(FILLER_WORDS):
+            if text == filler or text.startswith(filler + " "):
+                text = text[len(filler):].lstrip()
+                break
+        else:
+            return text
+
+def content_words(text):
+    """The words of a normalized opener that carry its meaning."""
+    return frozenset(text.split()) - FUNCTION_WORDS
+
+def ngrams(text, n=NGRAM):
+    """Character n-grams of `text`, padded so short words still have some."""
+    padded = f"  {text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+def similarity(a, b):
+    """Dice coefficient of two n-gram sets."""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+class ResponseCache:
+    """
+    Near-duplicate lookup from normalized openers to a few stored replies.
+    An inverted index (n-gram -> keys) narrows each lookup to the openers
+    sharing at least one n-gram. Replies expire `ttl` seconds after they
+    were stored, and the least recently used openers go past `max_entries`.
+    """
+    def __init__(self, threshold=RESPONSE_CACHE_THRESHOLD, variants=RESPONSE_CACHE_VARIANTS,
+                 ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 max_words=RESPONSE_CACHE_MAX_WORDS, enabled=RESPONSE_CACHE, path=RESPONSE_CACHE_PATH):
+        self.threshold = threshold
+        self.variants = variants
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_words = max_words
+        self.enabled = enabled
+        self.path = path
+        self.entries = OrderedDict()  # key -> {'grams', 'words', 'replies': [(text, stored at)], 'last'}
+        self.index = {}               # n-gram -> set of keys
+        self.lock = threading.Lock()
+        # Totals for stats()
+        self.lookups = 0
+        self.hits = 0
+        self.skipped = 0
+        self.stored = 0
+        self.expired = 0
+        if enabled:
+            self._load()
+
+    def eligible(self, text):
+        """Whether `text` is a short opener worth caching."""
+        key = normalize(text)
+        return self.enabled and bool(key) and len(key.split()) <= self.max_words
+
+    def lookup(self, text):
+        """A stored reply for an opener like `text`, or None (then the caller asks the LLM and add()s)."""
+        if not self.eligible(text):
+            with self.lock:
+                self.skipped += 1
+            return None
+        key = normalize(text)
+        with self.lock:
+            self.lookups += 1
+            entry = self._match(key)
+            if entry is None:
+                return None
+            self._expire(entry)
+            if len(entry['replies']) < self.variants:
+                return None  # still collecting different replies
+            # Never the same reply twice in a row for one opener
+            choices = [reply for reply, _ in entry['replies'] if reply != entry['last']] or [entry['last']]
+            reply = random.choice(choices)
+            entry['last'] = reply
+            self.hits += 1
+            return reply
+
+    def add(self, text, reply):
+        """Store an LLM reply for the opener `text` (ignored if it is not one)."""
+        reply = reply.strip()
+        if not reply or not self.eligible(text):
+            return
+        key = normalize(text)
+        with self.lock:
+            entry = self._match(key) or self._insert(key, [])
+            self._expire(entry)
+            if reply in (r for r, _ in entry['replies']) or len(entry['replies']) >= self.variants:
+                return
+            entry['replies'].append((reply, time.time()))
+            self.stored += 1
+            self._save()
+
+    def _insert(self, key, replies):
+        entry = {'grams': ngrams(key), 'words': content_words(key), 'replies': replies, 'last': None}
+        self.entries[key] = entry
+        for gram in entry['grams']:
+            self.index.setdefault(gram, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+        return entry
+
+    def _match(self, key):
+        """Entry for the most similar opener with the same content words, at or above the threshold (lock held)."""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        grams = ngrams(key)
+        candidates = set()
+        for gram in grams:
+            candidates |= self.index.get(gram, set())
+        # Trigrams alone rate one-letter swaps ("lonely"/"lovely", "sad"/"mad") as near-duplicates
+        words = content_words(key)
+        best_key, best_score = None, self.threshold
+        for candidate in candidates:
+            if self.entries[candidate]['words'] != words:
+                continue
+            score = similarity(grams, self.entries[candidate]['grams'])
+            if score >= best_score:
+                best_key, best_score = candidate, score
+        if best_key is None:
+            return None
+        self.entries.move_to_end(best_key)
+        return self.entries[best_key]
+
+    def _expire(self, entry):
+        cutoff = time.time() - self.ttl
+        fresh = [(reply, stored_at) for reply, stored_at in entry['replies'] if stored_at >= cutoff]
+        self.expired += len(entry['replies']) - len(fresh)
+        entry['replies'] = fresh
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        for gram in entry['grams']:
+            keys = self.index.get(gram)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self.index[gram]
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, replies in stored.items():
+            entry = self._insert(key, [(reply, stored_at) for reply, stored_at in replies])
+            self._expire(entry)
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({key: entry['replies'] for key, entry in self.entries.items()}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"   -> ⚠️  Could not save response cache: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'openers': len(self.entries),
+                'replies': sum(len(entry['replies']) for entry in self.entries.values()),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                'not_eligible': self.skipped,
+                'stored': self.stored,
+                'expired': self.expired,
+            }
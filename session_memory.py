@@ -0,0 +1,128 @@
+# --- session_memory.py: per-conversation memory with a token-budgeted prompt ---
+
+import os
+import re
+import time
+import uuid
+import threading
+from collections import deque, OrderedDict
+
+# --- Configuration ---
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "600"))
+SESSION_RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", "6"))
+# Share of the budget the rolling summary may use
+SUMMARY_SHARE = 0.3
+
+USER_LABEL = "User"
+ASSISTANT_LABEL = "Therapist"
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per Llama 3 token); good enough for budgeting."""
+    return max(1, (len(text) + 3) // 4)
+
+def first_sentence(text, max_chars=160):
+    """Extractive one-line gist of a turn, used for the rolling summary."""
+    match = re.search(r"[.!?](\s|$)", text)
+    gist = text[:match.end()].strip() if match else text.strip()
+    return gist if len(gist) <= max_chars else gist[:max_chars].rstrip() + "…"
+
+class Session:
+    """
+    Keeps the latest turns verbatim and folds older ones into a rolling summary.
+
+    Token counts are computed once when a line enters the history and kept as
+    running totals, so building a prompt never re-tokenizes old turns and its
+    size stays under `token_budget` however long the conversation runs.
+    """
+    def __init__(self, session_id, token_budget=SESSION_TOKEN_BUDGET, recent_turns=SESSION_RECENT_TURNS):
+        self.id = session_id
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.summary_budget = int(token_budget * SUMMARY_SHARE)
+        self.recent = deque()   # (line, tokens) pairs, two per turn
+        self.recent_tokens = 0
+        self.summary = deque()  # (line, tokens) pairs
+        self.summary_tokens = 0
+        self.turn_count = 0
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+
+    def build_prompt(self, transcript):
+        """Prompt for the next turn: summary, recent turns, then the new message."""
+        with self.lock:
+            self.last_used = time.time()
+            if not self.recent and not self.summary:
+                return transcript
+            sections = []
+            if self.summary:
+                sections.append("Summary of earlier conversation:\n" + "\n".join(line for line, _ in self.summary))
+            if self.recent:
+                sections.append("Recent conversation:\n" + "\n".join(line for line, _ in self.recent))
+            sections.append(f"{USER_LABEL}: {transcript}")
+            return "\n\n".join(sections)
+
+    def prompt_tokens(self):
+        with self.lock:
+            return self.summary_tokens + self.recent_tokens
+
+    def add_turn(self, user_text, assistant_text):
+        """Record a finished exchange and fold old turns until back under budget."""
+        with self.lock:
+            for label, text in ((USER_LABEL, user_text), (ASSISTANT_LABEL, assistant_text)):
+                line = f"{label}: {text.strip()}"
+                tokens = estimate_tokens(line)
+                self.recent.append((line, tokens))
+                self.recent_tokens += tokens
+            self.turn_count += 1
+            self.last_used = time.time()
+
+            recent_budget = self.token_budget - self.summary_budget
+            while self.recent and (
+                len(self.recent) > self.recent_turns * 2 or self.recent_tokens > recent_budget
+            ):
+                self._fold_oldest()
+
+    def _fold_oldest(self):
+        line, tokens = self.recent.popleft()
+        self.recent_tokens -= tokens
+        label, _, text = line.partition(": ")
+        gist = f"- {label} said: {first_sentence(text)}"
+        gist_tokens = estimate_tokens(gist)
+        self.summary.append((gist, gist_tokens))
+        self.summary_tokens += gist_tokens
+        while self.summary and self.summary_tokens > self.summary_budget:
+            _, dropped = self.summary.popleft()
+            self.summary_tokens -= dropped
+
+class SessionStore:
+    """Thread-safe map of session id to Session, forgetting idle sessions."""
+    def __init__(self, max_sessions=1000, idle_seconds=3600):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id=None):
+        """Return the session for `session_id`, creating one (with a new id if needed)."""
+        with self.lock:
+            self._expire()
+            if session_id and session_id in self.sessions:
+                self.sessions.move_to_end(session_id)
+                return self.sessions[session_id]
+            session = Session(session_id or uuid.uuid4().hex)
+            self.sessions[session.id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+            return session
+
+    def stats(self):
+        with self.lock:
+            return {'active_sessions': len(self.sessions)}
+
+    def _expire(self):
+        cutoff = time.time() - self.idle_seconds
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if oldest.last_used >= cutoff:
+                break
+            self.sessions.popitem(last=False)
@@ -0,0 +1,325 @@
+# --- sim_providers.py: local stand-ins for Replicate, ElevenLabs, Deepgram and SadTalker ---
+#
+# install(profile) swaps the provider clients used by the pipeline for
+# simulated ones with configurable latency and throughput, so the whole
+# system can be exercised (and benchmarked) without API keys or network.
+
+import os
+import math
+import time
+import random
+import asyncio
+import threading
+
+# Speech is ~15 characters per second; replies are rendered as 128 kbps mp3
+CHARS_PER_SECOND = 15
+AUDIO_BYTES_PER_SECOND = 16000
+AUDIO_CHUNK_BYTES = 4096
+
+# Sentences the simulated LLM builds its replies from
+REPLY_SENTENCES = [
+    "That sounds incredibly difficult to carry.",
+    "It's alright to not have all the answers right now.",
+    "When did you first start feeling this way?",
+    "You have been holding a lot on your own.",
+    "Take a slow breath with me for a moment.",
+    "What would feel like a small kindness to yourself today?",
+    "It makes sense that you feel tired after all of that.",
+    "I'm here, and there is no rush.",
+]
+
+# Lines the simulated user says, one per turn
+USER_UTTERANCES = [
+    "I have been feeling really tired lately.",
+    "Work has been overwhelming this week.",
+    "I can't seem to sleep properly.",
+    "My family doesn't really understand me.",
+    "I think I just need someone to listen.",
+    "Some days are better than others, I guess.",
+]
+
+class Latency:
+    """Lognormal delay around a median, parsed from "median" or "median:sigma" (seconds)."""
+    def __init__(self, median, sigma=0.3):
+        self.median = median
+        self.sigma = sigma
+
+    @classmethod
+    def parse(cls, spec):
+        median, _, sigma = str(spec).partition(":")
+        return cls(float(median), float(sigma) if sigma else 0.3)
+
+    def sample(self, rng):
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(rng.gauss(0, self.sigma))
+
+    def __repr__(self):
+        return f"{self.median}:{self.sigma}"
+
+class SimProfile:
+    """Latency and throughput of every simulated provider."""
+    def __init__(self, llm_first_token="0.35", llm_tokens_per_sec=40.0,
+                 tts_first_byte="0.25", tts_bytes_per_sec=64000.0,
+                 stt_final="0.15", video_base="6", video_realtime_factor=1.5,
+                 playback_speed=1.0, user_pause="0.3", stall_rate=0.0, stall_seconds=5.0, seed=0):
+        self.llm_first_token = Latency.parse(llm_first_token)
+        self.llm_tokens_per_sec = llm_tokens_per_sec
+        self.tts_first_byte = Latency.parse(tts_first_byte)
+        self.tts_bytes_per_sec = tts_bytes_per_sec
+        self.stt_final = Latency.parse(stt_final)
+        self.video_base = Latency.parse(video_base)
+        self.video_realtime_factor = video_realtime_factor
+        self.playback_speed = playback_speed
+        self.user_pause = Latency.parse(user_pause)
+        # Share of provider calls that stall for stall_seconds before answering
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def delay(self, latency):
+        with self.lock:
+            return latency.sample(self.rng)
+
+    def stall(self):
+        """Extra seconds before this call answers: usually 0, stall_seconds for a stalled call."""
+        with self.lock:
+            return self.stall_seconds if self.rng.random() < self.stall_rate else 0.0
+
+    def choice(self, options, k=1):
+        with self.lock:
+            return self.rng.sample(options, k)
+
+    def describe(self):
+        return {
+            'llm_first_token': repr(self.llm_first_token),
+            'llm_tokens_per_sec': self.llm_tokens_per_sec,
+            'tts_first_byte': repr(self.tts_first_byte),
+            'tts_bytes_per_sec': self.tts_bytes_per_sec,
+            'stt_final': repr(self.stt_final),
+            'video_base': repr(self.video_base),
+            'video_realtime_factor': self.video_realtime_factor,
+            'playback_speed': self.playback_speed,
+            'stall_rate': self.stall_rate,
+            'stall_seconds': self.stall_seconds,
+        }
+
+def speech_bytes(text):
+    """Size of the mp3 a reply would render to."""
+    seconds = max(0.5, len(text) / CHARS_PER_SECOND)
+    return int(seconds * AUDIO_BYTES_PER_SECOND)
+
+# --- LLM (Replicate) ---
+
+class SimPrediction:
+    """Stands in for a streamed replicate Prediction; cancel() stops the token stream."""
+    def __init__(self, profile):
+        self.profile = profile
+        self.status = "starting"
+        self.cancelled = threading.Event()
+        self.reply = " ".join(profile.choice(REPLY_SENTENCES, 2))
+
+    def tokens(self):
+        words = self.reply.split(" ")
+        return [word if i == len(words) - 1 else word + " " for i, word in enumerate(words)]
+
+    def stream(self):
+        self.status = "processing"
+        if self.cancelled.wait(self.profile.delay(self.profile.llm_first_token) + self.profile.stall()):
+            return
+        for token in self.tokens():
+            yield token
+            if self.cancelled.wait(1 / self.profile.llm_tokens_per_sec):
+                return
+        self.status = "succeeded"
+
+    def cancel(self):
+        self.status = "canceled"
+        self.cancelled.set()
+
+class SimPredictions:
+    def __init__(self, profile):
+        self.profile = profile
+
+    def create(self, model=None, input=None, version=None, **kwargs):
+        if version:  # SadTalker is pinned to a version; Llama is created by model name
+            return SimVideoPrediction(self.profile, input or {})
+        return SimPrediction(self.profile)
+
+class SimVideoOutput:
+    """Stands in for the FileOutput SadTalker returns."""
+    def __init__(self, seconds):
+        self.data = b"\x00" * max(1024, int(seconds * 1024))
+
+    def read(self):
+        return self.data
+
+    def __str__(self):
+        return "sim://sadtalker/output.mp4"
+
+class SimVideoPrediction:
+    """Stands in for a SadTalker prediction; wait() takes the render time unless cancelled."""
+    def __init__(self, profile, input):
+        self.profile = profile
+        self.status = "starting"
+        self.error = None
+        self.output = None
+        self.cancelled = threading.Event()
+        audio = input.get("driven_audio")
+        self.audio_seconds = audio.seek(0, os.SEEK_END) / AUDIO_BYTES_PER_SECOND if audio else 1.0
+
+    def wait(self):
+        self.status = "processing"
+        render_seconds = (self.profile.delay(self.profile.video_base) + self.profile.stall()
+                          + self.audio_seconds * self.profile.video_realtime_factor)
+        if self.cancelled.wait(render_seconds):
+            return
+        self.output = SimVideoOutput(self.audio_seconds)
+        self.status = "succeeded"
+
+    def cancel(self):
+        self.status = "canceled"
+        self.cancelled.set()
+
+class SimFile:
+    def __init__(self, name):
+        self.name = name
+        self.expires_at = None
+        self.urls = {'get': f"sim://files/{name}"}
+
+class SimFiles:
+    """replicate.files: uploads are instant and never expire."""
+    def create(self, file, filename="upload", **kwargs):
+        return SimFile(filename)
+
+class SimReplicate:
+    """replicate.run / replicate.stream / replicate.predictions for the Llama and SadTalker models."""
+    def __init__(self, profile):
+        self.profile = profile
+        self.predictions = SimPredictions(profile)
+        self.files = SimFiles()
+
+    def stream(self, model, input=None, **kwargs):
+        return SimPrediction(self.profile).stream()
+
+    def run(self, model, input=None, **kwargs):
+        if "sadtalker" in model:
+            prediction = SimVideoPrediction(self.profile, input or {})
+            prediction.wait()
+            return prediction.output
+        return list(self.stream(model, input))
+
+# --- TTS (ElevenLabs) ---
+
+class SimTextToSpeech:
+    def __init__(self, profile):
+        self.profile = profile
+
+    def convert(self, text=None, output_format=None, **kwargs):
+        """
+        mp3 bytes for `text` (or silent PCM for output_format="pcm_<rate>"), after
+        a first-byte delay and as fast, relative to real time, as tts_bytes_per_sec allows.
+        """
+        total = speech_bytes(text or "")
+        bytes_per_sec = self.profile.tts_bytes_per_sec
+        pcm = bool(output_format and output_format.startswith("pcm_"))
+        if pcm:
+            scale = int(output_format.split("_")[1]) * 2 / AUDIO_BYTES_PER_SECOND
+            total = int(total * scale) // 2 * 2
+            bytes_per_sec *= scale
+        time.sleep(self.profile.delay(self.profile.tts_first_byte) + self.profile.stall())
+        sent = 0
+        while sent < total:
+            size = min(AUDIO_CHUNK_BYTES, total - sent)
+            yield (b"ID3" + b"\x00" * (size - 3)) if sent == 0 and not pcm else b"\x00" * size
+            sent += size
+            time.sleep(size / bytes_per_sec)
+
+    def stream(self, text=None, output_format=None, **kwargs):
+        if not isinstance(text, str):
+            text = "".join(text)
+        return self.convert(text=text, output_format=output_format)
+
+class SimElevenLabs:
+    def __init__(self, profile):
+        self.text_to_speech = SimTextToSpeech(profile)
+
+# --- Speaker ---
+
+def make_playback(profile):
+    """A play_audio_stream replacement that "plays" mp3 bytes in (scaled) real time (PLAYBACK_ENGINE=mpv)."""
+    def play_audio_stream(audio_chunks, cancel_event=None):
+        cancel_event = cancel_event or threading.Event()
+        for chunk in audio_chunks:
+            if cancel_event.wait(len(chunk) / AUDIO_BYTES_PER_SECOND / profile.playback_speed):
+                return False
+        return not cancel_event.is_set()
+    return play_audio_stream
+
+# --- STT (Deepgram) ---
+
+class SimListener:
+    """
+    Stands in for module1_ears.Listener: each next_utterance() waits for the
+    simulated user to finish a line, then for Deepgram's final result.
+    The interim transcript is published first, so speculation can run.
+    """
+    def __init__(self, profile, utterances=None):
+        self.profile = profile
+        self.utterances = utterances or USER_UTTERANCES
+        self.turn = 0
+        self.speech_ended_at = None
+        self.final_at = None
+        self.partial_text = ""
+        self.partial_changed_at = 0.0
+        self.speech_detected = asyncio.Event()
+
+    async def start(self):
+        pass
+
+    async def next_utterance(self):
+        await asyncio.sleep(self.profile.delay(self.profile.user_pause))
+        text = self.utterances[self.turn % len(self.utterances)]
+        self.turn += 1
+        self.speech_ended_at = time.time()
+        self.partial_text = text
+        self.partial_changed_at = self.speech_ended_at
+        await asyncio.sleep(self.profile.delay(self.profile.stt_final))
+        self.partial_text = ""
+        self.final_at = time.time()
+        return text
+
+    def pause(self):
+        pass
+
+    def resume(self):
+        pass
+
+    def stats(self):
+        return {'queue_depth': 0, 'max_queue_depth': 0, 'dropped_chunks': 0,
+                'avg_send_ms': 0.0, 'max_send_ms': 0.0}
+
+    async def close(self):
+        pass
+
+def install(profile):
+    """Point replicate, module3_voice and module4_face at the simulated providers."""
+    import replicate
+    import audio_playback
+    import module3_voice
+
+    sim = SimReplicate(profile)
+    replicate.run = sim.run
+    replicate.stream = sim.stream
+    replicate.predictions = sim.predictions
+    replicate.files = sim.files
+    module3_voice.ELEVENLABS_API_KEY = module3_voice.ELEVENLABS_API_KEY or "simulated"
+    module3_voice.client = SimElevenLabs(profile)
+    if module3_voice.PLAYBACK_ENGINE == "pcm":
+        # The real jitter buffer, feeding a sink that only takes up the time
+        sink = audio_playback.NullSink(speed=profile.playback_speed)
+        module3_voice.player = audio_playback.PcmPlayer(sink)
+    else:
+        module3_voice.play_audio_stream = make_playback(profile)
+    return sim
@@ -0,0 +1,127 @@
+# --- speculation.py: start the LLM early from a stable interim transcript ---
+
+import os
+import re
+import time
+import queue
+import asyncio
+import threading
+
+# --- Configuration ---
+# How long the interim transcript must stay unchanged before we speculate
+SPECULATION_STABLE_MS = int(os.getenv("SPECULATION_STABLE_MS", "300"))
+
+_END = object()
+
+def normalize(text):
+    """Comparison form of a transcript: lowercase, no punctuation, single spaces."""
+    return " ".join(re.sub(r"[^\w\s']", " ", text.lower()).split())
+
+class SpeculativeResponse:
+    """
+    Consumes an LLM token generator on a background thread, buffering tokens
+    until (and while) the reply is played. Cancelling sets `cancelled`, which
+    the generator should watch (see Speculator) so the provider request stops
+    even while it waits for a token; the generator is then closed as well.
+    """
+    def __init__(self, text, generator, cancelled=None):
+        self.text = text
+        self.generator = generator
+        self.parts = []
+        self.finished = False
+        self.error = None
+        self.cancelled = cancelled or threading.Event()
+        self.buffer = queue.Queue()
+        self.thread = threading.Thread(target=self._prefetch, daemon=True)
+        self.thread.start()
+
+    def _prefetch(self):
+        try:
+            for token in self.generator:
+                if self.cancelled.is_set():
+                    break
+                self.parts.append(token)
+                self.buffer.put(token)
+            else:
+                self.finished = not self.cancelled.is_set()
+        except Exception as e:
+            self.error = e
+            print(f"   -> Speculative generation error: {e}")
+        finally:
+            if not self.finished:
+                self.generator.close()
+            self.buffer.put(_END)
+
+    def tokens(self):
+        """Buffered and live tokens; closing this generator early cancels the request."""
+        try:
+            while True:
+                token = self.buffer.get()
+                if token is _END:
+                    return
+                yield token
+        finally:
+            if not self.finished:
+                self.cancel()
+
+    def reply(self):
+        return "".join(self.parts)
+
+    def cancel(self):
+        self.cancelled.set()
+
+class Speculator:
+    """
+    Watches a Listener's interim transcript and, once it has been stable for
+    `stable_ms`, starts `start_fn(text, cancel_event)` (an LLM token generator
+    that stops once `cancel_event` is set) early. take() keeps the speculation
+    if the final transcript matches it and it hasn't failed.
+    """
+    def __init__(self, start_fn, stable_ms=SPECULATION_STABLE_MS):
+        self.start_fn = start_fn
+        self.stable_seconds = stable_ms / 1000
+        self.current = None
+        self.started = 0
+        self.hits = 0
+        self.wasted = 0
+
+    async def watch(self, listener, poll_seconds=0.05):
+        while True:
+            await asyncio.sleep(poll_seconds)
+            text = listener.partial_text
+            if not text:
+                continue
+            if self.current and normalize(self.current.text) != normalize(text):
+                self._discard()  # the user kept talking
+            if self.current or time.time() - listener.partial_changed_at < self.stable_seconds:
+                continue
+            print(f"\n🔮 Speculating on: \"{text}\"")
+            cancelled = threading.Event()
+            self.current = SpeculativeResponse(text, self.start_fn(text, cancelled), cancelled)
+            self.started += 1
+
+    def take(self, final_transcript):
+        """The speculative response if it matches `final_transcript`, else None."""
+        speculation, self.current = self.current, None
+        if speculation is None:
+            return None
+        if normalize(speculation.text) == normalize(final_transcript) and speculation.error is None:
+            self.hits += 1
+            return speculation
+        speculation.cancel()
+        self.wasted += 1
+        return None
+
+    def _discard(self):
+        self.current.cancel()
+        self.current = None
+        self.wasted += 1
+
+    def stats(self):
+        return {
+            'started': self.started,
+            'hits': self.hits,
+            'wasted': self.wasted,
+            'hit_rate': round(self.hits / self.started, 2) if self.started else None,
+            'waste_rate': round(self.wasted / self.started, 2) if self.started else None,
+        }
@@ -0,0 +1,73 @@
+import pytest
+
+import admission
+from admission import AdmissionController
+
+def idle_queue():
+    return {'queued': 0, 'running': 0, 'workers': 2}
+
+@pytest.fixture
+def policy():
+    """4s request SLO, 60s video SLO, at most 10 requests in flight."""
+    return AdmissionController(idle_queue, max_new_tokens=100, enabled=True,
+                               slo_request_p95=4.0, slo_video_seconds=60, max_in_flight=10)
+
+def signals(in_flight=0, request_p95=None, expected_video_seconds=20.0):
+    return {'in_flight': in_flight, 'request_p95': request_p95,
+            'expected_video_seconds': expected_video_seconds}
+
+def test_normal_when_within_slo(policy):
+    decision = policy.decide(signals(request_p95=2.0))
+    assert (decision.level, decision.video, decision.max_new_tokens) == (admission.NORMAL, admission.VIDEO_NOW, 100)
+    assert decision.reasons == []
+
+def test_slow_requests_get_shorter_replies(policy):
+    decision = policy.decide(signals(request_p95=5.0))
+    assert decision.level == admission.DEGRADED
+    assert decision.max_new_tokens == admission.SHORT_MAX_NEW_TOKENS
+    assert decision.video == admission.VIDEO_NOW
+
+def test_video_is_deferred_then_skipped_as_the_queue_grows(policy):
+    assert policy.decide(signals(expected_video_seconds=90)).video == admission.VIDEO_DEFERRED
+    assert policy.decide(signals(expected_video_seconds=150)).video == admission.VIDEO_SKIPPED
+
+def test_shed_at_the_in_flight_cap(policy):
+    decision = policy.decide(signals(in_flight=10))
+    assert decision.shed and decision.video == admission.VIDEO_SKIPPED
+
+def test_shed_when_far_over_slo_and_busy(policy):
+    assert policy.decide(signals(in_flight=5, request_p95=9.0)).shed
+    # Just as slow but nearly idle: degrade rather than turn users away
+    assert not policy.decide(signals(in_flight=1, request_p95=9.0)).shed
+
+def test_expected_video_wait_counts_whole_rounds_of_workers():
+    queue = {'queued': 3, 'running': 2, 'workers': 2}
+    policy = AdmissionController(lambda: queue, max_new_tokens=100)
+    figures = policy.signals()
+    video_seconds = figures['video_p50']
+    assert figures['expected_video_seconds'] == round(2 * video_seconds + video_seconds, 1)
+
+def test_admit_tracks_in_flight_and_release(policy, monkeypatch):
+    policy.max_in_flight = 2
+    monkeypatch.setattr(policy, "signals", lambda: signals(in_flight=policy.in_flight))
+    first, second, third = policy.admit(), policy.admit(), policy.admit()
+    assert not first.shed and not second.shed and third.shed
+    assert policy.in_flight == 2
+    policy.release()
+    assert not policy.admit().shed
+    assert policy.stats()['decisions'][admission.SHED] == 1
+
+def test_admit_video_replaces_the_guess_from_admit(policy, monkeypatch):
+    load = {'expected_video_seconds': 20.0}
+    monkeypatch.setattr(policy, "signals", lambda: signals(in_flight=policy.in_flight, **load))
+    decision = policy.admit()
+    assert decision.level == admission.NORMAL
+    load['expected_video_seconds'] = 90.0  # a burst queued video meanwhile
+    assert policy.admit_video(decision) == admission.VIDEO_DEFERRED
+    assert decision.level == admission.DEGRADED
+    assert policy.stats()['decisions'] == {admission.NORMAL: 0, admission.DEGRADED: 1, admission.SHED: 0}
+
+def test_disabled_controller_admits_everything():
+    policy = AdmissionController(idle_queue, max_new_tokens=100, enabled=False, max_in_flight=0)
+    decision = policy.admit()
+    assert decision.level == admission.NORMAL and decision.max_new_tokens == 100
@@ -0,0 +1,149 @@
+import os
+import time
+import asyncio
+import threading
+
+import artifact_cache
+from artifact_cache import ArtifactCache
+
+def write(cache, key, size):
+    with open(cache.path_for(key), "wb") as f:
+        f.write(b"x" * size)
+    cache.store(key)
+
+def test_digest_is_stable_and_order_sensitive():
+    assert artifact_cache.digest("a", {"x": 1, "y": 2}) == artifact_cache.digest("a", {"y": 2, "x": 1})
+    assert artifact_cache.digest("a", "b") != artifact_cache.digest("b", "a")
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    cache = ArtifactCache(str(tmp_path), ".mp3", max_bytes=250)
+    write(cache, "a", 100)
+    write(cache, "b", 100)
+    assert cache.lookup("a")  # "b" is now the oldest
+    write(cache, "c", 100)
+
+    assert cache.lookup("b") is None
+    assert not os.path.exists(cache.path_for("b"))
+    assert cache.lookup("a") and cache.lookup("c")
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['total_bytes'] == 200
+
+def test_keeps_a_single_entry_larger_than_the_budget(tmp_path):
+    cache = ArtifactCache(str(tmp_path), ".mp3", max_bytes=10)
+    write(cache, "big", 100)
+    assert cache.lookup("big")
+
+def test_index_survives_a_restart(tmp_path):
+    cache = ArtifactCache(str(tmp_path), ".mp3", max_bytes=1000)
+    write(cache, "a", 10)
+    reloaded = ArtifactCache(str(tmp_path), ".mp3", max_bytes=1000)
+    assert reloaded.lookup("a") == cache.path_for("a")
+    assert reloaded.stats()['entries'] == 1
+
+def test_lookup_forgets_files_deleted_behind_its_back(tmp_path):
+    cache = ArtifactCache(str(tmp_path), ".mp3", max_bytes=1000)
+    write(cache, "a", 10)
+    os.remove(cache.path_for("a"))
+    assert cache.lookup("a") is None
+    assert cache.stats()['entries'] == 0
+
+def test_create_renders_once_for_concurrent_callers(tmp_path):
+    cache = ArtifactCache(str(tmp_path), ".mp3", max_bytes=1000)
+    renders = []
+    started = threading.Event()
+
+    def render(tmp):
+        renders.append(tmp)
+        started.set()
+        time.sleep(0.2)
+        with open(tmp, "wb") as f:
+            f.write(b"audio")
+        return True
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.create("k", render))) for _ in range(5)]
+    threads[0].start()
+    started.wait(1)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(renders) == 1
+    assert results == [cache.path_for("k")] * 5
+    assert cache.stats()['coalesced'] == 4
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+def test_create_failure_publishes_nothing(tmp_path):
+    cache = ArtifactCache(str(tmp_path), ".mp3", max_bytes=1000)
+    assert cache.create("k", lambda tmp: False) is None
+    assert cache.lookup("k") is None
+    assert os.listdir(tmp_path) == []
+
+def test_create_error_reaches_every_waiter(tmp_path):
+    flights = artifact_cache.SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("boom")
+
+    def call():
+        try:
+            flights.do("k", fail)
+        except RuntimeError as e:
+            errors.append(e)
+
+    first = threading.Thread(target=call)
+    first.start()
+    started.wait(1)
+    second = threading.Thread(target=call)
+    second.start()
+    first.join()
+    second.join()
+    assert len(errors) == 2 and flights.shared == 1
+
+def test_create_async_renders_once(tmp_path):
+    cache = ArtifactCache(str(tmp_path), ".mp4", max_bytes=1000)
+    renders = []
+
+    async def render(tmp):
+        renders.append(tmp)
+        await asyncio.sleep(0.05)
+        with open(tmp, "wb") as f:
+            f.write(b"video")
+        return True
+
+    async def main():
+        return await asyncio.gather(*(cache.create_async("k", render) for _ in range(3)))
+
+    assert asyncio.run(main()) == [cache.path_for("k")] * 3
+    assert len(renders) == 1
+
+def test_eviction_keeps_lock_files_other_processes_may_hold(tmp_path):
+    cache = ArtifactCache(str(tmp_path), ".mp3", max_bytes=150, lock_files=True)
+
+    def render(size):
+        def write_tmp(tmp):
+            with open(tmp, "wb") as f:
+                f.write(b"x" * size)
+            return True
+        return write_tmp
+
+    cache.create("a", render(100))
+    lock_path = os.path.join(str(tmp_path), artifact_cache.LOCK_DIRNAME, "a.lock")
+    other_process = artifact_cache.FileLock(lock_path)
+    other_process.acquire()  # e.g. another worker about to re-render "a"
+    cache.create("b", render(100))  # evicts "a"
+    assert cache.lookup("a") is None and os.path.exists(lock_path)
+
+    renders = []
+    thread = threading.Thread(target=cache.create, args=("a", lambda tmp: renders.append(tmp) or render(100)(tmp)))
+    thread.start()
+    time.sleep(0.1)
+    assert renders == []  # still waiting on the lock the other process holds
+    other_process.release()
+    thread.join(1)
+    assert len(renders) == 1
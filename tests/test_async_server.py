@@ -0,0 +1,78 @@
+import os
+import asyncio
+import importlib
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    """async_server run from a scratch directory, so its caches don't touch the real static/."""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(tmp_path_factory.mktemp("async_server"))
+        patch.setenv("REPLICATE_API_TOKEN", os.getenv("REPLICATE_API_TOKEN", "test"))
+        yield importlib.import_module("async_server")
+
+def client(server):
+    """Test client for a fresh app, without the provider warm-up."""
+    app = server.create_app()
+    app.on_startup.remove(server.warm_up)
+    return TestClient(TestServer(app))
+
+def request(server, method, path, **kwargs):
+    async def run():
+        async with client(server) as http:
+            response = await http.request(method, path, **kwargs)
+            return response.status, response.headers, await response.json()
+    return asyncio.run(run())
+
+def test_missing_transcript_is_a_bad_request(server):
+    status, _, body = request(server, "POST", "/generate", json={})
+    assert status == 400 and "transcript" in body['error']
+
+def test_missing_replicate_token_fails_the_request(server, monkeypatch):
+    monkeypatch.delenv("REPLICATE_API_TOKEN")
+    status, _, body = request(server, "POST", "/generate", json={'transcript': "A question nobody asked before"})
+    assert status == 500 and "REPLICATE_API_TOKEN" in body['error']
+
+def test_overloaded_server_sheds_with_retry_after(server, monkeypatch):
+    monkeypatch.setattr(server.admission_control, "max_in_flight", 0)
+    status, headers, body = request(server, "POST", "/generate", json={'transcript': "hello"})
+    assert status == 503
+    assert headers['Retry-After'] == str(server.admission.SHED_RETRY_AFTER)
+    assert body['admission']['level'] == server.admission.SHED
+    assert server.admission_control.in_flight == 0
+
+def test_llm_calls_stay_within_their_concurrency_limit(server, monkeypatch):
+    monkeypatch.setattr(server, "LLM_CONCURRENCY", 2)
+    running, peak = 0, 0
+
+    async def stream_llm(prompt, decision):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        yield "A calm reply."
+
+    async def synthesize_audio(text):
+        return None, None  # text-only reply
+
+    monkeypatch.setattr(server, "stream_llm", stream_llm)
+    monkeypatch.setattr(server, "synthesize_audio", synthesize_audio)
+
+    async def run():
+        async with client(server) as http:
+            responses = await asyncio.gather(*(
+                http.post("/generate", json={'transcript': f"Concurrent message number {i} with detail"})
+                for i in range(6)
+            ))
+            return [response.status for response in responses]
+
+    assert asyncio.run(run()) == [200] * 6
+    assert peak == 2
+
+def test_status_reports_the_provider_limits(server):
+    status, _, body = request(server, "GET", "/status")
+    assert status == 200 and body['server'] == "asyncio"
+    assert set(body['limits']) == {'llm', 'tts', 'video'}
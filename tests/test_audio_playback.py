@@ -0,0 +1,70 @@
+import time
+import threading
+
+from audio_playback import NullSink, PcmPlayer
+
+RATE = 16000
+PERIOD = RATE * 20 // 1000 * 2  # bytes in one 20 ms period
+
+class RecordingSink(NullSink):
+    """Keeps what was played and when, without waiting in real time."""
+    def __init__(self):
+        super().__init__(RATE, realtime=False)
+        self.writes = []
+
+    def write(self, pcm):
+        super().write(pcm)
+        self.writes.append((time.time(), pcm))
+
+def paced(chunks, delay):
+    for chunk in chunks:
+        time.sleep(delay)
+        yield chunk
+
+def test_plays_every_byte_in_whole_periods():
+    sink = RecordingSink()
+    player = PcmPlayer(sink, sample_rate=RATE, jitter_ms=60)
+    audio = bytes(range(256)) * 40 + b"\x01"  # ends on half a sample
+    assert player.play([audio[:1001], audio[1001:]])
+    played = b"".join(pcm for _, pcm in sink.writes)
+    assert played[:len(audio)] == audio and len(played) == len(audio) + 1  # padded to a whole sample
+    assert all(len(pcm) == PERIOD for _, pcm in sink.writes[:-1])
+
+def test_playback_waits_for_the_jitter_buffer():
+    sink = RecordingSink()
+    player = PcmPlayer(sink, sample_rate=RATE, jitter_ms=100)
+    started = time.time()
+    # One period every 10 ms: five periods (100 ms of audio) take ~50 ms to arrive
+    assert player.play(paced([b"\x00" * PERIOD] * 10, 0.01))
+    assert sink.writes[0][0] - started >= 0.04
+
+def test_stall_mid_reply_counts_as_an_underrun():
+    def stalling():
+        yield b"\x00" * PERIOD * 3
+        time.sleep(0.2)
+        yield b"\x00" * PERIOD * 3
+
+    player = PcmPlayer(RecordingSink(), sample_rate=RATE, jitter_ms=40)
+    assert player.play(stalling())
+    stats = player.stats()
+    assert stats['underruns'] == 1 and stats['underrun_seconds'] > 0.1
+
+def test_cancel_stops_within_a_period_and_closes_the_source():
+    closed = threading.Event()
+
+    def endless():
+        try:
+            while True:
+                time.sleep(0.005)
+                yield b"\x00" * PERIOD
+        finally:
+            closed.set()
+
+    cancel = threading.Event()
+    player = PcmPlayer(NullSink(RATE), sample_rate=RATE, jitter_ms=40)
+    threading.Timer(0.2, cancel.set).start()
+    started = time.time()
+    assert player.play(endless(), cancel_event=cancel) is False
+    assert time.time() - started < 0.4
+    assert closed.wait(1)
+    assert player.stats()['cancelled'] == 1
@@ -0,0 +1,71 @@
+import os
+import time
+import asyncio
+import threading
+
+from growing_files import GrowingFile, GrowingFiles
+
+def write_slowly(growing, tmp_path, final_path, chunks, delay=0.02):
+    """The writer side: append chunks, then publish with a rename."""
+    growing.start(tmp_path)
+    with open(tmp_path, "wb") as f:
+        for chunk in chunks:
+            time.sleep(delay)
+            f.write(chunk)
+            f.flush()
+            growing.append(len(chunk))
+    os.replace(tmp_path, final_path)
+    growing.finish(True)
+
+def test_reader_follows_the_writer_across_the_rename(tmp_path):
+    final_path = str(tmp_path / "reply.mp3")
+    growing = GrowingFile(final_path)
+    chunks = [b"a" * 100, b"b" * 100, b"c" * 100]
+    writer = threading.Thread(target=write_slowly, args=(growing, final_path + ".tmp", final_path, chunks))
+    writer.start()
+    assert b"".join(growing.iter_bytes(idle_timeout=2)) == b"".join(chunks)
+    writer.join()
+
+def test_async_reader_follows_the_writer(tmp_path):
+    final_path = str(tmp_path / "reply.mp3")
+    growing = GrowingFile(final_path)
+    chunks = [b"x" * 50] * 4
+    writer = threading.Thread(target=write_slowly, args=(growing, final_path + ".tmp", final_path, chunks))
+    writer.start()
+
+    async def read():
+        return b"".join([data async for data in growing.aiter_bytes(poll_seconds=0.005, idle_timeout=2)])
+
+    assert asyncio.run(read()) == b"".join(chunks)
+    writer.join()
+
+def test_failed_write_without_bytes_yields_nothing(tmp_path):
+    growing = GrowingFile(str(tmp_path / "reply.mp3"))
+    growing.finish(False)
+    assert not growing.wait_started(0.1)
+    assert list(growing.iter_bytes(idle_timeout=0.1)) == []
+
+def test_stalled_writer_ends_the_stream(tmp_path):
+    tmp = str(tmp_path / "reply.mp3.tmp")
+    growing = GrowingFile(str(tmp_path / "reply.mp3"))
+    growing.start(tmp)
+    with open(tmp, "wb") as f:
+        f.write(b"partial")
+    growing.append(7)
+    started = time.time()
+    assert b"".join(growing.iter_bytes(idle_timeout=0.1)) == b"partial"
+    assert time.time() - started < 1
+
+def test_registry_shares_one_writer_per_name():
+    files = GrowingFiles()
+    first, is_new = files.add("a.mp3", GrowingFile("a.mp3"))
+    again, is_new_again = files.add("a.mp3", GrowingFile("a.mp3"))
+    assert is_new and not is_new_again and again is first
+    assert len(files) == 1
+
+    waiter = threading.Thread(target=files.wait_published, args=("a.mp3", 2))
+    waiter.start()
+    files.remove("a.mp3")
+    waiter.join(1)
+    assert not waiter.is_alive() and first.published.is_set()
+    assert files.get("a.mp3") is None
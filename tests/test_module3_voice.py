@@ -0,0 +1,49 @@
+import time
+import threading
+
+import module3_voice
+
+def fake_playback(monkeypatch, tts_seconds=0.0):
+    """No API key check, no speaker: synthesis takes `tts_seconds` and playback records the chunks."""
+    played = []
+
+    def synthesize(text, output_format=None):
+        time.sleep(tts_seconds)
+        return text.encode()
+
+    def play(audio_chunks, cancel_event=None):
+        for chunk in audio_chunks:
+            played.append(chunk)
+        return not (cancel_event and cancel_event.is_set())
+
+    monkeypatch.setattr(module3_voice, "ELEVENLABS_API_KEY", "test")
+    monkeypatch.setattr(module3_voice, "synthesize_sentence", synthesize)
+    monkeypatch.setattr(module3_voice, "play_audio_stream", play)
+    return played
+
+def test_sentences_are_played_in_order(monkeypatch):
+    played = fake_playback(monkeypatch)
+    tokens = ["Hello", " there.", " How are", " you today?"]
+    assert module3_voice.speak_text_stream_chunked(iter(tokens))
+    assert played == [b"Hello there.", b"How are you today?"]
+
+def test_cancel_returns_without_waiting_for_the_llm_or_tts(monkeypatch):
+    fake_playback(monkeypatch, tts_seconds=3.0)
+    resume = threading.Event()
+    closed = threading.Event()
+
+    def llm():
+        try:
+            yield "First sentence."
+            resume.wait(3.0)  # the model stalls mid-reply
+            yield " Second sentence."
+        finally:
+            closed.set()
+
+    cancel_event = threading.Event()
+    threading.Timer(0.3, cancel_event.set).start()
+    started = time.time()
+    assert not module3_voice.speak_text_stream_chunked(llm(), cancel_event=cancel_event)
+    assert time.time() - started < 1.0
+    resume.set()
+    assert closed.wait(1.0)  # the reader closes the stream once it gets it back
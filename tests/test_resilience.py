@@ -0,0 +1,258 @@
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+import replicate
+
+import resilience
+from resilience import CircuitBreaker
+
+def fail(breaker):
+    with pytest.raises(ValueError):
+        with breaker.guard():
+            raise ValueError("provider down")
+
+# --- Circuit breaker ---
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=60)
+    fail(breaker)
+    assert breaker.state == resilience.CLOSED
+    fail(breaker)
+    assert breaker.state == resilience.OPEN
+    with pytest.raises(resilience.CircuitOpen):
+        breaker.before_call()
+    assert breaker.stats()['rejected'] == 1
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=60)
+    fail(breaker)
+    with breaker.guard():
+        pass
+    fail(breaker)
+    assert breaker.state == resilience.CLOSED
+
+def test_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=0.05)
+    fail(breaker)
+    time.sleep(0.06)
+    breaker.before_call()  # the trial call
+    assert breaker.state == resilience.HALF_OPEN
+    with pytest.raises(resilience.CircuitOpen):
+        breaker.before_call()  # only one trial at a time
+    breaker.record_failure(ValueError("still down"))
+    assert breaker.state == resilience.OPEN
+
+    time.sleep(0.06)
+    with breaker.guard():
+        pass
+    assert breaker.state == resilience.CLOSED
+    assert breaker.stats()['opened'] == 2
+
+def test_abandoned_trial_is_replaced():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=0.05)
+    fail(breaker)
+    time.sleep(0.06)
+    breaker.before_call()  # never reports back
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == resilience.HALF_OPEN
+
+# --- Deadlines ---
+
+def test_call_within_returns_or_raises_at_the_deadline():
+    assert resilience.call_within(lambda x: x * 2, 1.0, "test", 21) == 42
+    with pytest.raises(resilience.DeadlineExceeded):
+        resilience.call_within(time.sleep, 0.05, "test", 1)
+    with pytest.raises(KeyError):
+        resilience.call_within({}.__getitem__, 1.0, "test", "missing")
+
+def test_iterate_within_stops_at_the_deadline():
+    def slow():
+        yield 1
+        time.sleep(1)
+        yield 2
+
+    items = []
+    with pytest.raises(resilience.DeadlineExceeded):
+        for item in resilience.iterate_within(slow(), 0.1, "test"):
+            items.append(item)
+    assert items == [1]
+
+# --- Hedging ---
+
+class Attempts:
+    """start() for hedged_stream: each attempt waits its delay, then yields its tokens."""
+    def __init__(self, *plans, gap=0.0):
+        self.plans = list(plans)  # (first token delay, tokens) per attempt
+        self.gap = gap
+        self.cancelled = []
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            index = len(self.cancelled)
+            self.cancelled.append(threading.Event())
+        delay, tokens = self.plans[index]
+        cancelled = self.cancelled[index]
+
+        def stream():
+            if cancelled.wait(delay):
+                return
+            for token in tokens:
+                if isinstance(token, Exception):
+                    raise token
+                yield token
+                if cancelled.wait(self.gap):
+                    return
+        return stream(), cancelled.set
+
+def hedged(start, **kwargs):
+    options = dict(hedge_after=0.05, first_deadline=1.0, deadline=2.0,
+                   breaker=CircuitBreaker("test", failure_threshold=1))
+    options.update(kwargs)
+    return list(resilience.hedged_stream(start, **options)), options['breaker']
+
+def test_fast_first_attempt_is_not_hedged():
+    start = Attempts((0.0, ["a", "b"]))
+    tokens, breaker = hedged(start)
+    assert tokens == ["a", "b"]
+    assert len(start.cancelled) == 1
+    assert breaker.state == resilience.CLOSED
+
+def test_slow_first_attempt_is_hedged_and_cancelled():
+    start = Attempts((0.5, ["slow"]), (0.0, ["fast", "!"]))
+    tokens, _ = hedged(start)
+    assert tokens == ["fast", "!"]
+    assert start.cancelled[0].is_set()
+
+def test_failed_attempt_falls_back_to_the_hedge():
+    start = Attempts((0.1, [RuntimeError("429")]), (0.15, ["ok"]))
+    tokens, _ = hedged(start)
+    assert tokens == ["ok"]
+
+def test_no_first_token_trips_the_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    with pytest.raises(resilience.DeadlineExceeded):
+        list(resilience.hedged_stream(Attempts((1.0, []), (1.0, [])), hedge_after=0.05,
+                                      first_deadline=0.2, breaker=breaker))
+    assert breaker.state == resilience.OPEN
+
+def test_closing_early_cancels_every_attempt():
+    start = Attempts((0.0, ["a", "b", "c"]), gap=0.5)
+    stream = resilience.hedged_stream(start, hedge_after=0, breaker=CircuitBreaker("test"))
+    assert next(stream) == "a"
+    stream.close()
+    assert start.cancelled[0].is_set()
+
+def test_cancel_event_cancels_attempts_still_waiting_for_a_token():
+    start = Attempts((5.0, ["late"]))
+    breaker = CircuitBreaker("test")
+    cancel_event = threading.Event()
+    threading.Timer(0.1, cancel_event.set).start()
+    started = time.time()
+    tokens = list(resilience.hedged_stream(start, hedge_after=0, breaker=breaker, cancel_event=cancel_event))
+    assert tokens == [] and time.time() - started < 1.0
+    assert start.cancelled[0].is_set()
+    assert breaker.state == resilience.CLOSED
+
+def test_async_slow_first_attempt_is_hedged_and_cancelled():
+    cancelled = []
+
+    def start_with(delay, tokens):
+        async def start():
+            async def stream():
+                await asyncio.sleep(delay)
+                for token in tokens:
+                    yield token
+
+            async def cancel():
+                cancelled.append(tokens)
+            return stream(), cancel
+        return start
+
+    plans = iter([(0.5, ["slow"]), (0.0, ["fast"])])
+
+    async def start():
+        return await start_with(*next(plans))()
+
+    async def main():
+        return [token async for token in resilience.hedged_stream_async(
+            start, hedge_after=0.05, breaker=CircuitBreaker("test"))]
+
+    assert asyncio.run(main()) == ["fast"]
+    assert cancelled == [["slow"]]
+
+def test_async_hedge_takes_a_slot_of_its_own_or_is_not_sent():
+    def run(slots):
+        limit = asyncio.Semaphore(slots)
+        started, free_during_hedge = [], []
+
+        async def start():
+            started.append(len(started))
+            if len(started) > 1:
+                free_during_hedge.append(limit._value)
+
+            async def stream():
+                await asyncio.sleep(0.2 if len(started) == 1 else 0.0)
+                yield f"attempt {len(started)}"
+            return stream(), None
+
+        async def main():
+            async with limit:  # the caller's slot for the first attempt
+                tokens = [token async for token in resilience.hedged_stream_async(
+                    start, hedge_after=0.05, breaker=CircuitBreaker("test"), slots=limit)]
+            return tokens, limit._value
+
+        tokens, free_after = asyncio.run(main())
+        return tokens, len(started), free_during_hedge, free_after
+
+    assert run(1) == (["attempt 1"], 1, [], 1)  # no free slot: no hedge
+    assert run(2) == (["attempt 2"], 2, [0], 2)  # the hedge holds the second slot while it runs
+
+# --- Replicate adapters ---
+
+def test_replicate_stream_yields_only_output_events(monkeypatch):
+    from replicate.stream import ServerSentEvent
+    kinds = ServerSentEvent.EventType
+
+    def event(kind, data):
+        return ServerSentEvent(event=kind, data=data, id="1", retry=None)
+
+    created = []
+
+    def create(**kwargs):
+        created.append(kwargs)
+        events = [event(kinds.LOGS, "loading"), event(kinds.OUTPUT, "Hi"), event(kinds.DONE, "{}")]
+        return SimpleNamespace(stream=lambda: iter(events), cancel=lambda: None)
+
+    monkeypatch.setattr(replicate, "predictions", SimpleNamespace(create=create), raising=False)
+    tokens, cancel = resilience.replicate_stream("model", {"prompt": "hi"})()
+    assert list(tokens) == ["Hi"]
+    assert created[0]['stream'] is True
+
+def test_replicate_prediction_is_cancelled_at_the_deadline(monkeypatch):
+    predictions = []
+
+    class Prediction:
+        def __init__(self):
+            self.status = "starting"
+            self.cancelled = threading.Event()
+
+        def wait(self):
+            self.cancelled.wait(1)
+
+        def cancel(self):
+            self.status = "canceled"
+            self.cancelled.set()
+
+    def create(**kwargs):
+        predictions.append(Prediction())
+        return predictions[-1]
+
+    monkeypatch.setattr(replicate, "predictions", SimpleNamespace(create=create), raising=False)
+    with pytest.raises(resilience.DeadlineExceeded):
+        resilience.replicate_prediction("version", {}, 0.05, "test")
+    assert predictions[0].status == "canceled"
@@ -0,0 +1,92 @@
+import time
+
+import response_cache
+from response_cache import ResponseCache
+
+def memory_cache(variants=2, threshold=0.85, path="", **limits):
+    """An enabled cache that only touches disk when given a path."""
+    return ResponseCache(threshold=threshold, variants=variants, enabled=True, path=path, **limits)
+
+def similar(a, b):
+    a, b = response_cache.normalize(a), response_cache.normalize(b)
+    return response_cache.similarity(response_cache.ngrams(a), response_cache.ngrams(b))
+
+def test_normalize_drops_case_punctuation_and_leading_fillers():
+    assert response_cache.normalize("Um, hi there!") == "hi there"
+    assert response_cache.normalize("I mean... I DON'T feel great") == "i dont feel great"
+    assert response_cache.normalize("So, well, I'm not feeling so well") == "im not feeling so well"
+
+def test_similarity_of_near_duplicates():
+    assert similar("Hi there", "hi there!") == 1.0
+    assert similar("I feel sad today", "I feel so sad today") >= 0.85
+    assert similar("I feel sad today", "I had a great day") < 0.5
+
+def test_served_only_once_enough_variants_are_collected():
+    replies = memory_cache(variants=2)
+    replies.add("Hello there", "Hi, I'm glad you're here.")
+    assert replies.lookup("hello there") is None  # one variant so far
+    replies.add("Hello there!", "Hello. How are you feeling?")
+    assert replies.lookup("Um, hello there") in {"Hi, I'm glad you're here.", "Hello. How are you feeling?"}
+
+def test_never_the_same_reply_twice_in_a_row():
+    replies = memory_cache(variants=2)
+    replies.add("hi", "First.")
+    replies.add("hi", "Second.")
+    served = [replies.lookup("hi") for _ in range(6)]
+    assert all(a != b for a, b in zip(served, served[1:]))
+
+def test_stops_collecting_at_the_variant_count():
+    replies = memory_cache(variants=2)
+    for reply in ("One.", "Two.", "Three.", "One."):
+        replies.add("hi", reply)
+    assert replies.stats()['replies'] == 2
+
+def test_below_threshold_is_a_different_opener():
+    replies = memory_cache(variants=1)
+    replies.add("I feel sad today", "I'm sorry it's a heavy day.")
+    assert replies.lookup("I feel sad today") is not None
+    assert replies.lookup("I feel great today") is None
+
+def test_one_word_apart_is_a_different_opener():
+    replies = memory_cache(variants=1)
+    replies.add("I feel lonely today", "I'm here with you.")
+    replies.add("I feel sad", "I'm sorry you feel down.")
+    assert similar("I feel lonely today", "I feel lovely today") >= 0.85  # trigrams alone would match
+    assert replies.lookup("I feel lovely today") is None
+    assert replies.lookup("I feel mad") is None
+    assert replies.lookup("I feel bad") is None
+    assert replies.lookup("I feel so sad") == "I'm sorry you feel down."
+
+def test_negation_never_matches():
+    replies = memory_cache(variants=1, threshold=0.5)
+    replies.add("I feel okay", "I'm glad to hear that.")
+    assert replies.lookup("I don't feel okay") is None
+
+def test_long_messages_are_not_cached():
+    replies = memory_cache(variants=1, max_words=4)
+    text = "I had an argument with my sister about the holidays"
+    replies.add(text, "That sounds hard.")
+    assert replies.lookup(text) is None
+    assert replies.stats()['not_eligible'] == 1 and replies.stats()['openers'] == 0
+
+def test_replies_expire():
+    replies = memory_cache(variants=1, ttl=60)
+    replies.add("hi", "Hello.")
+    entry = replies.entries["hi"]
+    entry['replies'] = [(reply, time.time() - 120) for reply, _ in entry['replies']]
+    assert replies.lookup("hi") is None
+    assert replies.stats()['expired'] == 1
+
+def test_least_recently_used_openers_are_dropped():
+    replies = memory_cache(variants=1, max_entries=2)
+    replies.add("hello", "A.")
+    replies.add("good morning", "B.")
+    replies.lookup("hello")
+    replies.add("i feel sad", "C.")
+    assert set(replies.entries) == {"hello", "i feel sad"}
+    assert all("good morning" not in keys for keys in replies.index.values())
+
+def test_persists_across_restarts(tmp_path):
+    path = str(tmp_path / "replies.json")
+    memory_cache(variants=1, path=path).add("hi", "Hello.")
+    assert memory_cache(variants=1, path=path).lookup("hi") == "Hello."
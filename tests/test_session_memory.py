@@ -0,0 +1,54 @@
+import time
+
+import session_memory
+from session_memory import Session, SessionStore
+
+def test_first_message_is_sent_as_is():
+    assert Session("s").build_prompt("Hello") == "Hello"
+
+def test_prompt_includes_recent_turns_and_new_message():
+    session = Session("s")
+    session.add_turn("I can't sleep.", "That sounds exhausting.")
+    prompt = session.build_prompt("It's been weeks.")
+    assert "User: I can't sleep." in prompt
+    assert "Therapist: That sounds exhausting." in prompt
+    assert prompt.endswith("User: It's been weeks.")
+
+def test_old_turns_fold_into_summary_past_recent_turns():
+    session = Session("s", token_budget=10_000, recent_turns=2)
+    for i in range(5):
+        session.add_turn(f"Message {i}. More detail.", f"Reply {i}.")
+    assert len(session.recent) == 4
+    assert session.recent[0][0] == "User: Message 3. More detail."
+    assert "- User said: Message 0." in session.build_prompt("next")
+    assert session.turn_count == 5
+
+def test_prompt_stays_under_token_budget():
+    session = Session("s", token_budget=120, recent_turns=50)
+    for i in range(200):
+        session.add_turn(f"This is a fairly long user message number {i}, with detail.",
+                         f"And this is the therapist's considered reply number {i}.")
+        assert session.prompt_tokens() <= session.token_budget
+    assert session.summary_tokens <= session.summary_budget
+    # Running totals match what the lines actually cost
+    assert session.recent_tokens == sum(tokens for _, tokens in session.recent)
+    assert session.summary_tokens == sum(tokens for _, tokens in session.summary)
+
+def test_first_sentence_gist():
+    assert session_memory.first_sentence("I'm tired. Work is hard.") == "I'm tired."
+    assert session_memory.first_sentence("x" * 200, max_chars=10) == "x" * 10 + "…"
+
+def test_store_reuses_and_expires_sessions():
+    store = SessionStore(max_sessions=2, idle_seconds=60)
+    first = store.get("a")
+    assert store.get("a") is first
+    store.get("b")
+    store.get("c")
+    assert store.stats()['active_sessions'] == 2
+    assert store.get("a") is not first  # evicted as the oldest
+
+def test_store_forgets_idle_sessions():
+    store = SessionStore(idle_seconds=60)
+    store.get("idle").last_used = time.time() - 120
+    store.get("fresh")
+    assert list(store.sessions) == ["fresh"]
@@ -0,0 +1,91 @@
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import speculation
+from speculation import Speculator, SpeculativeResponse
+
+def tokens(*parts):
+    for part in parts:
+        yield part
+
+def test_normalize_ignores_case_and_punctuation():
+    assert speculation.normalize("I can't sleep.") == speculation.normalize("i can't   SLEEP")
+
+def test_response_buffers_the_whole_reply():
+    response = SpeculativeResponse("hi", tokens("Hello", " there."))
+    assert list(response.tokens()) == ["Hello", " there."]
+    assert response.finished and response.reply() == "Hello there."
+
+def test_cancel_closes_the_generator():
+    closed = []
+
+    def endless():
+        try:
+            while True:
+                time.sleep(0.01)
+                yield "x"
+        finally:
+            closed.append(True)
+
+    response = SpeculativeResponse("hi", endless())
+    time.sleep(0.05)
+    response.cancel()
+    response.thread.join(1)
+    assert closed and not response.finished
+
+def test_cancel_stops_a_generator_still_waiting_for_its_first_token():
+    cancelled = threading.Event()
+
+    def stalled():
+        cancelled.wait(5)  # a provider stream that watches the cancel event
+        return
+        yield
+
+    response = SpeculativeResponse("hi", stalled(), cancelled)
+    started = time.time()
+    response.cancel()
+    response.thread.join(1)
+    assert not response.thread.is_alive() and time.time() - started < 0.5
+    assert not response.finished and list(response.tokens()) == []
+
+def test_failed_speculation_is_never_taken():
+    def failing():
+        yield "Hel"
+        raise RuntimeError("LLM down")
+
+    speculator = Speculator(lambda text, cancel_event: tokens("reply"))
+    speculator.current = SpeculativeResponse("hi", failing())
+    speculator.current.thread.join(1)
+    assert not speculator.current.finished and speculator.current.error
+    assert speculator.take("hi") is None
+    assert speculator.stats()['wasted'] == 1
+
+def test_take_keeps_only_a_matching_speculation():
+    speculator = Speculator(lambda text, cancel_event: tokens("reply"))
+    speculator.current = SpeculativeResponse("I feel tired", tokens("reply"))
+    assert speculator.take("I feel tired.") is not None
+    speculator.current = SpeculativeResponse("I feel", tokens("reply"))
+    assert speculator.take("I feel tired") is None
+    assert (speculator.hits, speculator.wasted) == (1, 1)
+
+def test_watch_starts_once_the_interim_is_stable_and_discards_on_change():
+    started = []
+    speculator = Speculator(lambda text, cancel_event: started.append(text) or tokens("ok"), stable_ms=50)
+    listener = SimpleNamespace(partial_text="", partial_changed_at=time.time())
+
+    async def speak():
+        watcher = asyncio.create_task(speculator.watch(listener, poll_seconds=0.01))
+        listener.partial_text, listener.partial_changed_at = "I had", time.time()
+        await asyncio.sleep(0.02)
+        assert started == []  # not stable yet
+        await asyncio.sleep(0.1)
+        listener.partial_text, listener.partial_changed_at = "I had a long day", time.time()
+        await asyncio.sleep(0.15)
+        watcher.cancel()
+
+    asyncio.run(speak())
+    assert started == ["I had", "I had a long day"]
+    assert speculator.stats()['wasted'] == 1
+    assert speculator.take("I had a long day") is not None
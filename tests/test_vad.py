@@ -0,0 +1,81 @@
+import numpy as np
+
+import vad
+from vad import VoiceActivityDetector
+
+RATE = 16000
+
+def pcm(seconds, amplitude, freq=220.0, seed=0):
+    """A tone (or, at freq=None, background noise) as 16-bit PCM bytes."""
+    n = int(RATE * seconds)
+    if freq is None:
+        samples = np.random.default_rng(seed).normal(0, amplitude, n)
+    else:
+        samples = amplitude * np.sin(2 * np.pi * freq * np.arange(n) / RATE)
+    return samples.astype(np.int16).tobytes()
+
+def quiet(seconds):
+    return pcm(seconds, 30, freq=None)
+
+def speech(seconds):
+    return pcm(seconds, 8000)
+
+def frames(detector, data):
+    return len(data) // detector.frame_bytes
+
+def test_silence_is_gated_out():
+    detector = VoiceActivityDetector(RATE)
+    sent, ended = detector.process(quiet(1.0))
+    assert sent == b"" and not ended
+    assert detector.stats()['vad_bandwidth_saved'] == 1.0
+
+def test_utterance_is_sent_with_preroll_and_ends_after_silence():
+    detector = VoiceActivityDetector(RATE)
+    sent, ended = detector.process(quiet(1.0) + speech(0.5))
+    assert not ended
+    preroll = vad.VAD_PREROLL_MS // vad.VAD_FRAME_MS
+    # The pre-roll (which holds the first onset frames) and the rest of the speech,
+    # not the whole second of silence
+    speech_frames = 25
+    assert frames(detector, sent) == preroll + speech_frames - (vad.VAD_START_FRAMES - 1)
+
+    sent, ended = detector.process(quiet(0.2))
+    assert not ended  # shorter than VAD_END_SILENCE_MS
+    sent, ended = detector.process(quiet(0.3))
+    assert ended
+    assert detector.stats()['vad_local_endpoints'] == 1
+
+    # Silence after the endpoint is gated again
+    sent, ended = detector.process(quiet(0.5))
+    assert sent == b"" and not ended
+
+def test_short_blip_does_not_open_an_utterance():
+    detector = VoiceActivityDetector(RATE)
+    blip = speech(vad.VAD_FRAME_MS * (vad.VAD_START_FRAMES - 1) / 1000)
+    sent, ended = detector.process(quiet(0.5) + blip + quiet(0.5))
+    assert sent == b"" and not ended
+
+def test_partial_frames_are_buffered():
+    detector = VoiceActivityDetector(RATE)
+    data = quiet(0.5) + speech(0.5) + quiet(0.6)
+    sent, endpoints = [], 0
+    for i in range(0, len(data), 333):  # not a multiple of the frame size
+        chunk, ended = detector.process(data[i:i + 333])
+        sent.append(chunk)
+        endpoints += ended
+    assert endpoints == 1
+    assert len(b"".join(sent)) % detector.frame_bytes == 0
+
+def test_noise_floor_adapts_to_a_noisier_room():
+    detector = VoiceActivityDetector(RATE)
+    detector.process(quiet(0.5))
+    quiet_floor = detector.noise_floor
+    # Steady hiss a little above the learned floor is not speech, and the floor follows it
+    detector.process(pcm(3.0, 150, freq=None, seed=1))
+    assert detector.noise_floor > quiet_floor + 10
+    detector.reset()
+    sent, _ = detector.process(pcm(1.0, 150, freq=None, seed=2))
+    assert sent == b""
+    # Speech over the hiss still opens an utterance
+    sent, _ = detector.process(speech(0.5))
+    assert sent
@@ -0,0 +1,74 @@
+import time
+import threading
+
+import video_jobs
+from video_jobs import VideoJobQueue
+
+def wait_for(job, timeout=2.0):
+    deadline = time.time() + timeout
+    while job.status not in (video_jobs.DONE, video_jobs.FAILED) and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+def test_finished_job_reports_its_url_and_timings():
+    queue = VideoJobQueue(lambda audio_path: f"/videos/{audio_path}.mp4", max_workers=1)
+    job = wait_for(queue.submit("reply"))
+    data = job.to_dict()
+    assert data['status'] == video_jobs.DONE
+    assert data['video_url'] == "/videos/reply.mp4"
+    assert data['run_time'] >= 0 and data['queued_for'] >= 0
+    assert queue.get(job.id) is job
+
+def test_failed_and_raising_renders_fail_the_job():
+    queue = VideoJobQueue(lambda audio_path: None, max_workers=1)
+    assert wait_for(queue.submit("a")).to_dict()['error'] == 'Video generation failed'
+
+    def boom(audio_path):
+        raise RuntimeError("SadTalker down")
+    queue = VideoJobQueue(boom, max_workers=1)
+    job = wait_for(queue.submit("a"))
+    assert (job.status, job.error) == (video_jobs.FAILED, "SadTalker down")
+
+def test_full_queue_turns_jobs_away():
+    release = threading.Event()
+    queue = VideoJobQueue(lambda audio_path: release.wait(2) and "url", max_workers=1, max_queued=2)
+    running = queue.submit("running")
+    deadline = time.time() + 2
+    while running.status != video_jobs.RUNNING and time.time() < deadline:
+        time.sleep(0.01)
+    waiting = [queue.submit("a"), queue.submit("b")]
+    assert queue.submit("c") is None
+    assert queue.stats()['queued'] == 2
+    release.set()
+    for job in [running] + waiting:
+        assert wait_for(job).status == video_jobs.DONE
+
+def test_old_finished_jobs_are_forgotten():
+    queue = VideoJobQueue(lambda audio_path: "url", max_workers=1, keep_finished=2)
+    jobs = []
+    for name in "abcd":
+        jobs.append(wait_for(queue.submit(name)))
+    assert queue.get(jobs[0].id) is None
+    assert queue.get(jobs[-1].id) is jobs[-1]
+
+def test_deferred_job_waits_for_idle_workers():
+    release = threading.Event()
+    queue = VideoJobQueue(lambda audio_path: release.wait(2) and "url", max_workers=1)
+    running = queue.submit("running")
+    deferred = queue.submit("later", defer=True)
+    assert deferred.status == video_jobs.DEFERRED
+    release.set()
+    assert wait_for(running).status == video_jobs.DONE
+    assert wait_for(deferred).status == video_jobs.DONE
+
+def test_expired_deferred_job_fails_and_still_serialises():
+    release = threading.Event()
+    queue = VideoJobQueue(lambda audio_path: release.wait(2) and "url", max_workers=1, deferred_max_age=0)
+    running = queue.submit("running")
+    deferred = queue.submit("later", defer=True)
+    time.sleep(0.01)
+    release.set()
+    wait_for(running)
+    data = wait_for(deferred).to_dict()
+    assert (data['status'], data['error']) == (video_jobs.FAILED, 'Deferred video expired')
+    assert 'run_time' not in data and 'queued_for' not in data
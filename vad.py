@@ -0,0 +1,121 @@
+# --- vad.py: local voice-activity detection over 16-bit PCM ---
+
+import os
+from collections import deque
+import numpy as np
+
+# --- Configuration ---
+VAD_FRAME_MS = 20
+# A frame is speech when it is this far above the adaptive noise floor...
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "10"))
+# ...and louder than this absolute level (dBFS)
+VAD_MIN_DBFS = float(os.getenv("VAD_MIN_DBFS", "-50"))
+# Hiss and fricative-only noise crosses zero far more often than voiced speech
+VAD_MAX_ZCR = 0.35
+# Consecutive speech frames needed to open, and silence needed to close, an utterance
+VAD_START_FRAMES = 3
+VAD_END_SILENCE_MS = int(os.getenv("VAD_END_SILENCE_MS", "400"))
+# Audio kept from before the onset so the first syllable isn't clipped
+VAD_PREROLL_MS = 300
+# How quickly the noise floor follows the background level
+NOISE_FLOOR_ALPHA = 0.05
+
+class VoiceActivityDetector:
+    """
+    Energy + zero-crossing VAD with an adaptive noise floor.
+
+    process() takes any amount of PCM and returns the bytes worth sending
+    upstream (leading and trailing silence gated out, with a short pre-roll)
+    plus whether an utterance ended locally in this batch.
+    """
+    def __init__(self, sample_rate, frame_ms=VAD_FRAME_MS, end_silence_ms=VAD_END_SILENCE_MS):
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * 2
+        self.end_silence_frames = max(1, end_silence_ms // frame_ms)
+        self.preroll = deque(maxlen=max(1, VAD_PREROLL_MS // frame_ms))
+        self.remainder = b""
+        self.noise_floor = None
+        self.in_speech = False
+        self.speech_run = 0
+        self.silence_run = 0
+        # Stats
+        self.frames_seen = 0
+        self.frames_sent = 0
+        self.local_endpoints = 0
+
+    def reset(self):
+        """Forget the current utterance (keeps the learned noise floor)."""
+        self.remainder = b""
+        self.preroll.clear()
+        self.in_speech = False
+        self.speech_run = 0
+        self.silence_run = 0
+
+    def classify(self, pcm):
+        """Per-frame speech flags for whole frames of int16 PCM (vectorized)."""
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+        frames = samples.reshape(-1, self.frame_samples)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        dbfs = 20.0 * np.log10(rms / 32768.0 + 1e-9)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+        if self.noise_floor is None:
+            self.noise_floor = float(np.min(dbfs))
+
+        flags = np.empty(len(dbfs), dtype=bool)
+        for i, level in enumerate(dbfs):
+            loud = level > max(self.noise_floor + VAD_MARGIN_DB, VAD_MIN_DBFS)
+            # Very loud frames count even with a high ZCR (e.g. "s" in the middle of a word)
+            flags[i] = loud and (zcr[i] < VAD_MAX_ZCR or level > self.noise_floor + 2 * VAD_MARGIN_DB)
+            if not flags[i]:
+                self.noise_floor += NOISE_FLOOR_ALPHA * float(level - self.noise_floor)
+            elif level < self.noise_floor:
+                self.noise_floor = float(level)
+        return flags
+
+    def process(self, data):
+        """Returns (bytes to send, utterance_ended)."""
+        data = self.remainder + data
+        usable = len(data) - len(data) % self.frame_bytes
+        self.remainder = data[usable:]
+        if not usable:
+            return b"", False
+
+        out = []
+        ended = False
+        flags = self.classify(data[:usable])
+        self.frames_seen += len(flags)
+        for i, is_speech in enumerate(flags):
+            frame = data[i * self.frame_bytes:(i + 1) * self.frame_bytes]
+            if not self.in_speech:
+                self.speech_run = self.speech_run + 1 if is_speech else 0
+                if self.speech_run >= VAD_START_FRAMES:
+                    self.in_speech = True
+                    self.silence_run = 0
+                    out.extend(self.preroll)
+                    self.preroll.clear()
+                    out.append(frame)
+                else:
+                    self.preroll.append(frame)
+                continue
+
+            out.append(frame)  # trailing silence up to the endpoint is still sent
+            self.silence_run = 0 if is_speech else self.silence_run + 1
+            if self.silence_run >= self.end_silence_frames:
+                self.in_speech = False
+                self.speech_run = 0
+                self.local_endpoints += 1
+                ended = True
+
+        self.frames_sent += len(out)
+        return b"".join(out), ended
+
+    def stats(self):
+        return {
+            'vad_frames_seen': self.frames_seen,
+            'vad_frames_sent': self.frames_sent,
+            'vad_bandwidth_saved': round(1 - self.frames_sent / self.frames_seen, 3) if self.frames_seen else None,
+            'vad_local_endpoints': self.local_endpoints,
+            'vad_noise_floor_dbfs': round(self.noise_floor, 1) if self.noise_floor is not None else None,
+        }
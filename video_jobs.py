@@ -0,0 +1,204 @@
+# --- video_jobs.py: background queue for lip-sync video generation ---
+
+import time
+import uuid
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+# Deferred jobs still waiting after this long are dropped (the user has moved on)
+DEFERRED_MAX_AGE = 300
+
+# Job states reported by /jobs/<id>
+DEFERRED = "deferred"  # parked under load; queued once the workers are idle
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+class VideoJob:
+    def __init__(self, audio_path):
+        self.id = uuid.uuid4().hex
+        self.audio_path = audio_path
+        self.status = QUEUED
+        self.video_url = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # The submitting request's context, so spans join its trace even when run later
+        self.context = contextvars.copy_context()
+
+    def to_dict(self):
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'video_url': self.video_url,
+            'error': self.error,
+        }
+        if self.started_at:
+            data['queued_for'] = round(self.started_at - self.created_at, 1)
+        if self.started_at and self.finished_at:
+            data['run_time'] = round(self.finished_at - self.started_at, 1)
+        return data
+
+class _JobTable:
+    """Job bookkeeping shared by the thread and asyncio queues."""
+    def __init__(self, max_workers, max_queued, keep_finished, deferred_max_age=DEFERRED_MAX_AGE):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self.deferred_max_age = deferred_max_age
+        self.jobs = {}
+        self.deferred = deque()  # oldest first
+        self.lock = threading.Lock()
+
+    def _new_job(self, audio_path, defer=False):
+        """Register a job (parked if `defer`), or return None when too many are already waiting."""
+        with self.lock:
+            waiting = len(self.deferred) if defer else self._count(QUEUED)
+            if waiting >= self.max_queued:
+                print(f"   -> ⚠️  Video queue full ({self.max_queued} waiting), skipping video")
+                return None
+            job = VideoJob(audio_path)
+            self.jobs[job.id] = job
+            if defer:
+                job.status = DEFERRED
+                self.deferred.append(job)
+            self._prune()
+        print(f"   -> 🎬 Video job {job.id[:8]} {job.status}")
+        return job
+
+    def _promote_deferred(self):
+        """Deferred jobs to start now that nothing is queued and a worker is free."""
+        promoted = []
+        with self.lock:
+            while self.deferred and self._count(QUEUED) == 0 and self._count(RUNNING) < self.max_workers:
+                job = self.deferred.popleft()
+                if time.time() - job.created_at > self.deferred_max_age:
+                    self._finished(job, error='Deferred video expired')
+                    continue
+                job.status = QUEUED
+                promoted.append(job)
+        return promoted
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.max_workers,
+                'deferred': len(self.deferred),
+                'queued': self._count(QUEUED),
+                'running': self._count(RUNNING),
+                'done': self._count(DONE),
+                'failed': self._count(FAILED),
+            }
+
+    @staticmethod
+    def _started(job):
+        job.status = RUNNING
+        job.started_at = time.time()
+        metrics.record("video_queue", job.created_at, job.started_at)
+
+    @staticmethod
+    def _finished(job, video_url=None, error=None):
+        if video_url:
+            job.video_url = video_url
+            job.status = DONE
+        else:
+            job.error = error or 'Video generation failed'
+            job.status = FAILED
+        job.finished_at = time.time()
+
+    def _count(self, status):
+        return sum(1 for job in self.jobs.values() if job.status == status)
+
+    def _prune(self):
+        """Forget the oldest finished jobs so the table doesn't grow forever."""
+        finished = [job for job in self.jobs.values() if job.status in (DONE, FAILED)]
+        if len(finished) > self.keep_finished:
+            finished.sort(key=lambda job: job.finished_at)
+            for job in finished[:-self.keep_finished]:
+                del self.jobs[job.id]
+
+class VideoJobQueue(_JobTable):
+    """
+    Runs video jobs on a bounded worker pool so HTTP threads never wait on SadTalker.
+    `run_fn(audio_path)` must return the video URL, or None on failure.
+    """
+    def __init__(self, run_fn, max_workers=2, max_queued=20, keep_finished=200,
+                 deferred_max_age=DEFERRED_MAX_AGE):
+        super().__init__(max_workers, max_queued, keep_finished, deferred_max_age)
+        self.run_fn = run_fn
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="video-job")
+
+    def submit(self, audio_path, defer=False):
+        """
+        Enqueue a job and return it, or None when the queue is full. A deferred
+        job waits until the workers are idle (it may start right away).
+        """
+        job = self._new_job(audio_path, defer)
+        if job and not defer:
+            self._start(job)
+        for promoted in self._promote_deferred():
+            self._start(promoted)
+        return job
+
+    def _start(self, job):
+        # Run in the submitter's context so spans join the request's trace
+        self.executor.submit(job.context.run, self._run, job)
+
+    def _run(self, job):
+        self._started(job)
+        try:
+            self._finished(job, video_url=self.run_fn(job.audio_path))
+        except Exception as e:
+            self._finished(job, error=str(e))
+        for promoted in self._promote_deferred():
+            self._start(promoted)
+
+class AsyncVideoJobQueue(_JobTable):
+    """
+    asyncio flavour of VideoJobQueue: jobs are tasks on the running loop and a
+    semaphore (not a thread pool) bounds how many run at once.
+    `run_coro_fn(audio_path)` is a coroutine function returning the URL or None.
+    """
+    def __init__(self, run_coro_fn, max_workers=2, max_queued=20, keep_finished=200,
+                 deferred_max_age=DEFERRED_MAX_AGE):
+        super().__init__(max_workers, max_queued, keep_finished, deferred_max_age)
+        self.run_coro_fn = run_coro_fn
+        self.semaphore = None  # created on first use, inside the serving loop
+        self.tasks = set()
+
+    def submit(self, audio_path, defer=False):
+        """Enqueue a job and return it, or None when the queue is full (see VideoJobQueue.submit)."""
+        job = self._new_job(audio_path, defer)
+        if job and not defer:
+            self._start(job)
+        for promoted in self._promote_deferred():
+            self._start(promoted)
+        return job
+
+    def _start(self, job):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_workers)
+        # create_task copies the current context, so create it inside the submitter's
+        task = job.context.run(asyncio.get_running_loop().create_task, self._run(job))
+        self.tasks.add(task)  # keep a reference until it finishes
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, job):
+        async with self.semaphore:
+            self._started(job)
+            try:
+                self._finished(job, video_url=await self.run_coro_fn(job.audio_path))
+            except Exception as e:
+                self._finished(job, error=str(e))
+        for promoted in self._promote_deferred():
+            self._start(promoted)